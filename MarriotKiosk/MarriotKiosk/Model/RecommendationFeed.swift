@@ -36,6 +36,19 @@ struct RecommendationFeed: Decodable {
         let bestTime: String?
         let dressCode: String?
         let venueType: String?
+        // precomputed server-side (src/geo.py); nil when the venue isn't in the gazetteer
+        let distanceText: String?
+        let walkMinutes: Int?
+        let latitude: Double?
+        let longitude: Double?
+
+        enum CodingKeys: String, CodingKey {
+            case url, name, description, category, bestTime, dressCode, venueType
+            case distanceText = "distance_text"
+            case walkMinutes = "walk_minutes"
+            case latitude = "lat"
+            case longitude = "lon"
+        }
     }
 }
 
@@ -25,7 +25,7 @@ struct GuideCard: View {
                     .labelStyle(.titleAndIcon)
                     .font(.headline)
                 Spacer()
-                Text(resolver.distances[item.name] ?? "—")
+                Text(item.distanceText ?? resolver.distances[item.name] ?? "—")
                     .font(.caption2)
                     .foregroundStyle(.secondary)
             }
@@ -80,7 +80,10 @@ struct GuideCard: View {
         .background(.regularMaterial, in: RoundedRectangle(cornerRadius: 20))
         .shadow(radius: 5)
         .task {
-            await resolver.resolveDistance(for: item.name)
+            // only look the place up on device when the backend couldn't place it
+            if item.distanceText == nil {
+                await resolver.resolveDistance(for: item.name)
+            }
         }
     }
 
@@ -0,0 +1,6 @@
+-- fingerprint of the inputs each recommendation set was built from (see fingerprint.py),
+-- plus an index for the "latest row for this member/category/location" lookup
+ALTER TABLE recommendations ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+
+CREATE INDEX IF NOT EXISTS recommendations_latest_idx
+    ON recommendations (member_id, category, location, created_at DESC);
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import threading
+
+# Async data access over supabase's REST (PostgREST) endpoint with one pooled httpx.AsyncClient.
+# The supabase python client blocks on every .execute(), so a process serving several kiosk
+# sessions ends up queueing them behind each other's database round trips. Here every call is a
+# coroutine on a shared connection pool with keep-alive, so concurrent sessions overlap their
+# waits instead.
+#
+# run_sync() is the bridge for sync code: it runs a coroutine on one long-lived background loop,
+# so the pool (and its warm connections) survives between calls from plain scripts.
+
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))
+KEEPALIVE = int(os.getenv('DB_KEEPALIVE', '10'))
+KEEPALIVE_EXPIRY_S = float(os.getenv('DB_KEEPALIVE_EXPIRY_S', '30'))
+TIMEOUT_S = float(os.getenv('DB_TIMEOUT_S', '10'))
+
+
+class AsyncSupabase:
+    """Just enough PostgREST for members/recommendations: select, insert, upsert, delete."""
+
+    def __init__(self, url: str, key: str, pool_size: int = POOL_SIZE, keepalive: int = KEEPALIVE):
+        try:
+            import httpx  # imported on first use so importing json_supabase stays cheap
+        except ImportError:
+            raise RuntimeError("httpx is required for the async data layer (pip install httpx)")
+        self._httpx = httpx
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {'apikey': key, 'Authorization': f"Bearer {key}", 'Content-Type': 'application/json'}
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=keepalive,
+                                   keepalive_expiry=KEEPALIVE_EXPIRY_S)
+        self._clients = {}  # event loop -> pooled client (an AsyncClient can't be shared across loops)
+
+    def client(self):
+        # created on first use, inside the loop that will drive it
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            self._clients[loop] = self._httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=self.limits,
+                                                    timeout=TIMEOUT_S)
+        return self._clients[loop]
+
+    @staticmethod
+    def _params(filters=None, columns=None, order=None, desc=False, limit=None):
+        params = {}
+        if columns:
+            params['select'] = columns.replace(' ', '')
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                params[column] = f"in.({','.join(str(v) for v in value)})"
+            else:
+                params[column] = f"eq.{value}"
+        if order:
+            params['order'] = f"{order}.{'desc' if desc else 'asc'}"
+        if limit is not None:
+            params['limit'] = str(limit)
+        return params
+
+    async def select(self, table, columns='*', filters=None, order=None, desc=False, limit=None) -> list:
+        response = await self.client().get(f"/{table}", params=self._params(filters, columns, order, desc, limit))
+        response.raise_for_status()
+        return response.json()
+
+    async def insert(self, table, rows) -> list:
+        if not rows:
+            return []
+        response = await self.client().post(f"/{table}", json=rows, headers={'Prefer': 'return=representation'})
+        response.raise_for_status()
+        return response.json()
+
+    async def upsert(self, table, rows, on_conflict: str) -> list:
+        response = await self.client().post(
+            f"/{table}", json=rows, params={'on_conflict': on_conflict},
+            headers={'Prefer': 'return=representation,resolution=merge-duplicates'},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def delete(self, table, filters) -> list:
+        response = await self.client().delete(f"/{table}", params=self._params(filters),
+                                              headers={'Prefer': 'return=representation'})
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-db', daemon=True).start()
+        return _loop
+
+
+def run_sync(coro, timeout: float | None = None):
+    """Run a coroutine from sync code on the shared background loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result(timeout)
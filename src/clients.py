@@ -0,0 +1,77 @@
+import os
+import threading
+
+# Deferred construction for the heavy SDKs. Importing an agent used to import google.generativeai,
+# exa_py and supabase, read .env and configure gemini before anything ran - seconds of cold start
+# for every CLI run, worker spawn and serving process, and credentials needed just to import a
+# module. Now the SDKs are imported and the clients built the first time something actually
+# calls them.
+#
+# usage (inside an agent):
+#   load_env()
+#   self.exa = lazy(lambda: exa_client(self.exa_key))
+#   self.llm = lazy(lambda: gemini_model(self.model_name))
+
+_env_loaded = False
+_gemini_configured = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Read .env once per process (no-op if python-dotenv isn't installed)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+    _env_loaded = True
+
+
+class Lazy:
+    """Stands in for a client and builds the real one on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __bool__(self):
+        return True
+
+
+def lazy(factory) -> Lazy:
+    return Lazy(factory)
+
+
+def exa_client(api_key: str | None):
+    from exa_py import Exa
+    return Exa(api_key=api_key)
+
+
+def gemini_model(model_name: str):
+    global _gemini_configured
+    import google.generativeai as genai
+    with _lock:
+        if not _gemini_configured:
+            genai.configure(api_key=os.getenv('GEMINI_KEY'))
+            _gemini_configured = True
+    return genai.GenerativeModel(model_name)
+
+
+def supabase_client(url: str, key: str):
+    from supabase import create_client
+    return create_client(url, key)
@@ -0,0 +1,237 @@
+import argparse
+import copy
+import re
+
+from resilience import Deadline
+from rate_limiter import Quota, BACKGROUND
+from fingerprint import model_fingerprints, reusable_recommendations
+from model_router import ROUTER
+from ledger import shared_ledger
+from geo import attach_distances
+from preference_index import shared_preference_index
+
+# Preference cohorts for batch precompute. Lots of members have near-identical preferences for a
+# category (same cuisines, same dietary choice, same dining style), but each one used to trigger
+# its own search-fetch-generate cycle. Here members are turned into sparse preference feature sets,
+# clustered per location and category, and the expensive exa+gemini stage runs once per cohort.
+# Each member then gets a cheap filtering pass against their *own* hard constraints (e.g. a
+# Shellfish allergy drops the oyster bar the cohort run suggested) before their row is saved.
+# Precompute cost scales with the number of distinct tastes, not the number of guests.
+
+# identity words (venue name / type) that conflict with an allergy or diet - checked against
+# name/venue_type/category only, since descriptions often mention the allergen to say it's avoidable
+ALLERGEN_TERMS = {
+    'shellfish': ('shellfish', 'shrimp', 'lobster', 'crab', 'oyster', 'clam', 'mussel', 'scallop', 'crawfish', 'crayfish'),
+    'fish': ('fish', 'sushi', 'seafood', 'poke'),
+    'peanuts': ('peanut',),
+    'peanut': ('peanut',),
+    'dairy': ('creamery', 'cheese', 'ice cream', 'gelato', 'dairy'),
+}
+DIET_EXCLUDES = {
+    'vegan': ('steakhouse', 'bbq', 'barbecue', 'smokehouse', 'butcher', 'seafood', 'oyster', 'crab', 'creamery'),
+    'vegetarian': ('steakhouse', 'bbq', 'barbecue', 'smokehouse', 'butcher', 'seafood', 'oyster', 'crab'),
+    'pescatarian': ('steakhouse', 'bbq', 'barbecue', 'smokehouse', 'butcher'),
+}
+_IDENTITY_FIELDS = ('name', 'venue_type', 'category')
+
+# personal, not taste - never part of the cohort features or the cohort prompt
+_PERSONAL_KEYS = {'firstName'}
+
+
+def _flatten(value, path, out):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key not in _PERSONAL_KEYS:
+                _flatten(child, f"{path}.{key}" if path else key, out)
+    elif isinstance(value, (list, tuple)):
+        for child in value:
+            _flatten(child, path, out)
+    elif value not in (None, '', 'None'):
+        out.add(f"{path}={str(value).strip().lower()}")
+
+
+def preference_features(pref_args) -> frozenset:
+    """Sparse binary feature vector (as a set of 'path=value' features) for one member's category prefs."""
+    features = set()
+    for position, arg in enumerate(pref_args):
+        _flatten(arg, f"a{position}", features)
+    return frozenset(features)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class Cohort:
+    """Members of one location/category whose preferences are close enough to share a pipeline run."""
+
+    def __init__(self, leader_id, pref_args, features):
+        self.leader_id = leader_id
+        self.pref_args = pref_args
+        self.features = features
+        self.members = []  # (member_id, pref_args)
+
+    def representative_args(self):
+        # the leader's prefs minus anything personal, so the shared descriptions don't name one guest
+        args = copy.deepcopy(self.pref_args)
+        for arg in args:
+            if isinstance(arg, dict) and 'firstName' in arg:
+                arg['firstName'] = 'Guest'
+        return args
+
+
+def cluster(members, threshold: float = 0.75) -> list:
+    """
+    Greedy leader clustering: each member joins the first cohort whose leader's features are
+    at least `threshold` Jaccard-similar, otherwise starts a new cohort. members = [(id, pref_args)].
+    """
+    cohorts = []
+    for member_id, pref_args in members:
+        features = preference_features(pref_args)
+        for cohort in cohorts:
+            if _jaccard(features, cohort.features) >= threshold:
+                break
+        else:
+            cohort = Cohort(member_id, pref_args, features)
+            cohorts.append(cohort)
+        cohort.members.append((member_id, pref_args))
+    return cohorts
+
+
+def _dietary(pref_args) -> dict:
+    for arg in pref_args:
+        if isinstance(arg, dict) and isinstance(arg.get('dietaryRestrictions'), dict):
+            return arg['dietaryRestrictions']
+    return {}
+
+
+def member_filter(items, pref_args) -> list:
+    """Drop cohort items that conflict with this member's own allergies or dietary choice."""
+    restrictions = _dietary(pref_args)
+    banned = []
+    for allergy in restrictions.get('allergies') or []:
+        banned.extend(ALLERGEN_TERMS.get(str(allergy).strip().lower(), (str(allergy).strip().lower(),)))
+    banned.extend(DIET_EXCLUDES.get(str(restrictions.get('dietaryChoice', '')).strip().lower(), ()))
+    if not banned:
+        return list(items)
+    # whole words only (plurals too), so 'crab' doesn't take out Crabtree Falls or 'poke' Spokes
+    pattern = re.compile(r"\b(?:" + '|'.join(re.escape(term) for term in banned) + r")(?:e?s)?\b")
+    kept = []
+    for item in items:
+        identity = ' '.join(str(item.get(field, '')) for field in _IDENTITY_FIELDS).lower()
+        if not pattern.search(identity):
+            kept.append(item)
+    return kept
+
+
+def cohort_fingerprints(category: str, cohort_args, pref_args, location: str) -> dict:
+    """{model: fingerprint} of a cohort run's inputs as one member got them (cohort prefs + their own restrictions)."""
+    inputs = {'cohort': cohort_args, 'restrictions': _dietary(pref_args)}
+    return model_fingerprints(category, inputs, location, ROUTER.choices())
+
+
+def _member_rows(agent, member_ids=None, page: int = 500):
+    # pages of member rows - one unbounded select gets cut off at supabase's row cap
+    columns = f"member_id, {agent.member_columns}"
+    if member_ids is not None:
+        member_ids = sorted(member_ids)
+        for start in range(0, len(member_ids), page):
+            yield (agent.supabase.table('members').select(columns)
+                   .in_('member_id', member_ids[start:start + page]).execute().data or [])
+        return
+    last = ''
+    while True:
+        rows = (agent.supabase.table('members').select(columns)
+                .gt('member_id', last).order('member_id').limit(page).execute().data or [])
+        yield rows
+        if len(rows) < page:
+            return
+        last = rows[-1]['member_id']
+
+
+def run_cohorts(agent, member_ids=None, threshold: float = 0.75, max_age=None, priority=BACKGROUND, location=None,
+                where=None):
+    """
+    Precompute one agent's category for many members at one location (default: the agent's), one
+    pipeline run per cohort. `where` (a preference_index query) narrows the members first, e.g.
+    "dining.dietaryRestrictions.allergies = Shellfish AND arriving <= 7".
+    Returns {member_id: recommendations} for every member that got a row (reused or new).
+    """
+    location = location or agent.location
+    if not agent.supabase:
+        print("Supabase client not initialized")
+        return {}
+    if where is not None:
+        index = shared_preference_index()
+        if index is None:
+            print("preference index is off, can't select members by query")
+            return {}
+        if not index.universe():
+            # never built (fresh box, deleted file) - an empty index would quietly match nobody
+            print("preference index is empty, rebuilding it from supabase before selecting members")
+            index.rebuild(agent.supabase)
+        selected = index.select(where)
+        member_ids = selected if member_ids is None else selected & set(member_ids)
+        print(f"{agent.category}: {len(member_ids)} members match {where!r}")
+        if not member_ids:
+            return {}
+    rows = [row for page in _member_rows(agent, member_ids) for row in page]
+    cohorts = cluster([(row['member_id'], agent._prefs_from_row(row)) for row in rows], threshold)
+
+    results, generated = {}, 0
+    for cohort in cohorts:
+        args = cohort.representative_args()
+        pending, fingerprints = [], {}
+        for member_id, pref_args in cohort.members:
+            fingerprints[member_id] = cohort_fingerprints(agent.category, args, pref_args, location)
+            if max_age is not None:
+                # a row saved by the member's own run or by this cohort's last run both count
+                own = model_fingerprints(agent.category, pref_args, location, ROUTER.choices())
+                saved = reusable_recommendations(agent.supabase, member_id, agent.category, location,
+                                                 [*own.values(), *fingerprints[member_id].values()], max_age)
+                if saved is not None:
+                    results[member_id] = saved
+                    continue
+            pending.append((member_id, pref_args))
+        if not pending:
+            continue
+        generated += 1
+        deadline = Deadline(agent.request_budget)
+        exa_quota = Quota(key=agent.exa_key, priority=priority)
+        llm_quota = Quota(key=agent.gemini_key, priority=priority)
+        # billed as one 'cohort' run - the members it covers share its cost
+        with shared_ledger().run('cohort', agent.category, location):
+            items, model = agent._run_pipeline(args, deadline, exa_quota, llm_quota, location)
+        if not items:
+            continue
+        if agent.catalog:
+            items = agent.catalog.ingest(location, agent.category, items)
+        items = attach_distances(location, items)
+        for member_id, pref_args in pending:
+            personal = member_filter(items, pref_args)
+            if not personal:
+                continue
+            # saved under the cohort's fingerprint, not the member's: the descriptions were written
+            # for the leader's prefs, so the member's own get_recommendations(max_age=...) regenerates
+            agent._save_recommendations(member_id, personal, fingerprints[member_id][model], location)
+            results[member_id] = personal
+    print(f"{agent.category}: {len(rows)} members in {len(cohorts)} cohorts, {generated} cohorts generated")
+    return results
+
+
+if __name__ == "__main__":
+    # nightly precompute for every member at this property: python cohorts.py
+    # or just the members a preference query picks: python cohorts.py --where "arriving <= 7"
+    from dining_agent import DiningAgent
+    from attractions_agent import AttractionsAgent
+    from nightlife_agent import NightlifeAgent
+    from surprise_me_agent import SurpriseMeAgent
+
+    parser = argparse.ArgumentParser(description='precompute recommendations by cohort')
+    parser.add_argument('--where', help='preference_index query selecting the members')
+    cli = parser.parse_args()
+
+    for agent_cls in (DiningAgent, AttractionsAgent, NightlifeAgent, SurpriseMeAgent):
+        run_cohorts(agent_cls(), max_age=24 * 3600, where=cli.where)
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+from dining_agent import DiningAgent
+from attractions_agent import AttractionsAgent
+from nightlife_agent import NightlifeAgent
+from surprise_me_agent import SurpriseMeAgent
+from resilience import Deadline
+from rate_limiter import Quota, INTERACTIVE
+from structured_output import CATEGORY_FIELDS, combined_generation_config, parse_combined_recommendations
+from query_planner import plan_queries, execute_plan
+from fingerprint import model_fingerprints, reusable_recommendations, saved_recommendations
+from ledger import shared_ledger, frugal
+from singleflight import FLIGHTS
+from content_cleaner import clean_contents
+from geo import attach_distances
+from model_router import ROUTER
+
+# What each category section of the combined prompt asks for. Mirrors the instructions in each
+# agent's own _build_llm_prompt, just without repeating the profile and website text four times.
+CATEGORY_BRIEFS = {
+    'dining': "TOP 5-15 restaurant recommendations. Cite specific menu items, reviews, or atmosphere details that match their dining preferences.",
+    'attractions': "TOP 5-12 attractions: must-see landmarks, activities matching their fitness/wellness/cultural interests, a mix of indoor and outdoor. 'category' is the attraction type (e.g. \"Museum\", \"Park\"), 'best_time' is e.g. \"Morning\", \"Anytime\".",
+    'nightlife': "TOP 5-12 nightlife venues matching their dining style, alcohol and music preferences and respecting their dinner time and do-not-disturb hours. 'venue_type' e.g. \"Wine Bar\", 'best_time' e.g. \"7-9 PM\", 'dress_code' e.g. \"Smart Casual\".",
+    'surprise': "3-8 SURPRISE recommendations: hidden gems and off-the-beaten-path experiences they wouldn't think of. 'surprise_factor' is 1-10 for how unexpected it is.",
+}
+
+
+class CombinedAgent:
+    """
+    Full-feed mode: one gemini call produces dining, attractions, nightlife and surprise together.
+    Categories the local vector index covers skip exa; the rest go through the query planner
+    (merged, deduplicated, one batched fetch). The guest profile is sent once, and results are
+    saved per category through the usual agent _save_recommendations path.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.agents = {
+            agent.category: agent
+            for agent in (DiningAgent(debug), AttractionsAgent(debug), NightlifeAgent(debug), SurpriseMeAgent(debug))
+        }
+        # all four agents hold the same clients, so borrow one set of them
+        base = self.agents['dining']
+        self.exa, self.exa_key, self.supabase = base.exa, base.exa_key, base.supabase
+        self.gemini_key = base.gemini_key
+        self.location = base.location
+        self.index, self.catalog = base.index, base.catalog
+        self.request_budget = float(os.getenv('COMBINED_REQUEST_BUDGET_S', '150'))
+
+    def member_columns(self):
+        columns = []
+        for agent in self.agents.values():
+            for column in agent.member_columns.split(','):
+                if column.strip() not in columns:
+                    columns.append(column.strip())
+        return ', '.join(columns)
+
+    def get_recommendations(self, member_id, priority=INTERACTIVE, max_age=None, location=None):
+        location = location or self.location  # per-request property, see the single agents
+        deadline = Deadline(self.request_budget)
+        exa_quota = Quota(key=self.exa_key, priority=priority)
+        llm_quota = Quota(key=self.gemini_key, priority=priority)  # the router fills in the model it picks
+
+        if not self.supabase:
+            print("Supabase client not initialized")
+            return {}
+
+        try:
+            response = self.supabase.table('members').select(self.member_columns()).eq('member_id', member_id).execute()
+            if not response.data:
+                print(f"No member found with ID: {member_id}")
+                return {}
+            user_data = response.data[0]
+        except Exception as e:
+            print(f"Error fetching user data: {e}")
+            return {}
+
+        # with max_age set, categories whose inputs haven't changed are served from their saved rows
+        fingerprints, reused = {}, {}
+        for category, agent in self.agents.items():
+            fingerprints[category] = model_fingerprints(category, agent._prefs_from_row(user_data), location, ROUTER.choices())
+            if max_age is not None:
+                saved = reusable_recommendations(self.supabase, member_id, category, location, fingerprints[category].values(), max_age)
+                if saved is not None:
+                    print(f"inputs unchanged since last run, reusing saved {category} recommendations")
+                    reused[category] = saved
+        if len(reused) == len(self.agents):
+            return reused
+
+        # over today's spend budget (ledger.py): every category's last saved list, if they all have one
+        over = shared_ledger().over_budget(member_id, 'combined')
+        if over:
+            feed = dict(reused)
+            for category in self.agents:
+                if category not in feed:
+                    feed[category] = saved_recommendations(self.supabase, member_id, category, location)
+            if all(feed.values()):
+                print(f"{over}, serving saved recommendations for every category")
+                return feed
+            print(f"{over}, generating on the cheap path")
+
+        # a second tap (or kiosk) for the same member coalesces onto the run already in flight
+        started = time.time()
+        return FLIGHTS.do(
+            (member_id, 'combined', location),
+            lambda: self._generate(member_id, user_data, fingerprints, reused, deadline, exa_quota, llm_quota, location),
+            follower=lambda: self._saved_feed(member_id, fingerprints, reused, time.time() - started + 60, location),
+        )
+
+    def _saved_feed(self, member_id, fingerprints, reused, max_age, location):
+        # what another process's combined run just saved, or None if any category is missing
+        feed = dict(reused)
+        for category in self.agents:
+            if category in feed:
+                continue
+            saved = reusable_recommendations(self.supabase, member_id, category, location, fingerprints[category].values(), max_age)
+            if saved is None:
+                return None
+            feed[category] = saved
+        return feed
+
+    def _generate(self, member_id, user_data, fingerprints, reused, deadline, exa_quota, llm_quota, location):
+        # every exa/gemini call in here is billed to one ledger run (tokens, pages, cost)
+        with shared_ledger().run(member_id, 'combined', location):
+            # 1+2. plan: collect every category's query, merge near-duplicates, search, then fetch
+            # the union of result ids in one batch and route each page back to its categories
+            category_queries = {}
+            for category, agent in self.agents.items():
+                if category in reused:
+                    continue
+                category_queries[category] = agent._build_search_query(*agent._prefs_from_row(user_data), location=location)
+                print(f"{category} query: {category_queries[category]}")
+
+            # categories the local index already covers skip exa; only the rest get planned searches
+            contents, routes = [], {}
+            for category, query in list(category_queries.items()):
+                indexed = self.index.retrieve(query, location, category=category) if self.index else []
+                if not indexed:
+                    continue
+                print(f"using {len(indexed)} indexed pages for {category}")
+                del category_queries[category]
+                for page in indexed:
+                    if page.id not in routes:
+                        contents.append(page)
+                    routes.setdefault(page.id, []).append(category)
+
+            if category_queries and frugal():
+                print(f"{frugal()}, skipping live exa search for {', '.join(category_queries)}")
+            elif category_queries:
+                plan = plan_queries(category_queries, location)
+                try:
+                    fetched, fetched_routes, stats = execute_plan(self.exa, plan, deadline=deadline, quota=exa_quota, debug=self.debug)
+                except Exception as e:
+                    print(f"exa content fetch failed: {e}")
+                    fetched, fetched_routes, stats = [], {}, None
+                if stats:
+                    print(f"{stats['searches']} searches found {stats['unique_ids']} distinct pages across categories")
+                if fetched and self.index:
+                    try:
+                        self.index.add_pages(location, fetched, categories=fetched_routes)
+                    except Exception as e:
+                        print(f"couldn't index fetched pages: {e}")
+                indexed_urls = {page.url for page in contents}
+                for content in fetched:
+                    if content.url in indexed_urls:
+                        # already in the prompt from the index - just widen its category tags
+                        tags = routes[content.url]
+                        tags.extend(c for c in fetched_routes.get(content.id, []) if c not in tags)
+                        continue
+                    contents.append(content)
+                    routes[content.id] = fetched_routes.get(content.id, [])
+            if not contents:
+                return reused
+
+            # one cleaning pass over the whole batch, so a blurb repeated across categories' pages goes in once
+            contents, _ = clean_contents(contents, debug=self.debug)
+            if not contents:
+                return reused
+
+            # 3. one generation for every category
+            categories = [c for c in self.agents if c not in reused and any(c in cats for cats in routes.values())]
+            print(f"concierge evaluating {', '.join(categories)} in one pass...")
+            prompt = self._build_llm_prompt(contents, user_data, routes, categories, location)
+
+            try:
+                # usually over the router's large-prompt threshold, so this normally goes to pro
+                text, model = ROUTER.generate('combined', prompt, combined_generation_config(categories), deadline, llm_quota,
+                                       validate=lambda t: any(parse_combined_recommendations(t, categories).values()))
+                if self.debug:
+                    print(f"--- raw gemini output ---\n{text}\n--------------------")
+                results = parse_combined_recommendations(text, categories, debug=self.debug)
+            except Exception as e:
+                print(f"no results")
+                if self.debug:
+                    print(f"    err: {e}")
+                return reused
+
+            # 4. split and save through each category's normal save path
+            for category, recommendations in results.items():
+                if self.catalog:
+                    recommendations = results[category] = self.catalog.ingest(location, category, recommendations)
+                recommendations = results[category] = attach_distances(location, recommendations)
+                self.agents[category]._save_recommendations(member_id, recommendations, fingerprints[category][model], location)
+            return {**reused, **results}
+
+    def _build_llm_prompt(self, contents, user_data, routes, categories, location=None):
+        # profile goes in once, as the raw preference columns every category needs
+        profile = {k: v for k, v in user_data.items() if v}
+        prompt = f"""
+        You are a helpful hotel concierge in {location or self.location} preparing a full set of personalized recommendations for a guest.
+
+        Guest profile (all preference data on file): {json.dumps(profile)}
+
+        Based *only* on the website content below, produce recommendations for each of these categories: {', '.join(categories)}.
+        """
+        for category in categories:
+            fields = ', '.join(f'"{name}"' for name in CATEGORY_FIELDS[category])
+            prompt += f"\n        - {category}: {CATEGORY_BRIEFS[category]} Each item has keys {fields}; 'description' is 3-4 sentences tailored to the guest and 'url' is the source website."
+
+        prompt += """
+
+        Your response MUST be a single JSON object with one key per category above, each holding a JSON array of items. A page may be useful for more than one category.
+
+        Here is the content from the websites (each labelled with the categories it is relevant to):
+        """
+
+        # contents are already deduplicated by the query planner
+        for content in contents:
+            tags = ', '.join(routes.get(content.id, categories))
+            prompt += f"\n\n--- Website Content from {content.url} (relevant to: {tags}) ---\n"
+            prompt += content.text or ''
+
+        prompt += "\n\n--- End of Website Content ---"
+        prompt += "\nNow, generate the JSON object as instructed, with a variety of distinct options in every category."
+        return prompt
+
+
+if __name__ == "__main__":
+    agent = CombinedAgent(debug=False)
+    test_member_id = "MB789456123"  # From your user_preferences.json
+
+    feed = agent.get_recommendations(test_member_id)
+
+    if feed:
+        for category, recs in feed.items():
+            print(f"\n{category.upper()} ({len(recs)})")
+            for i, r in enumerate(recs, 1):
+                print(f"{i}. {r.get('name', 'N/A')}")
+                print(f"   {r.get('url', 'N/A')}")
+    else:
+        print("no results")
@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import os
+import re
+import zlib
+
+# Cleaning pass for fetched page text before it goes into a gemini prompt. exa get_contents hands
+# back whole pages: nav menus, cookie banners, "sign in / write a review" chrome, and the same
+# review snippet or venue blurb repeated across TripAdvisor, restaurantji, yelp and the venue's
+# own site. All of that used to be pasted into the prompt verbatim. Three stages, all pure python
+# and linear in the text size so it runs on every request:
+#   1. boilerplate - drop lines that are site chrome (banners, nav, link-only, tiny fragments)
+#   2. exact dups  - drop paragraphs already seen on the same page (normalized hash)
+#   3. near dups   - drop paragraphs whose word shingles overlap an earlier one anywhere in the
+#                    batch (bottom-k minhash), which also catches blurbs copied verbatim across sites
+#
+# usage:
+#   contents, stats = clean_contents(contents)
+#   stats -> {'in': bytes, 'boilerplate': bytes left, 'exact': ..., 'near': ..., 'pages': n}
+
+SHINGLE_WORDS = 4
+SKETCH_SIZE = 32          # bottom-k minhash sketch size per paragraph
+NEAR_DUP_THRESHOLD = float(os.getenv('CLEAN_NEAR_DUP_THRESHOLD', '0.7'))
+MIN_NEAR_DUP_WORDS = 12   # shorter paragraphs only get the exact check
+CANDIDATE_BANDS = 4       # a paragraph is compared with earlier ones sharing one of its 4 smallest hashes
+
+_BOILERPLATE = re.compile(
+    r"(cookie|cookies|privacy policy|terms of (use|service)|all rights reserved|©|copyright \d{4}|"
+    r"sign in|log in|sign up|create an account|subscribe|newsletter|skip to (main )?content|"
+    r"accept all|manage preferences|javascript|enable js|download the app|write a review|"
+    r"report (this|a) (review|problem)|see all photos|claim this (listing|business)|back to top|"
+    r"share on (facebook|twitter|x)|follow us)",
+    re.IGNORECASE,
+)
+_LINK_ONLY = re.compile(r"^\W*(\[[^\]]*\]\([^)]*\)\W*)+$")    # markdown link/nav rows
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_URL = re.compile(r"https?://\S+")
+_WORD = re.compile(r"[a-z0-9']+")
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_HEADING = re.compile(r"^#{1,6}\s+\S")
+# short title-case lines are usually a venue name on a listing page - except these site-menu labels
+_NAV_LABELS = {
+    'home', 'menu', 'menus', 'about', 'about us', 'contact', 'contact us', 'reservations', 'book now', 'order online',
+    'order now', 'gallery', 'photos', 'events', 'careers', 'jobs', 'locations', 'hours', 'directions', 'search', 'more',
+    'reviews', 'overview', 'share', 'save', 'next', 'previous', 'read more', 'see more', 'gift cards', 'catering',
+}
+
+
+def _is_name_line(line: str, words: list) -> bool:
+    # "## Ocean Samurai" or "Zeppoli's" on its own line is the venue the prompt is about
+    if _HEADING.match(line):
+        return True
+    if not words or ' '.join(words) in _NAV_LABELS:
+        return False
+    return all(token[:1].isupper() for token in re.findall(r"[A-Za-z][\w'&.-]*", line))
+
+
+def strip_boilerplate(text: str) -> str:
+    """Drop site-chrome lines; keeps anything that reads like actual content."""
+    kept = []
+    for line in text.splitlines():
+        line = _IMAGE.sub('', line).strip()
+        if not line:
+            kept.append('')
+            continue
+        if _LINK_ONLY.match(line):
+            continue
+        words = _WORD.findall(_URL.sub('', line.lower()))
+        if len(words) <= 2 and not re.search(r"\d", line) and not _is_name_line(line, words):
+            continue  # menu items / breadcrumbs / button labels ("Home", "Menu", "Book now")
+        if len(words) < 12 and _BOILERPLATE.search(line):
+            continue  # short line that is mostly a banner or call to action
+        kept.append(line)
+    return re.sub(r"\n{3,}", "\n\n", '\n'.join(kept)).strip()
+
+
+def _normalized(paragraph: str) -> str:
+    return ' '.join(_WORD.findall(paragraph.lower()))
+
+
+def sketch(words: list, k: int = SKETCH_SIZE) -> list:
+    """Bottom-k minhash: the k smallest shingle hashes, sorted. One hash per shingle, no permutations."""
+    if len(words) < SHINGLE_WORDS:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return sorted(zlib.crc32(s.encode('utf8')) for s in shingles)[:k]
+
+
+def estimate_jaccard(a: list, b: list, k: int = SKETCH_SIZE) -> float:
+    # bottom-k of the union, and how many of those are in both sketches
+    union = sorted(set(a) | set(b))[:k]
+    if not union:
+        return 0.0
+    sa, sb = set(a), set(b)
+    return sum(1 for h in union if h in sa and h in sb) / len(union)
+
+
+class _Deduper:
+    """Exact repeats within a page, near repeats across the whole batch."""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.exact = set()
+        self.sketches = []
+        self.buckets = {}  # hash -> [sketch index]
+
+    def new_page(self):
+        # exact repeats only count within one page: "Open daily 11am-9pm" on two sites is two
+        # venues' hours, not a duplicate. repeated blurbs across sites are the near-dup check's job
+        self.exact = set()
+
+    def is_exact_dup(self, normalized: str) -> bool:
+        digest = hashlib.blake2b(normalized.encode('utf8'), digest_size=8).digest()
+        if digest in self.exact:
+            return True
+        self.exact.add(digest)
+        return False
+
+    def is_near_dup(self, words: list) -> bool:
+        sig = sketch(words)
+        candidates = {i for h in sig[:CANDIDATE_BANDS] for i in self.buckets.get(h, ())}
+        if any(estimate_jaccard(sig, self.sketches[i]) >= self.threshold for i in candidates):
+            return True
+        index = len(self.sketches)
+        self.sketches.append(sig)
+        for h in sig[:CANDIDATE_BANDS]:
+            self.buckets.setdefault(h, []).append(index)
+        return False
+
+
+def clean_contents(contents, threshold: float = NEAR_DUP_THRESHOLD, debug: bool = False):
+    """
+    Cleaned copies of contents (same objects' attributes, new text) plus bytes-in/out per stage.
+    Pages that end up empty are dropped; the originals (which may be cached) are never modified.
+    """
+    stats = {'pages': 0, 'in': 0, 'boilerplate': 0, 'exact': 0, 'near': 0}
+    deduper = _Deduper(threshold)
+    cleaned = []
+    for content in contents:
+        text = getattr(content, 'text', None) or ''
+        stats['in'] += len(text.encode('utf8'))
+
+        stripped = strip_boilerplate(text)
+        stats['boilerplate'] += len(stripped.encode('utf8'))
+        deduper.new_page()
+
+        after_exact, after_near = [], []
+        for paragraph in _PARAGRAPH_SPLIT.split(stripped):
+            normalized = _normalized(paragraph)
+            if not normalized or deduper.is_exact_dup(normalized):
+                continue
+            after_exact.append(paragraph)
+            words = normalized.split()
+            if len(words) >= MIN_NEAR_DUP_WORDS and deduper.is_near_dup(words):
+                continue
+            after_near.append(paragraph)
+        stats['exact'] += len('\n\n'.join(after_exact).encode('utf8'))
+        text_out = '\n\n'.join(after_near)
+        stats['near'] += len(text_out.encode('utf8'))
+
+        if not text_out:
+            continue
+        page = copy.copy(content)
+        try:
+            page.text = text_out
+        except AttributeError:
+            page = content  # read-only result type - keep it as fetched rather than lose the page
+        cleaned.append(page)
+    stats['pages'] = len(cleaned)
+
+    if stats['in']:
+        print(f"cleaned {len(cleaned)} pages: {stats['in'] / 1024:.1f}KB -> {stats['near'] / 1024:.1f}KB "
+              f"({100 * stats['near'] / stats['in']:.0f}%)")
+        if debug:
+            print(f"    boilerplate {stats['boilerplate']}B, exact dedup {stats['exact']}B, near dedup {stats['near']}B")
+    return cleaned, stats
@@ -1,6 +1,8 @@
 # client.py
 import base64
+import json
 import os
+import time
 import requests
 
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
@@ -43,8 +45,8 @@ server_pub_pem = base64.b64decode(server_pub_pem_b64)
 from cryptography.hazmat.primitives import serialization
 server_pub = serialization.load_pem_public_key(server_pub_pem)
 
-# 4) Prepare prompt and hybrid-encrypt it
-prompt = "Hello LLM from Python client. Please summarize this."
+# 4) Prepare the request (which member, which category) and hybrid-encrypt it
+prompt = json.dumps({"member_id": "MB789456123", "category": "dining"})
 # 4a) ephemeral AES key
 aes_key = AESGCM.generate_key(bit_length=256)  # bytes
 aesgcm = AESGCM(aes_key)
@@ -64,8 +66,14 @@ payload = {
     "ciphertext_b64": base64.b64encode(ciphertext).decode()
 }
 
-# 5) Send to server
-r = requests.post(f"{SERVER}/send", json=payload)
+# 5) Send to server. 429 = gateway full, 503 = still generating: wait as told and resend
+for attempt in range(5):
+    r = requests.post(f"{SERVER}/send", json=payload)
+    if r.status_code not in (429, 503):
+        break
+    wait = float(r.headers.get("Retry-After", "2"))
+    print(f"Server said {r.status_code} ({r.json().get('detail')}), retrying in {wait:.0f}s")
+    time.sleep(wait)
 r.raise_for_status()
 j = r.json()
 print("Server returned:", j.keys())
@@ -83,8 +91,7 @@ resp_aes_key = user_priv.decrypt(
 
 aesgcm_resp = AESGCM(resp_aes_key)
 plaintext = aesgcm_resp.decrypt(resp_iv, resp_ct, associated_data=None)
-<<<<<<< HEAD
-print("LLM reply:", plaintext.decode("utf8"))
-=======
-print("LLM reply:", plaintext.decode("utf8"))
->>>>>>> adc1b0126e9876ddeaf4e8e752515a3d07d6fb3e
+result = json.loads(plaintext.decode("utf8"))
+print(f"Recommendations ({result['source']}, stale={result['stale']}):")
+for i, item in enumerate(result["recommendations"], 1):
+    print(f"{i}. {item.get('name')}  {item.get('distance_text', '')}")
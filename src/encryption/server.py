@@ -1,13 +1,21 @@
 # server.py
+import asyncio
 import base64
+import json
 import os
+import sys
 from typing import Dict
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+
+# the agents live one level up in src/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gateway import GATEWAY, Saturated, BadRequest, parse_request, recommend, GATEWAY_TIMEOUT_S, RETRY_AFTER_S
 
 # ========== Configuration / Key management ==========
 SERVER_PRIV_PATH = "server_priv.pem"
@@ -71,67 +79,94 @@ def upload_user_public_key(payload: UploadUserKey):
     user_public_keys[payload.user_id] = pem_bytes
     return {"ok": True}
 
+def decrypt_request(payload: SendPayload) -> str:
+    # 1) decrypt AES key with server private key (RSA-OAEP SHA256)
+    enc_key = base64.b64decode(payload.encrypted_key_b64)
+    aes_key = SERVER_PRIVATE_KEY.decrypt(
+        enc_key,
+        padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+    )
+    if len(aes_key) not in (16, 24, 32):
+        # Expect AES key length (we use 32 for AES-256)
+        raise ValueError("unexpected AES key length")
+
+    # 2) decrypt ciphertext using AES-GCM
+    iv = base64.b64decode(payload.iv_b64)
+    ct = base64.b64decode(payload.ciphertext_b64)
+    aesgcm = AESGCM(aes_key)
+    # AESGCM expects tag appended to ciphertext (cryptography does this convention)
+    plaintext = aesgcm.decrypt(iv, ct, associated_data=None)
+    return plaintext.decode("utf8")
+
+def encrypt_response(user_id: str, message: str) -> dict:
+    # Encrypt response to user's public key using hybrid scheme
+    user_pub = serialization.load_pem_public_key(user_public_keys[user_id])
+
+    # ephemeral AES key + IV
+    response_aes_key = AESGCM.generate_key(bit_length=256)  # 32 bytes
+    response_iv = os.urandom(12)
+    aesgcm_resp = AESGCM(response_aes_key)
+    resp_ct = aesgcm_resp.encrypt(response_iv, message.encode("utf8"), associated_data=None)
+    # encrypt AES key with user's RSA public key (OAEP SHA-256)
+    enc_resp_key = user_pub.encrypt(
+        response_aes_key,
+        padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+    )
+
+    # Return base64-encoded pieces
+    return {
+        "encrypted_key_b64": base64.b64encode(enc_resp_key).decode(),
+        "iv_b64": base64.b64encode(response_iv).decode(),
+        "ciphertext_b64": base64.b64encode(resp_ct).decode()
+    }
+
+def handle_send(payload: SendPayload) -> dict:
+    # runs on a gateway worker: decrypt, serve the recommendations, encrypt the result
+    try:
+        request = parse_request(decrypt_request(payload))
+    except (BadRequest, InvalidTag, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Bad encrypted request: {e}")
+    print(f"Received request: {request['category']} for {request['member_id']}")
+
+    result = recommend(request)
+    if result["source"] == "pending":
+        # nothing stored yet and no time (or capacity) to generate now - it's queued, come back shortly
+        raise HTTPException(status_code=503, detail="Recommendations are being generated",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    return encrypt_response(payload.user_id, json.dumps(result))
+
 @app.post("/send")
-def receive_encrypted(payload: SendPayload):
+async def receive_encrypted(payload: SendPayload):
     if payload.user_id not in user_public_keys:
         raise HTTPException(status_code=400, detail="User public key not registered on server")
 
+    # decrypting and serving both block, so they go to the bounded gateway pool. a full pool is a
+    # 429 right away, never another thread parked on the box
     try:
-        # 1) decrypt AES key with server private key (RSA-OAEP SHA256)
-        enc_key = base64.b64decode(payload.encrypted_key_b64)
-        aes_key = SERVER_PRIVATE_KEY.decrypt(
-            enc_key,
-            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
-        )
-        if len(aes_key) not in (16, 24, 32):
-            # Expect AES key length (we use 32 for AES-256)
-            raise ValueError("unexpected AES key length")
-
-        # 2) decrypt ciphertext using AES-GCM
-        iv = base64.b64decode(payload.iv_b64)
-        ct = base64.b64decode(payload.ciphertext_b64)
-        aesgcm = AESGCM(aes_key)
-        # AESGCM expects tag appended to ciphertext (cryptography does this convention)
-        plaintext = aesgcm.decrypt(iv, ct, associated_data=None)
-        client_prompt = plaintext.decode("utf8")
-        print("Received prompt (preview):", client_prompt[:200])
-
-        # 3) (Simulate) call LLM -> produce response
-        llm_response = fake_llm_response(client_prompt)
-
-        # 4) Encrypt response to user's public key using hybrid scheme
-        user_pub_pem = user_public_keys[payload.user_id]
-        user_pub = serialization.load_pem_public_key(user_pub_pem)
-
-        # 4a) ephemeral AES key + IV
-        response_aes_key = AESGCM.generate_key(bit_length=256)  # 32 bytes
-        response_iv = os.urandom(12)
-        aesgcm_resp = AESGCM(response_aes_key)
-        resp_ct = aesgcm_resp.encrypt(response_iv, llm_response.encode("utf8"), associated_data=None)
-        # 4b) encrypt AES key with user's RSA public key (OAEP SHA-256)
-        enc_resp_key = user_pub.encrypt(
-            response_aes_key,
-            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
-        )
-
-        # Return base64-encoded pieces
-        return {
-            "encrypted_key_b64": base64.b64encode(enc_resp_key).decode(),
-            "iv_b64": base64.b64encode(response_iv).decode(),
-            "ciphertext_b64": base64.b64encode(resp_ct).decode()
-        }
-
+        future = GATEWAY.submit(handle_send, payload)
+    except Saturated:
+        raise HTTPException(status_code=429, detail="Server busy, retry shortly",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=GATEWAY_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Timed out waiting for recommendations",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def fake_llm_response(prompt: str) -> str:
-    # Replace this with your real LLM code (calls to OpenAI, llama, etc.)
-    return f"LLM reply (simulated): echo -> {prompt}"
+# pool depth and rejection counts are for whoever runs the box, not for clients - there's no
+# envelope to authenticate a GET with, so only answer requests from the machine itself
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+@app.get("/gateway-stats")
+def gateway_stats(request: Request):
+    if request.client is None or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="gateway stats are only served to localhost")
+    return GATEWAY.stats()
 
 if __name__ == "__main__":
     import uvicorn
-<<<<<<< HEAD
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
-=======
     uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
->>>>>>> adc1b0126e9876ddeaf4e8e752515a3d07d6fb3e
@@ -0,0 +1,91 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+
+# Change detection for recommendation runs. Every saved recommendations row carries a fingerprint
+# of the inputs that produced it: the category's preference projection (exactly what the agent
+# reads via _prefs_from_row), the location, the model and CONTENT_VERSION. A caller that passes
+# max_age to get_recommendations gets the stored row back instead of a fresh exa+gemini run when
+# the fingerprint still matches and the row is younger than max_age. The model is the one the
+# router actually answered with, so a row from either of its current models counts as a match
+# (model_fingerprints), and changing GEMINI_FAST_MODEL / GEMINI_PRO_MODEL invalidates old rows.
+
+# bump whenever prompts, schemas or the retrieval pipeline change in a way that should invalidate
+# every stored recommendation
+CONTENT_VERSION = '1'
+
+
+def preference_fingerprint(category: str, pref_args, location: str, model: str) -> str:
+    """Stable hash of everything that drives one category's recommendations for one member."""
+    payload = {
+        'category': category,
+        'prefs': pref_args,
+        'location': location,
+        'model': model,
+        'version': CONTENT_VERSION,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf8')).hexdigest()[:32]
+
+
+def model_fingerprints(category: str, pref_args, location: str, models) -> dict:
+    """{model: fingerprint} for every model the router may answer with."""
+    return {model: preference_fingerprint(category, pref_args, location, model) for model in models}
+
+
+def parse_timestamp(value) -> datetime | None:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def age_seconds(row: dict) -> float | None:
+    created = parse_timestamp(row.get('created_at'))
+    return (datetime.now(timezone.utc) - created).total_seconds() if created else None
+
+
+def latest_row(supabase, member_id: str, category: str, location: str) -> dict | None:
+    """Newest recommendations row for (member, category, location), or None."""
+    response = (supabase.table('recommendations')
+                .select('id, description, fingerprint, created_at')
+                .eq('member_id', member_id).eq('category', category).eq('location', location)
+                .order('created_at', desc=True).limit(1).execute())
+    return response.data[0] if response.data else None
+
+
+def reusable_recommendations(supabase, member_id: str, category: str, location: str, fingerprint,
+                             max_age: float) -> list | None:
+    """
+    The stored recommendations if the latest row was built from the same inputs and is younger
+    than max_age seconds; None means the caller should regenerate. fingerprint is one fingerprint
+    or several acceptable ones (e.g. model_fingerprints(...).values()).
+    """
+    accepted = {fingerprint} if isinstance(fingerprint, str) else set(fingerprint)
+    try:
+        row = latest_row(supabase, member_id, category, location)
+    except Exception as e:
+        print(f"Error checking saved recommendations: {e}")
+        return None
+    if not row or row.get('fingerprint') not in accepted or not row.get('description'):
+        return None
+    age = age_seconds(row)
+    if age is None or age > max_age:
+        return None
+    return row['description']
+
+
+def saved_recommendations(supabase, member_id: str, category: str, location: str) -> list | None:
+    """The latest stored recommendations whatever inputs or age they have (the over-budget fallback)."""
+    try:
+        row = latest_row(supabase, member_id, category, location)
+    except Exception as e:
+        print(f"Error checking saved recommendations: {e}")
+        return None
+    return row['description'] if row and row.get('description') else None
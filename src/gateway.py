@@ -0,0 +1,115 @@
+import importlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from serving import serve, backlog, SERVE_SLO_S
+
+# Admission control between the encrypted /send endpoint (encryption/server.py) and the agents.
+# Each decrypted request ({"member_id": ..., "category": ...}) runs on a fixed worker pool with a
+# bounded number of waiting slots. When every slot is taken the request is refused right away
+# (the server turns that into a 429 with Retry-After) instead of piling more blocking work onto
+# the box. Requests are answered through serving.serve, so a stored row comes back immediately.
+# Only cache misses run the pipeline live, and only while the live backlog is short. Past that
+# a miss is queued as a refresh and reported as pending (503 + Retry-After).
+#
+# usage:
+#   future = GATEWAY.submit(handle, payload)   # raises Saturated when full
+#   result = recommend(parse_request(plaintext))
+
+GATEWAY_WORKERS = int(os.getenv('GATEWAY_WORKERS', '8'))
+GATEWAY_MAX_QUEUE = int(os.getenv('GATEWAY_MAX_QUEUE', '32'))               # waiting requests beyond the workers
+GATEWAY_TIMEOUT_S = float(os.getenv('GATEWAY_TIMEOUT_S', str(SERVE_SLO_S + 4)))
+MAX_LIVE_BACKLOG = int(os.getenv('GATEWAY_MAX_LIVE_BACKLOG', '16'))         # live runs before misses go cache-only
+RETRY_AFTER_S = int(os.getenv('GATEWAY_RETRY_AFTER_S', '2'))
+
+# category -> (module, class), imported on first use so the server starts without the agent sdks
+AGENT_CLASSES = {
+    'dining': ('dining_agent', 'DiningAgent'),
+    'attractions': ('attractions_agent', 'AttractionsAgent'),
+    'nightlife': ('nightlife_agent', 'NightlifeAgent'),
+    'surprise': ('surprise_me_agent', 'SurpriseMeAgent'),
+}
+
+
+class Saturated(Exception):
+    """Raised by Gateway.submit when every worker and waiting slot is taken."""
+
+
+class BadRequest(ValueError):
+    """The decrypted request isn't a {member_id, category} object we can serve."""
+
+
+class Gateway:
+    """Fixed worker pool with a hard cap on in-flight + waiting requests."""
+
+    def __init__(self, workers: int = GATEWAY_WORKERS, max_queue: int = GATEWAY_MAX_QUEUE):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gateway')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {'admitted': 0, 'rejected': 0}
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counts['rejected'] += 1
+            raise Saturated(f"gateway full ({self.capacity} requests in flight)")
+        with self._lock:
+            self.counts['admitted'] += 1
+            self.in_flight += 1
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': self.in_flight, 'waiting': max(0, self.in_flight - self.workers),
+                    'capacity': self.capacity, **self.counts, 'serving': backlog()}
+
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def agent_for(category: str):
+    """One shared agent per category (their sdk clients are lazy and thread-safe to share)."""
+    with _agents_lock:
+        if category not in _agents:
+            module, name = AGENT_CLASSES[category]
+            _agents[category] = getattr(importlib.import_module(module), name)()
+        return _agents[category]
+
+
+def parse_request(plaintext: str) -> dict:
+    try:
+        request = json.loads(plaintext)
+    except ValueError:
+        raise BadRequest('expected a json request like {"member_id": "...", "category": "dining"}')
+    if not isinstance(request, dict) or not request.get('member_id'):
+        raise BadRequest("request needs a member_id")
+    if request.get('category') not in AGENT_CLASSES:
+        raise BadRequest(f"category must be one of {', '.join(AGENT_CLASSES)}")
+    return request
+
+
+def recommend(request: dict) -> dict:
+    """serve() result for one parsed request; misses only run live while the live backlog is short."""
+    agent = agent_for(request['category'])
+    slo_s = SERVE_SLO_S if backlog()['live'] < MAX_LIVE_BACKLOG else 0
+    return serve(agent, request['member_id'], slo_s=slo_s, location=request.get('location'))
+
+
+GATEWAY = Gateway()
@@ -0,0 +1,307 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from venue_catalog import name_key, same_venue, names_agree, own_domain
+
+# Coordinates and distances for recommended venues, so the kiosk doesn't have to run an
+# MKLocalSearch per card (PlaceDistanceResolver.swift) just to print "0.4 mi". Venue coordinates
+# come from a local gazetteer (sqlite, loaded with `python geo.py --import places.json`), matched
+# by official domain or fuzzy name the same way the venue catalog dedups. Each property gets an
+# in-memory grid index over its places for radius / nearest queries, and every saved
+# recommendation gets lat/lon, distance from the property and a walking-time bucket.
+#
+# usage:
+#   items = attach_distances(location, items)   # adds lat, lon, distance_m, distance_text, walk_minutes, walk_bucket
+#                                               # and puts the closest walk buckets first
+#   shared_gazetteer().nearby(location, 800)    # places within 800m of the property, nearest first
+
+GEO_DB = os.getenv('GEO_DB', 'geo.sqlite')
+MAX_DISTANCE_M = float(os.getenv('GEO_MAX_DISTANCE_KM', '0')) * 1000  # 0 = keep everything
+CELL_M = 250.0
+
+# where each property is; more can be added with `python geo.py --property "City, ST" lat lon`
+PROPERTY_COORDS = {
+    'Blacksburg, VA': (37.19928, -80.40117),
+}
+
+WALK_M_PER_MIN = 80.0   # ~4.8 km/h
+DETOUR = 1.3            # streets aren't straight lines
+WALK_BUCKETS = ((5, 'under 5 min walk'), (15, '5-15 min walk'), (30, '15-30 min walk'))
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def walk_minutes(distance_m: float) -> int:
+    return max(1, round(distance_m * DETOUR / WALK_M_PER_MIN))
+
+
+def walk_bucket(minutes: int) -> str:
+    for limit, label in WALK_BUCKETS:
+        if minutes < limit:
+            return label
+    return 'drive'
+
+
+def distance_text(distance_m: float) -> str:
+    # same shape as MKDistanceFormatter with imperial units
+    feet = distance_m * 3.28084
+    if feet < 1000:
+        return f"{int(round(feet, -1))} ft"
+    miles = distance_m / 1609.344
+    return f"{miles:.1f} mi" if miles < 10 else f"{miles:.0f} mi"
+
+
+class GridIndex:
+    """Uniform lat/lon grid around one property (cells about cell_m wide) for radius and nearest queries."""
+
+    def __init__(self, origin, cell_m: float = CELL_M):
+        self.cell_m = cell_m
+        self.lat_step = cell_m / 111320.0
+        self.lon_step = cell_m / (111320.0 * max(math.cos(math.radians(origin[0])), 0.01))
+        self.cells = {}  # (row, col) -> [(lat, lon, payload)]
+        self.size = 0
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.lat_step), math.floor(lon / self.lon_step))
+
+    def add(self, lat, lon, payload):
+        self.cells.setdefault(self._cell(lat, lon), []).append((lat, lon, payload))
+        self.size += 1
+
+    def within(self, lat, lon, radius_m: float) -> list:
+        """[(distance_m, payload)] within radius_m, nearest first."""
+        row, col = self._cell(lat, lon)
+        reach = math.ceil(radius_m / self.cell_m)
+        found = []
+        for r in range(row - reach, row + reach + 1):
+            for c in range(col - reach, col + reach + 1):
+                for plat, plon, payload in self.cells.get((r, c), ()):
+                    d = haversine_m(lat, lon, plat, plon)
+                    if d <= radius_m:
+                        found.append((d, payload))
+        found.sort(key=lambda hit: hit[0])
+        return found
+
+    def nearest(self, lat, lon, k: int = 5, max_radius_m: float = 20000) -> list:
+        # widen the search square until it holds k points (or we give up at max_radius_m)
+        radius = self.cell_m
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= max_radius_m or len(found) == self.size:
+                return found[:k]
+            radius *= 2
+
+
+class Gazetteer:
+    """Local place coordinates per location, plus each property's own position."""
+
+    def __init__(self, path: str = GEO_DB):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._indexes = {}   # location -> GridIndex
+        self._lists = {}     # location -> [place dict]
+        self._resolved = {}  # (location, name, url) -> place dict or None
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS places (
+                id INTEGER PRIMARY KEY,
+                location TEXT NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                domain TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                source TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS places_location ON places (location, name_key);
+            CREATE TABLE IF NOT EXISTS properties (
+                location TEXT PRIMARY KEY,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def property_coords(self, location: str):
+        row = self._conn().execute("SELECT lat, lon FROM properties WHERE location = ?", (location,)).fetchone()
+        return (row['lat'], row['lon']) if row else PROPERTY_COORDS.get(location)
+
+    def set_property(self, location: str, lat: float, lon: float):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO properties (location, lat, lon) VALUES (?, ?, ?)", (location, lat, lon))
+        self._invalidate(location)
+
+    def add_places(self, location: str, places, source: str = 'import') -> int:
+        """Insert or update places ({name, lat, lon, url?}); returns how many were stored."""
+        stored = 0
+        now = time.time()
+        with self._conn() as conn:
+            for place in places:
+                try:
+                    lat, lon = float(place['lat']), float(place['lon'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                key = name_key(place['name'])
+                domain = own_domain(place['name'], place.get('url'))
+                # a place is its name plus its own site: two Starbucks with different pages are two places,
+                # but a re-import that now knows the site updates the row that didn't
+                row = conn.execute("SELECT id FROM places WHERE location = ? AND name_key = ? AND (domain IS ? OR domain IS NULL)"
+                                   " ORDER BY domain IS NULL LIMIT 1", (location, key, domain)).fetchone()
+                if row:
+                    conn.execute("UPDATE places SET lat = ?, lon = ?, domain = COALESCE(?, domain), source = ?, updated_at = ?"
+                                 " WHERE id = ?", (lat, lon, domain, source, now, row['id']))
+                else:
+                    conn.execute("INSERT INTO places (location, name, name_key, domain, lat, lon, source, updated_at)"
+                                 " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (location, place['name'], key, domain, lat, lon, source, now))
+                stored += 1
+        self._invalidate(location)
+        return stored
+
+    def _invalidate(self, location):
+        with self._lock:
+            self._indexes.pop(location, None)
+            self._lists.pop(location, None)
+            self._resolved = {k: v for k, v in self._resolved.items() if k[0] != location}
+
+    def _places(self, location):
+        with self._lock:
+            places = self._lists.get(location)
+        if places is None:
+            places = [dict(row) for row in self._conn().execute("SELECT * FROM places WHERE location = ?", (location,))]
+            with self._lock:
+                self._lists[location] = places
+        return places
+
+    def index(self, location: str) -> GridIndex | None:
+        """Grid over this location's places, built once and kept until the places change."""
+        with self._lock:
+            grid = self._indexes.get(location)
+        if grid is not None:
+            return grid
+        origin = self.property_coords(location)
+        if origin is None:
+            return None
+        grid = GridIndex(origin)
+        for place in self._places(location):
+            grid.add(place['lat'], place['lon'], place)
+        with self._lock:
+            self._indexes[location] = grid
+        return grid
+
+    def nearby(self, location: str, radius_m: float, lat=None, lon=None) -> list:
+        """[(distance_m, place)] within radius_m of (lat, lon), default the property itself."""
+        grid = self.index(location)
+        origin = (lat, lon) if lat is not None else self.property_coords(location)
+        return grid.within(origin[0], origin[1], radius_m) if grid and origin else []
+
+    def lookup(self, location: str, name: str, url: str | None = None) -> dict | None:
+        """Gazetteer place for a recommended venue: its own site's domain first, then fuzzy name."""
+        cache_key = (location, name, url)
+        with self._lock:
+            if cache_key in self._resolved:
+                return self._resolved[cache_key]
+        key = name_key(name)
+        domain = own_domain(name, url)
+        match = None
+        for place in self._places(location):
+            if domain and place['domain'] == domain and names_agree(key, place['name_key'], location):
+                match = place
+                break
+            if match is None and same_venue(key, place['name_key'], location):
+                match = place
+        with self._lock:
+            self._resolved[cache_key] = match  # misses too, so an unknown venue is one scan per process
+        return match
+
+
+def attach_distances(location: str, items: list, max_distance_m: float = MAX_DISTANCE_M, gazetteer=None) -> list:
+    """
+    Copies of items with lat/lon, distance_m, distance_text, walk_minutes and walk_bucket for every
+    venue the gazetteer knows, nearest walk bucket first (see by_proximity). Venues farther than
+    max_distance_m (if set) are dropped; venues without coordinates are kept, after the located ones.
+    """
+    gazetteer = gazetteer or shared_gazetteer()
+    if gazetteer is None or not items:
+        return items
+    try:
+        origin = gazetteer.property_coords(location)
+        if origin is None:
+            return items
+        located = []
+        for item in items:
+            place = gazetteer.lookup(location, item.get('name', ''), item.get('url'))
+            if place is None:
+                located.append(item)
+                continue
+            distance = haversine_m(origin[0], origin[1], place['lat'], place['lon'])
+            if max_distance_m and distance > max_distance_m:
+                continue
+            minutes = walk_minutes(distance)
+            located.append({**item, 'lat': place['lat'], 'lon': place['lon'], 'distance_m': round(distance),
+                            'distance_text': distance_text(distance), 'walk_minutes': minutes,
+                            'walk_bucket': walk_bucket(minutes)})
+    except sqlite3.Error as e:
+        # distances are a nicety - a broken gazetteer never costs us the recommendations
+        print(f"couldn't attach distances: {e}")
+        return items
+    return by_proximity(located)
+
+
+def by_proximity(items: list) -> list:
+    # ordered by walk bucket, not raw meters - within a bucket the model's ranking still decides
+    rank = {label: position for position, (_, label) in enumerate(WALK_BUCKETS)}
+    rank['drive'] = len(WALK_BUCKETS)
+    return sorted(items, key=lambda item: rank.get(item.get('walk_bucket'), len(rank)))
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_gazetteer():
+    """Process-wide gazetteer, or None with GEO=off."""
+    global _shared
+    if os.getenv('GEO', 'on').lower() == 'off':
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = Gazetteer()
+        return _shared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='local gazetteer for venue distances')
+    parser.add_argument('--location', default=os.getenv('LOCATION', 'Blacksburg, VA'))
+    parser.add_argument('--import', dest='import_path', help='json list of {name, lat, lon, url?} for --location')
+    parser.add_argument('--property', nargs=2, type=float, metavar=('LAT', 'LON'), help="set --location's coordinates")
+    parser.add_argument('--near', type=float, metavar='METERS', help='list places within METERS of the property')
+    cli = parser.parse_args()
+
+    gazetteer = Gazetteer()
+    if cli.property:
+        gazetteer.set_property(cli.location, *cli.property)
+    if cli.import_path:
+        with open(cli.import_path) as f:
+            print(f"stored {gazetteer.add_places(cli.location, json.load(f))} places for {cli.location}")
+    if cli.near:
+        for distance, place in gazetteer.nearby(cli.location, cli.near):
+            print(f"{distance_text(distance):>8}  {walk_bucket(walk_minutes(distance)):<16}  {place['name']}")
@@ -0,0 +1,253 @@
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from clients import load_env, supabase_client
+from storage import storage_client
+from fingerprint import parse_timestamp
+from venue_catalog import name_key, domain_of
+
+# Incremental export of recommendation history to partitioned parquet, for analytics that
+# shouldn't scan the production recommendations table (which venues keep coming back, category
+# volume, per-property load). Each run pulls only rows with an id past the saved watermark, a
+# page at a time, flattens every row's description array into one row per venue, and writes
+# one file per (day, category) partition:
+#   history/venues/day=2025-10-12/category=dining/part-000000123.parquet  (named by the page's first id)
+# Queries then run locally on the files through pyarrow.dataset with partition pruning.
+#
+# pyarrow is only needed here (pip install pyarrow), nothing on the agent path imports it.
+#   python history_export.py                      # export whatever is new
+#   python history_export.py --report venues      # most recommended venues, last 30 days
+
+EXPORT_DIR = os.getenv('HISTORY_EXPORT_DIR', 'history')
+EXPORT_FORMAT = os.getenv('HISTORY_EXPORT_FORMAT', 'parquet')  # or 'arrow' (feather/ipc files)
+PAGE_SIZE = int(os.getenv('HISTORY_EXPORT_PAGE', '500'))
+
+# source columns pulled from supabase, and the flat per-venue columns written out
+SOURCE_COLUMNS = 'id, member_id, category, location, description, fingerprint, created_at'
+ITEM_FIELDS = ('venue_type', 'best_time', 'dress_code', 'surprise_factor', 'distance_m', 'walk_minutes')
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('run_id', pa.int64()),
+        ('member_id', pa.string()),
+        ('category', pa.string()),
+        ('location', pa.string()),
+        ('day', pa.string()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+        ('fingerprint', pa.string()),
+        ('position', pa.int32()),
+        ('run_size', pa.int32()),
+        ('name', pa.string()),
+        ('venue_key', pa.string()),
+        ('url', pa.string()),
+        ('domain', pa.string()),
+        ('item_category', pa.string()),
+        ('venue_type', pa.string()),
+        ('best_time', pa.string()),
+        ('dress_code', pa.string()),
+        ('surprise_factor', pa.int32()),
+        ('distance_m', pa.float64()),
+        ('walk_minutes', pa.int32()),
+    ])
+
+
+def _number(value, kind):
+    try:
+        return kind(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten(row: dict) -> list:
+    """One dict per venue in a recommendations row (rows whose description isn't a list give nothing)."""
+    items = row.get('description')
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        return []
+    created = parse_timestamp(row.get('created_at')) or datetime.now(timezone.utc)
+    flat = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('name'):
+            continue
+        flat.append({
+            'run_id': int(row['id']),
+            'member_id': row.get('member_id'),
+            'category': row.get('category'),
+            'location': row.get('location'),
+            'day': created.strftime('%Y-%m-%d'),
+            'created_at': created,
+            'fingerprint': row.get('fingerprint'),
+            'position': position,
+            'run_size': len(items),
+            'name': item['name'],
+            'venue_key': name_key(item['name']),
+            'url': item.get('url'),
+            'domain': domain_of(item.get('url')),
+            'item_category': item.get('category'),
+            'venue_type': item.get('venue_type'),
+            'best_time': item.get('best_time'),
+            'dress_code': item.get('dress_code'),
+            'surprise_factor': _number(item.get('surprise_factor'), int),
+            'distance_m': _number(item.get('distance_m'), float),
+            'walk_minutes': _number(item.get('walk_minutes'), int),
+        })
+    return flat
+
+
+class HistoryExporter:
+    """Watermarked, idempotent export of recommendations rows into partitioned columnar files."""
+
+    def __init__(self, supabase, out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT):
+        if fmt not in ('parquet', 'arrow'):
+            raise ValueError(f"unknown export format: {fmt}")
+        self.supabase = supabase
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.venues_dir = os.path.join(out_dir, 'venues')
+        self.state_path = os.path.join(out_dir, '_watermark.json')
+
+    def watermark(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'last_id': 0, 'last_created_at': None, 'rows': 0, 'venues': 0}
+
+    def _save_watermark(self, state: dict):
+        # write-then-rename so a crash never leaves a half-written watermark
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _page(self, after_id: int) -> list:
+        response = (self.supabase.table('recommendations').select(SOURCE_COLUMNS)
+                    .gt('id', after_id).order('id').limit(PAGE_SIZE).execute())
+        return response.data or []
+
+    def _write(self, flat: list, first_id: int) -> int:
+        import pyarrow as pa
+
+        # a page re-exported after a crash starts at the same id but may have grown (or cover fewer
+        # partitions), so drop whatever an earlier attempt wrote for it before writing it again
+        for stale in glob.glob(os.path.join(self.venues_dir, 'day=*', 'category=*', f"part-{first_id:09d}[.-]*")):
+            os.remove(stale)
+        partitions = {}
+        for venue in flat:
+            partitions.setdefault((venue['day'], venue['category']), []).append(venue)
+        for (day, category), venues in partitions.items():
+            folder = os.path.join(self.venues_dir, f"day={day}", f"category={category}")
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"part-{first_id:09d}.{self.fmt}")
+            table = pa.Table.from_pylist(venues, schema=_schema()).drop_columns(['day', 'category'])
+            tmp = path + '.tmp'
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                pq.write_table(table, tmp, compression='zstd')
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, tmp, compression='zstd')
+            os.replace(tmp, path)
+        return len(partitions)
+
+    def export(self, max_pages: int | None = None) -> dict:
+        """Pull and write everything past the watermark; returns the updated watermark."""
+        os.makedirs(self.venues_dir, exist_ok=True)
+        state = self.watermark()
+        pages = files = 0
+        started = time.time()
+        while max_pages is None or pages < max_pages:
+            rows = self._page(state['last_id'])
+            if not rows:
+                break
+            flat = [venue for row in rows for venue in flatten(row)]
+            first_id, last_id = int(rows[0]['id']), int(rows[-1]['id'])
+            if flat:
+                files += self._write(flat, first_id)
+            state = {
+                'last_id': last_id,
+                'last_created_at': rows[-1].get('created_at') or state['last_created_at'],
+                'rows': state['rows'] + len(rows),
+                'venues': state['venues'] + len(flat),
+            }
+            self._save_watermark(state)
+            pages += 1
+            if len(rows) < PAGE_SIZE:
+                break
+        print(f"exported {pages} pages into {files} files in {time.time() - started:.1f}s, watermark at id {state['last_id']}")
+        return state
+
+
+def dataset(out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT):
+    """pyarrow dataset over the exported files, with day/category as hive partitions."""
+    import pyarrow.dataset as ds
+    return ds.dataset(os.path.join(out_dir, 'venues'), format='parquet' if fmt == 'parquet' else 'ipc',
+                      partitioning='hive')
+
+
+def load(days: int | None = None, category: str | None = None, location: str | None = None, columns=None,
+         out_dir: str = EXPORT_DIR):
+    """Venue rows as an arrow table; day and category filters only open the matching partitions."""
+    import pyarrow.dataset as ds
+    expr = None
+    if days is not None:
+        since = datetime.fromtimestamp(time.time() - days * 86400, timezone.utc).strftime('%Y-%m-%d')
+        expr = ds.field('day') >= since
+    for name, value in (('category', category), ('location', location)):
+        if value is not None:
+            clause = ds.field(name) == value
+            expr = clause if expr is None else expr & clause
+    return dataset(out_dir).to_table(columns=columns, filter=expr)
+
+
+def top_venues(n: int = 20, **filters) -> list:
+    """Most often recommended venues: (location, category, venue_key) -> times recommended, members, best rank."""
+    table = load(columns=['location', 'category', 'venue_key', 'name', 'member_id', 'position'], **filters)
+    grouped = table.group_by(['location', 'category', 'venue_key']).aggregate([
+        ([], 'count_all'), ('member_id', 'count_distinct'), ('position', 'min'), ('name', 'max')])
+    return sorted(grouped.to_pylist(), key=lambda r: r['count_all'], reverse=True)[:n]
+
+
+def volume(by: str = 'category', **filters) -> list:
+    """Runs and venue rows per `by` (category, location or day)."""
+    table = load(columns=[by, 'run_id'] if by != 'day' else ['day', 'run_id'], **filters)
+    grouped = table.group_by([by]).aggregate([('run_id', 'count_distinct'), ([], 'count_all')])
+    return sorted(grouped.to_pylist(), key=lambda r: r[by])
+
+
+def source_client():
+    """Where history is read from: EXPORT_SUPABASE_URL (e.g. a read replica) or the primary, unmirrored."""
+    load_env()
+    if os.getenv('STORAGE_BACKEND', 'supabase').lower() == 'fake':
+        return storage_client(None, None)
+    url = os.getenv('EXPORT_SUPABASE_URL') or os.getenv('SUPABASE_URL')
+    return supabase_client(url, os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='export recommendation history to columnar files')
+    parser.add_argument('--report', choices=['venues', 'categories', 'locations', 'days'])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--location')
+    cli = parser.parse_args()
+
+    if cli.report is None:
+        HistoryExporter(source_client()).export()
+    elif cli.report == 'venues':
+        for row in top_venues(days=cli.days, location=cli.location):
+            print(f"{row['count_all']:>5}x  {row['member_id_count_distinct']:>4} members  best #{row['position_min'] + 1:<3} "
+                  f"{row['category']:<12} {row['name_max']}  ({row['location']})")
+    else:
+        by = {'categories': 'category', 'locations': 'location', 'days': 'day'}[cli.report]
+        for row in volume(by, days=cli.days, location=cli.location):
+            print(f"{row[by]:<30} {row['run_id_count_distinct']:>6} runs  {row['count_all']:>7} venues")
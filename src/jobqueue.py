@@ -0,0 +1,303 @@
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+from rate_limiter import INTERACTIVE, BACKGROUND, PRIORITIES
+
+# Durable job queue for recommendation generation, backed by a local sqlite file (no broker).
+# The kiosk (or a batch script) enqueues a job and returns right away; worker processes lease
+# jobs, run the agent and ack them. A leased job that isn't acked before its visibility timeout
+# (worker crashed, box rebooted) becomes visible again, failed jobs are retried with backoff, and
+# a job that keeps failing - bad gemini json every time, upstream down for hours - ends up in the
+# dead letter state instead of looping forever. More throughput = start more workers, on this box
+# or any box that can see the same file.
+#
+# usage:
+#   queue = JobQueue()
+#   queue.enqueue('recommendations', {'member_id': 'MB789456123', 'category': 'dining'})
+#   python jobqueue.py --concurrency 4       # worker processes
+
+QUEUE_DB = os.getenv('JOB_QUEUE_DB', 'jobs.sqlite')
+VISIBILITY_S = float(os.getenv('JOB_VISIBILITY_S', '300'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '4'))
+RETRY_BASE_S = float(os.getenv('JOB_RETRY_BASE_S', '30'))
+
+QUEUED, LEASED, DONE, DEAD = 'queued', 'leased', 'done', 'dead'
+
+
+class JobFailed(Exception):
+    """Raised by a job handler; retryable=False sends the job straight to the dead letters."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Job:
+    def __init__(self, row):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'])
+        self.priority = row['priority']
+        self.attempts = row['attempts']
+        self.max_attempts = row['max_attempts']
+        self.lease_owner = row['lease_owner']
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class JobQueue:
+    """enqueue -> lease -> ack / fail, with visibility timeouts, retry backoff and dead letters."""
+
+    def __init__(self, path: str = QUEUE_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, available_at);
+            CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: dict, priority=BACKGROUND, delay: float = 0, max_attempts: int = MAX_ATTEMPTS,
+                dedupe_key: str | None = None) -> int:
+        """Add a job (or return the id of the identical job that's already waiting/running)."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key:
+                row = conn.execute("SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)",
+                                   (dedupe_key, QUEUED, LEASED)).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row['id']
+            job_id = conn.execute(
+                "INSERT INTO jobs (kind, payload, dedupe_key, priority, status, max_attempts, available_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), dedupe_key, PRIORITIES[priority], QUEUED, max_attempts, now + delay, now, now),
+            ).lastrowid
+            conn.execute("COMMIT")
+            return job_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def lease(self, owner: str, visibility_s: float = VISIBILITY_S, kinds=None) -> Job | None:
+        """Claim the next ready job for visibility_s seconds, or None if nothing is ready."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # leases that ran out belong to workers that died mid-job. if that was the job's last
+            # attempt it's the job killing workers, so dead-letter it instead of handing it out again
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = 'lease expired on final attempt', updated_at = ?"
+                " WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (DEAD, now, LEASED, now),
+            )
+            query = ("SELECT * FROM jobs WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?))")
+            params = [QUEUED, now, LEASED, now]
+            if kinds:
+                query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+                params.extend(kinds)
+            row = conn.execute(query + " ORDER BY priority, available_at, id LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                (LEASED, owner, now + visibility_s, now, row['id']),
+            )
+            leased = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute("COMMIT")
+            return Job(leased)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def extend(self, job: Job, visibility_s: float = VISIBILITY_S) -> bool:
+        """Heartbeat for long jobs; False means the lease was lost to another worker."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+            (time.time() + visibility_s, time.time(), job.id, job.lease_owner, LEASED),
+        )
+        return cur.rowcount == 1
+
+    def ack(self, job: Job) -> bool:
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = ?, lease_expires = NULL, last_error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+            (DONE, time.time(), job.id, job.lease_owner, LEASED),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job: Job, error: str, retryable: bool = True) -> str:
+        """Put a failed job back with backoff, or dead-letter it. Returns the new status."""
+        now = time.time()
+        if not retryable or job.attempts >= job.max_attempts:
+            status, available_at = DEAD, now
+        else:
+            # exponential backoff with jitter so a burst of failures doesn't retry in lockstep
+            status, available_at = QUEUED, now + RETRY_BASE_S * (2 ** (job.attempts - 1)) * random.uniform(0.8, 1.2)
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?"
+            " WHERE id = ? AND lease_owner = ?",
+            (status, available_at, str(error)[:2000], now, job.id, job.lease_owner),
+        )
+        return status
+
+    def dead_letters(self, limit: int = 50) -> list:
+        rows = self._conn().execute("SELECT * FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?", (DEAD, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue(self, job_id: int) -> bool:
+        """Give a dead-lettered job a fresh set of attempts (after fixing whatever killed it)."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, last_error = NULL, updated_at = ? WHERE id = ? AND status = ?",
+            (QUEUED, time.time(), time.time(), job_id, DEAD),
+        )
+        return cur.rowcount == 1
+
+    def stats(self) -> dict:
+        return {row['status']: row['n'] for row in self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+    def purge_done(self, older_than_s: float = 7 * 86400) -> int:
+        return self._conn().execute("DELETE FROM jobs WHERE status = ? AND updated_at < ?",
+                                    (DONE, time.time() - older_than_s)).rowcount
+
+
+def enqueue_recommendations(queue: JobQueue, member_id: str, category: str, priority=BACKGROUND, max_age=None,
+                            location: str | None = None) -> int:
+    """Queue one member/category(/location) run; a run already waiting for the same key is reused."""
+    return queue.enqueue('recommendations', {'member_id': member_id, 'category': category, 'max_age': max_age, 'location': location},
+                         priority=priority, dedupe_key=f"recommendations|{member_id}|{category}|{location or ''}")
+
+
+# --- worker side ---
+
+_agents = {}
+
+
+def _agent_for(category):
+    # agents are imported lazily so enqueueing (kiosk side) never pulls in exa/gemini/supabase
+    if category not in _agents:
+        if category == 'dining':
+            from dining_agent import DiningAgent as agent_cls
+        elif category == 'attractions':
+            from attractions_agent import AttractionsAgent as agent_cls
+        elif category == 'nightlife':
+            from nightlife_agent import NightlifeAgent as agent_cls
+        elif category == 'surprise':
+            from surprise_me_agent import SurpriseMeAgent as agent_cls
+        elif category == 'combined':
+            from combined_agent import CombinedAgent as agent_cls
+        else:
+            raise JobFailed(f"unknown category {category!r}", retryable=False)
+        _agents[category] = agent_cls()
+    return _agents[category]
+
+
+def handle(job: Job):
+    payload = job.payload
+    priority = INTERACTIVE if job.priority == PRIORITIES[INTERACTIVE] else BACKGROUND
+    if job.kind == 'recommendations':
+        agent = _agent_for(payload['category'])
+        recs = agent.get_recommendations(payload['member_id'], priority=priority, max_age=payload.get('max_age'),
+                                         location=payload.get('location'))
+        if not recs:
+            # the agents swallow upstream errors and unparseable gemini output and return []
+            raise JobFailed(f"no {payload['category']} recommendations generated for {payload['member_id']}")
+    elif job.kind == 'cohorts':
+        from cohorts import run_cohorts
+        run_cohorts(_agent_for(payload['category']), payload.get('member_ids'), max_age=payload.get('max_age'), priority=priority,
+                    location=payload.get('location'), where=payload.get('where'))
+    else:
+        raise JobFailed(f"unknown job kind {job.kind!r}", retryable=False)
+
+
+def _heartbeat(queue, job, stop):
+    while not stop.wait(VISIBILITY_S / 3):
+        if not queue.extend(job):
+            return
+
+
+def work(path: str = QUEUE_DB, poll_s: float = 1.0, kinds=None, max_jobs: int | None = None):
+    """Single worker loop: lease, run, ack/fail. Runs until max_jobs are processed (or forever)."""
+    queue = JobQueue(path)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = queue.lease(owner, kinds=kinds)
+        if job is None:
+            time.sleep(poll_s)
+            continue
+        processed += 1
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(queue, job, stop), daemon=True).start()
+        try:
+            handle(job)
+            queue.ack(job)
+            print(f"{owner} finished {job}")
+        except JobFailed as e:
+            print(f"{owner} {job} -> {queue.fail(job, str(e), retryable=e.retryable)}: {e}")
+        except Exception as e:
+            print(f"{owner} {job} -> {queue.fail(job, repr(e))}: {e}")
+        finally:
+            stop.set()
+
+
+def run_workers(concurrency: int = 2, path: str = QUEUE_DB, kinds=None):
+    """Start `concurrency` worker processes and wait on them (one core each)."""
+    processes = [multiprocessing.Process(target=work, args=(path,), kwargs={'kinds': kinds}, daemon=False)
+                 for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="recommendation job workers")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('JOB_WORKERS', '2')))
+    parser.add_argument('--db', default=QUEUE_DB)
+    parser.add_argument('--kinds', nargs='*', default=None)
+    parser.add_argument('--dead', action='store_true', help="list dead-lettered jobs and exit")
+    args = parser.parse_args()
+
+    if args.dead:
+        for job in JobQueue(args.db).dead_letters():
+            print(f"{job['id']} {job['kind']} {job['payload']} after {job['attempts']} attempts: {job['last_error']}")
+    else:
+        run_workers(args.concurrency, args.db, args.kinds)
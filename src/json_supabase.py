@@ -1,9 +1,28 @@
-import os, datetime
-from supabase import create_client, Client
+import os, asyncio, datetime
+from async_db import AsyncSupabase, run_sync
+from storage import shared_mirror
+from preference_index import index_member
 
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-SUPABASE_KEY = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-sb: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# async data access (pooled httpx client, see async_db.py). the plain upsert_member / get_member /
+# save_recommendations / latest_recommendations are sync shims for the existing scripts; anything
+# serving several kiosk sessions from one process should await the *_async versions instead.
+
+_db = None
+
+def db() -> AsyncSupabase:
+    global _db
+    if _db is None:
+        _db = AsyncSupabase(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+    return _db
+
+def _mirror(table: str, rows: list):
+    # keep the local read mirror (storage.py) in step with what we just wrote
+    mirror = shared_mirror()
+    if mirror is not None and rows:
+        try:
+            mirror.apply(table, rows)
+        except Exception as e:
+            print(f"mirror write failed for {table}: {e}")
 
 def to_date(s: str | None) -> str | None:
     if not s:
@@ -11,11 +30,11 @@ def to_date(s: str | None) -> str | None:
     # Accept "YYYY-MM-DD"
     return s
 
-def upsert_member(payload: dict):
+def member_row(payload: dict) -> dict:
     acc = payload["accountInfo"]
     person = payload["personalInfo"]
 
-    member_row = {
+    return {
         "member_id":           acc["memberId"],
         "username":            acc.get("username"),
         "email":               acc.get("email"),
@@ -43,35 +62,24 @@ def upsert_member(payload: dict):
         "technology_preferences":    payload.get("technologyPreferences"),
     }
 
-    # Upsert members
-    sb.table("members").upsert(member_row, on_conflict="member_id").execute()
-
-    member_id = acc["memberId"]
-
-    # Refresh child tables: simple approach = delete + insert (idempotent for demos)
-    sb.table("travel_companions").delete().eq("member_id", member_id).execute()
-    for c in payload.get("travelCompanions", {}).get("frequentCompanions", []):
-        sb.table("travel_companions").insert({
+def child_rows(payload: dict) -> dict:
+    member_id = payload["accountInfo"]["memberId"]
+    return {
+        "travel_companions": [{
             "member_id": member_id,
             "name": c.get("name"),
             "relationship": c.get("relationship"),
             "companion_member_id": c.get("memberId"),
-        }).execute()
-
-    sb.table("recent_stays").delete().eq("member_id", member_id).execute()
-    for s in payload.get("recentStays", []):
-        sb.table("recent_stays").insert({
+        } for c in payload.get("travelCompanions", {}).get("frequentCompanions", [])],
+        "recent_stays": [{
             "member_id": member_id,
             "property": s.get("property"),
             "check_in": to_date(s.get("checkIn")),
             "check_out": to_date(s.get("checkOut")),
             "room_type": s.get("roomType"),
             "rating": s.get("rating"),
-        }).execute()
-
-    sb.table("upcoming_reservations").delete().eq("member_id", member_id).execute()
-    for r in payload.get("upcomingReservations", []):
-        sb.table("upcoming_reservations").insert({
+        } for s in payload.get("recentStays", [])],
+        "upcoming_reservations": [{
             "member_id": member_id,
             "confirmation_number": r.get("confirmationNumber"),
             "property": r.get("property"),
@@ -79,17 +87,71 @@ def upsert_member(payload: dict):
             "check_out": to_date(r.get("checkOut")),
             "room_type": r.get("roomType"),
             "special_requests": r.get("specialRequests"),
-        }).execute()
+        } for r in payload.get("upcomingReservations", [])],
+    }
 
-def get_member(member_id: str) -> dict:
-    # Join with child tables for a hydrated view
-    member = sb.table("members").select("*").eq("member_id", member_id).single().execute().data
-    companions = sb.table("travel_companions").select("*").eq("member_id", member_id).execute().data
-    stays = sb.table("recent_stays").select("*").eq("member_id", member_id).order("check_in", desc=True).execute().data
-    upcoming = sb.table("upcoming_reservations").select("*").eq("member_id", member_id).order("check_in").execute().data
+async def _replace_children(table: str, member_id: str, rows: list):
+    # Refresh child tables: simple approach = delete + insert (idempotent for demos), one bulk insert per table
+    await db().delete(table, {"member_id": member_id})
+    await db().insert(table, rows)
+
+async def upsert_member_async(payload: dict):
+    member_id = payload["accountInfo"]["memberId"]
+    saved = await db().upsert("members", [member_row(payload)], on_conflict="member_id")
+    _mirror("members", saved)
+    # the three child tables are independent, so refresh them concurrently
+    children = child_rows(payload)
+    await asyncio.gather(*(_replace_children(table, member_id, rows) for table, rows in children.items()))
+    # and the local preference index used for targeting (preference_index.py)
+    index_member(member_row(payload), children["upcoming_reservations"])
+
+async def get_member_async(member_id: str) -> dict:
+    # Join with child tables for a hydrated view (four reads in flight at once)
+    members, companions, stays, upcoming = await asyncio.gather(
+        db().select("members", filters={"member_id": member_id}),
+        db().select("travel_companions", filters={"member_id": member_id}),
+        db().select("recent_stays", filters={"member_id": member_id}, order="check_in", desc=True),
+        db().select("upcoming_reservations", filters={"member_id": member_id}, order="check_in"),
+    )
+    if len(members) != 1:
+        raise LookupError(f"expected one member {member_id}, got {len(members)}")
     return {
-        "member": member,
+        "member": members[0],
         "companions": companions,
         "recentStays": stays,
         "upcomingReservations": upcoming
     }
+
+async def save_recommendations_async(member_id: str, category: str, location: str, recommendations: list,
+                                     fingerprint: str | None = None) -> dict | None:
+    if not recommendations:
+        return None
+    saved = await db().insert("recommendations", [{
+        "member_id": member_id,
+        "category": category,
+        "location": location,
+        "description": recommendations,
+        "fingerprint": fingerprint,
+    }])
+    _mirror("recommendations", saved)
+    return saved[0] if saved else None
+
+async def latest_recommendations_async(member_id: str, category: str, location: str) -> dict | None:
+    rows = await db().select("recommendations", columns="id, description, fingerprint, created_at",
+                             filters={"member_id": member_id, "category": category, "location": location},
+                             order="created_at", desc=True, limit=1)
+    return rows[0] if rows else None
+
+# --- sync shims (existing scripts keep calling these) ---
+
+def upsert_member(payload: dict):
+    return run_sync(upsert_member_async(payload))
+
+def get_member(member_id: str) -> dict:
+    return run_sync(get_member_async(member_id))
+
+def save_recommendations(member_id: str, category: str, location: str, recommendations: list, fingerprint: str | None = None):
+    return run_sync(save_recommendations_async(member_id, category, location, recommendations, fingerprint))
+
+def latest_recommendations(member_id: str, category: str, location: str):
+    return run_sync(latest_recommendations_async(member_id, category, location))
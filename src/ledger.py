@@ -0,0 +1,284 @@
+import argparse
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Token / call / cost ledger. Every pipeline run (one agent generation, one combined feed, one
+# cohort, one catalog refresh) gets a row in a local sqlite file: gemini tokens in and out, exa
+# searches and page fetches, bytes, latency, the model(s) used and an estimated cost. Spend is
+# capped per member per day, per category per day and per member+category per day. A run that
+# starts over any budget is marked frugal: the agents serve the saved list if there is one, skip
+# live exa (catalog / local index / caches only) and the router sticks to the fast model.
+#
+# charges are picked up automatically by resilient_call for whatever run is active in the
+# current thread, so the pipeline code only has to open the run. every attempt the provider
+# bills is charged - retries and hedged duplicates too, even one that finishes after the run
+# is written (its row is updated):
+#   with shared_ledger().run(member_id, 'dining', location):
+#       ...
+#   python ledger.py --by category --days 7
+
+LEDGER_DB = os.getenv('LEDGER_DB', 'ledger.sqlite')
+
+# USD per 1M tokens (input, output) and per exa request / page - estimates, override per deploy
+MODEL_PRICES = {
+    'gemini-pro-latest': (float(os.getenv('PRICE_PRO_IN', '1.25')), float(os.getenv('PRICE_PRO_OUT', '10.0'))),
+    os.getenv('GEMINI_FAST_MODEL', 'gemini-flash-latest'): (float(os.getenv('PRICE_FAST_IN', '0.30')),
+                                                             float(os.getenv('PRICE_FAST_OUT', '2.50'))),
+}
+EXA_SEARCH_USD = float(os.getenv('PRICE_EXA_SEARCH', '0.005'))
+EXA_PAGE_USD = float(os.getenv('PRICE_EXA_PAGE', '0.001'))
+
+# daily budgets, 0 = no limit
+BUDGETS = {
+    'member': float(os.getenv('BUDGET_MEMBER_DAILY_USD', '0')),
+    'category': float(os.getenv('BUDGET_CATEGORY_DAILY_USD', '0')),
+    'member_category': float(os.getenv('BUDGET_MEMBER_CATEGORY_DAILY_USD', '0')),
+}
+MEMBER_DAILY_TOKENS = int(os.getenv('BUDGET_MEMBER_DAILY_TOKENS', '0'))
+
+_current = contextvars.ContextVar('ledger_run', default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for english web text. no tokenizer dependency; gemini's usage_metadata
+    # gives the exact counts whenever the response has them
+    return len(text) // 4 + 1
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def llm_cost(model: str, tokens_in: int, tokens_out: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES['gemini-pro-latest'])
+    return (tokens_in * price_in + tokens_out * price_out) / 1_000_000
+
+
+class Run:
+    """Counters for one pipeline run; charged by resilient_call while the run is active."""
+
+    def __init__(self, member_id, category, location, frugal=None):
+        self.member_id = member_id
+        self.category = category
+        self.location = location
+        self.frugal = frugal  # why this run is on the cheap path (a budget message), or None
+        self.models = []
+        self.tokens_in = self.tokens_out = self.llm_calls = 0
+        self.exa_searches = self.exa_pages = self.exa_bytes = 0
+        self.prompt_bytes = 0
+        self.cost_usd = 0.0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()  # attempts are charged from the upstream worker threads
+        self.written = None  # (ledger, row id) once written, so late attempts update that row
+
+    def charge_llm(self, model: str, prompt: str, response):
+        # response is None for a failed attempt: the prompt was still sent, so bill its input
+        usage = getattr(response, 'usage_metadata', None)
+        tokens_in = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        tokens_out = getattr(usage, 'candidates_token_count', None) or estimate_tokens(getattr(response, 'text', '') or '')
+        self.llm_calls += 1
+        self.tokens_in += tokens_in
+        self.tokens_out += tokens_out
+        self.prompt_bytes += len(prompt.encode('utf8'))
+        if model not in self.models:
+            self.models.append(model)
+        self.cost_usd += llm_cost(model, tokens_in, tokens_out)
+
+    def charge_search(self):
+        self.exa_searches += 1
+        self.cost_usd += EXA_SEARCH_USD
+
+    def charge_pages(self, pages):
+        self.exa_pages += len(pages)
+        self.exa_bytes += sum(len((getattr(page, 'text', '') or '').encode('utf8')) for page in pages)
+        self.cost_usd += EXA_PAGE_USD * len(pages)
+
+
+def current_run() -> Run | None:
+    return _current.get()
+
+
+def frugal() -> str | None:
+    """Budget message if the active run is over budget (take the cheap path), else None."""
+    run = _current.get()
+    return run.frugal if run else None
+
+
+def charge_call(op: str, args, result, model: str | None = None, run: Run | None = None):
+    """
+    Hook for resilient_call: bill one upstream attempt to run (default: the active run, if any).
+    result is None for an attempt that failed but was still billed.
+    """
+    run = run or _current.get()
+    if run is None:
+        return
+    with run.lock:
+        if op == 'exa.search':
+            run.charge_search()
+        elif op == 'exa.get_contents':
+            run.charge_pages(getattr(result, 'results', None) or [])
+        elif op.startswith('gemini.'):
+            prompt = args[0] if args and isinstance(args[0], str) else ''
+            run.charge_llm(model or 'gemini-pro-latest', prompt, result)
+        if run.written:
+            ledger, row_id = run.written
+            ledger._update(run, row_id)
+
+
+class Ledger:
+    """sqlite table of finished runs, budget checks and aggregate queries."""
+
+    def __init__(self, path: str = LEDGER_DB):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                day TEXT NOT NULL,
+                finished_at REAL NOT NULL,
+                member_id TEXT,
+                category TEXT,
+                location TEXT,
+                models TEXT,
+                tokens_in INTEGER NOT NULL,
+                tokens_out INTEGER NOT NULL,
+                llm_calls INTEGER NOT NULL,
+                exa_searches INTEGER NOT NULL,
+                exa_pages INTEGER NOT NULL,
+                exa_bytes INTEGER NOT NULL,
+                prompt_bytes INTEGER NOT NULL,
+                latency_s REAL NOT NULL,
+                cost_usd REAL NOT NULL,
+                frugal INTEGER NOT NULL,
+                ok INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_member_day ON runs (member_id, day);
+            CREATE INDEX IF NOT EXISTS runs_category_day ON runs (category, day);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def spent(self, day: str | None = None, member_id=None, category=None) -> dict:
+        """Summed cost and tokens for one day, optionally narrowed to a member and/or category."""
+        query = "SELECT COALESCE(SUM(cost_usd), 0) AS usd, COALESCE(SUM(tokens_in + tokens_out), 0) AS tokens FROM runs WHERE day = ?"
+        params = [day or today()]
+        if member_id is not None:
+            query += " AND member_id = ?"
+            params.append(member_id)
+        if category is not None:
+            query += " AND category = ?"
+            params.append(category)
+        row = self._conn().execute(query, params).fetchone()
+        return {'usd': row['usd'], 'tokens': row['tokens']}
+
+    def over_budget(self, member_id, category) -> str | None:
+        """Message naming the first exceeded budget for today, or None if the run can spend freely."""
+        try:
+            return self._over_budget(member_id, category)
+        except sqlite3.Error as e:
+            print(f"ledger unavailable, not enforcing budgets: {e}")
+            return None
+
+    def _over_budget(self, member_id, category):
+        checks = (('member', {'member_id': member_id}), ('category', {'category': category}),
+                  ('member_category', {'member_id': member_id, 'category': category}))
+        for name, scope in checks:
+            limit = BUDGETS[name]
+            if limit and None not in scope.values() and self.spent(**scope)['usd'] >= limit:
+                return f"{name.replace('_', '/')} budget of ${limit:.2f}/day used up"
+        if MEMBER_DAILY_TOKENS and member_id is not None and self.spent(member_id=member_id)['tokens'] >= MEMBER_DAILY_TOKENS:
+            return f"member token budget of {MEMBER_DAILY_TOKENS}/day used up"
+        return None
+
+    @contextmanager
+    def run(self, member_id, category, location=None):
+        """Track one pipeline run; it's written to the ledger when the block exits (even on error)."""
+        run = Run(member_id, category, location, frugal=self.over_budget(member_id, category))
+        token = _current.set(run)
+        ok = False
+        try:
+            yield run
+            ok = True
+        finally:
+            _current.reset(token)
+            with run.lock:
+                self._write(run, ok)
+
+    def _write(self, run: Run, ok: bool):
+        try:
+            cursor = self._conn().execute(
+                "INSERT INTO runs (day, finished_at, member_id, category, location, models, tokens_in, tokens_out, llm_calls,"
+                " exa_searches, exa_pages, exa_bytes, prompt_bytes, latency_s, cost_usd, frugal, ok)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (today(), time.time(), run.member_id, run.category, run.location, ','.join(run.models), run.tokens_in,
+                 run.tokens_out, run.llm_calls, run.exa_searches, run.exa_pages, run.exa_bytes, run.prompt_bytes,
+                 time.monotonic() - run.started, run.cost_usd, int(bool(run.frugal)), int(ok)),
+            )
+            run.written = (self, cursor.lastrowid)
+        except sqlite3.Error as e:
+            # accounting must never fail the request that's being accounted for
+            print(f"couldn't write ledger row: {e}")
+
+    def _update(self, run: Run, row_id: int):
+        # an abandoned hedge or timed-out attempt that finished after its run was written
+        try:
+            self._conn().execute(
+                "UPDATE runs SET models = ?, tokens_in = ?, tokens_out = ?, llm_calls = ?, exa_searches = ?, exa_pages = ?,"
+                " exa_bytes = ?, prompt_bytes = ?, cost_usd = ? WHERE id = ?",
+                (','.join(run.models), run.tokens_in, run.tokens_out, run.llm_calls, run.exa_searches, run.exa_pages,
+                 run.exa_bytes, run.prompt_bytes, run.cost_usd, row_id),
+            )
+        except sqlite3.Error as e:
+            print(f"couldn't update ledger row: {e}")
+
+    def summary(self, by: str = 'category', days: int = 7) -> list:
+        """Totals per day and `by` (member_id, category, location, models) over the last `days` days."""
+        if by not in ('member_id', 'category', 'location', 'models', 'day'):
+            raise ValueError(f"can't group by {by}")
+        since = datetime.fromtimestamp(time.time() - days * 86400, timezone.utc).strftime('%Y-%m-%d')
+        group = 'day' if by == 'day' else f"day, {by}"
+        rows = self._conn().execute(
+            f"SELECT {group}, COUNT(*) AS runs, SUM(frugal) AS frugal_runs, SUM(tokens_in) AS tokens_in,"
+            " SUM(tokens_out) AS tokens_out, SUM(exa_searches) AS exa_searches, SUM(exa_pages) AS exa_pages,"
+            " SUM(exa_bytes) AS exa_bytes, AVG(latency_s) AS avg_latency_s, SUM(cost_usd) AS cost_usd"
+            f" FROM runs WHERE day >= ? GROUP BY {group} ORDER BY {group}",
+            (since,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_ledger() -> Ledger:
+    # opened on first use so importing an agent doesn't create the file
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = Ledger()
+    return _shared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='spend per day from the local ledger')
+    parser.add_argument('--by', default='category', choices=['member_id', 'category', 'location', 'models', 'day'])
+    parser.add_argument('--days', type=int, default=7)
+    cli = parser.parse_args()
+    for row in shared_ledger().summary(cli.by, cli.days):
+        label = row['day'] if cli.by == 'day' else f"{row['day']} {row[cli.by]}"
+        print(f"{label:<40} runs {row['runs']:>4} ({row['frugal_runs'] or 0} frugal)  tokens {row['tokens_in']}/{row['tokens_out']}  "
+              f"exa {row['exa_searches']} searches {row['exa_pages']} pages  avg {row['avg_latency_s']:.1f}s  ${row['cost_usd']:.4f}")
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-memory caches for one process serving many properties. Every cache (exa searches, exa page
+# contents, gemini responses, catalog venue lookups) is split into one shard per location, and
+# each shard has its own byte quota and LRU eviction - so a busy property churning through new
+# searches only ever evicts its *own* old entries, never another hotel's warm data. Whole shards
+# are dropped least-recently-used once more than MAX_SHARDS properties are resident.
+#
+# usage:
+#   results = cached_call('search', location, query, lambda: exa.search(query).results)
+#   contents = cached_contents(location, ids, lambda missing: exa.get_contents(missing).results)
+
+SHARD_MB = {
+    'search': float(os.getenv('CACHE_SEARCH_MB', '2')),
+    'contents': float(os.getenv('CACHE_CONTENTS_MB', '32')),
+    'llm': float(os.getenv('CACHE_LLM_MB', '4')),
+    'venues': float(os.getenv('CACHE_VENUES_MB', '4')),
+}
+TTL_S = {
+    'search': float(os.getenv('CACHE_SEARCH_TTL_S', str(6 * 3600))),
+    'contents': float(os.getenv('CACHE_CONTENTS_TTL_S', str(24 * 3600))),
+    'llm': float(os.getenv('CACHE_LLM_TTL_S', str(3600))),
+    'venues': float(os.getenv('CACHE_VENUES_TTL_S', str(3600))),
+}
+MAX_SHARDS = int(os.getenv('CACHE_MAX_LOCATIONS', '16'))
+
+
+def approx_size(value) -> int:
+    """Rough bytes for quota accounting - text dominates everything we cache."""
+    if value is None:
+        return 8
+    if isinstance(value, (str, bytes)):
+        return len(value) + 49
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(approx_size(item) for item in value)
+    if isinstance(value, dict):
+        return len(json.dumps(value, default=str)) + 64
+    if hasattr(value, 'text') or hasattr(value, 'url'):
+        # exa results / RetrievedPage style objects
+        return 128 + sum(len(str(getattr(value, attr, '') or '')) for attr in ('id', 'url', 'title', 'text'))
+    return 64
+
+
+class Shard:
+    """LRU with a byte quota and a ttl, for one location."""
+
+    def __init__(self, quota_bytes: int, ttl_s: float):
+        self.quota_bytes = quota_bytes
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.used = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[2] < time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size: int | None = None):
+        size = size if size is not None else approx_size(value)
+        if size > self.quota_bytes:
+            return  # would evict the whole shard for one entry, not worth it
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (value, size, time.monotonic() + self.ttl_s)
+        self.used += size
+        while self.used > self.quota_bytes:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.used -= size
+
+
+class ShardedCache:
+    """One Shard per location, created on demand; least recently used locations go first past max_shards."""
+
+    def __init__(self, name: str, quota_mb: float, ttl_s: float, max_shards: int = MAX_SHARDS):
+        self.name = name
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.ttl_s = ttl_s
+        self.max_shards = max_shards
+        self.shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shard(self, location):
+        shard = self.shards.get(location)
+        if shard is None:
+            shard = self.shards[location] = Shard(self.quota_bytes, self.ttl_s)
+            while len(self.shards) > self.max_shards:
+                self.shards.popitem(last=False)
+        self.shards.move_to_end(location)
+        return shard
+
+    def get(self, location, key):
+        with self._lock:
+            return self._shard(location).get(key)
+
+    def put(self, location, key, value, size: int | None = None):
+        with self._lock:
+            self._shard(location).put(key, value, size)
+
+    def discard(self, location, key):
+        with self._lock:
+            shard = self.shards.get(location)
+            if shard is not None and key in shard.entries:
+                shard._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {location: {'entries': len(shard.entries), 'bytes': shard.used, 'hits': shard.hits,
+                               'misses': shard.misses, 'evictions': shard.evictions}
+                    for location, shard in self.shards.items()}
+
+
+CACHES = {name: ShardedCache(name, SHARD_MB[name], TTL_S[name]) for name in SHARD_MB}
+
+
+def cache_key(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+
+def cached_call(cache: str, location: str, key, compute):
+    """Cached value for (location, key), else compute() - empty results aren't cached."""
+    key = key if isinstance(key, str) else cache_key(key)
+    value = CACHES[cache].get(location, key)
+    if value is not None:
+        return value
+    value = compute()
+    if value:
+        CACHES[cache].put(location, key, value)
+    return value
+
+
+def forget(cache: str, location: str, key):
+    """Drop one entry, e.g. a gemini answer that turned out to be unparseable."""
+    CACHES[cache].discard(location, key if isinstance(key, str) else cache_key(key))
+
+
+def cached_contents(location: str, ids: list, fetch) -> list:
+    """Page contents for ids in order, fetching only the ids this location's shard doesn't have."""
+    shard_hits = {doc_id: CACHES['contents'].get(location, doc_id) for doc_id in ids}
+    missing = [doc_id for doc_id, content in shard_hits.items() if content is None]
+    if missing:
+        for content in fetch(missing) or []:
+            CACHES['contents'].put(location, content.id, content)
+            shard_hits[content.id] = content
+    return [shard_hits[doc_id] for doc_id in ids if shard_hits.get(doc_id) is not None]
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,159 @@
+import os
+import threading
+
+from resilience import POLICIES, resilient_call
+from rate_limiter import Quota
+from clients import lazy, gemini_model
+from ledger import estimate_tokens, frugal
+from location_cache import CACHES, cache_key
+
+# Picks the gemini model per call instead of sending everything to gemini-pro-latest. Most of
+# our prompts are small and tightly bounded (a schema'd list of 5 surprises from a few pages),
+# which the fast model handles fine in a fraction of the time and cost. Pro is used when:
+#   - the prompt is large (combined feeds, lots of page text)
+#   - the category is listed in ROUTER_PRO_CATEGORIES
+#   - the fast model's recent error rate is too high
+#   - the fast model's answer failed validation (escalation, once per call)
+# and never when the remaining request budget can't cover pro's observed latency, or for runs
+# that are over a spend budget (ledger.py) - those always stay on the fast model.
+# every routing decision is printed, e.g.
+#   model router: surprise -> gemini-flash-latest (small prompt, ~3100 tokens, 84s left)
+#
+# generate() hands back the model that answered as well, so fingerprints, cache keys and the
+# ledger say which model a recommendation actually came from.
+#
+# usage (inside an agent):
+#   text, model = ROUTER.generate('dining', prompt, generation_config('dining'), deadline, llm_quota,
+#                                 validate=lambda t: bool(parse_recommendations(t, 'dining')))
+
+FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-flash-latest')
+PRO_MODEL = os.getenv('GEMINI_PRO_MODEL', 'gemini-pro-latest')
+ROUTING_ENABLED = os.getenv('ROUTER_DISABLED', '') == ''
+LARGE_PROMPT_TOKENS = int(os.getenv('ROUTER_LARGE_PROMPT_TOKENS', '24000'))
+PRO_CATEGORIES = {c.strip() for c in os.getenv('ROUTER_PRO_CATEGORIES', '').split(',') if c.strip()}
+MAX_FAST_ERROR_RATE = float(os.getenv('ROUTER_MAX_FAST_ERROR_RATE', '0.3'))
+# until we have latency samples for a model, assume it needs this long
+DEFAULT_LATENCY_S = {FAST_MODEL: 8.0, PRO_MODEL: 30.0}
+
+# each model gets its own resilience policy so their latencies don't share one hedge tracker
+MODEL_OPS = {FAST_MODEL: 'gemini.generate.fast', PRO_MODEL: 'gemini.generate'}
+
+
+class ModelRouter:
+    """Per-call fast/pro choice from prompt size, category, budget and recent latency/error rates."""
+
+    def __init__(self, fast: str = FAST_MODEL, pro: str = PRO_MODEL, alpha: float = 0.1):
+        self.fast = fast
+        self.pro = pro
+        self.alpha = alpha  # weight of the newest outcome in the error rate
+        self.models = {}
+        self.error_rate = {fast: 0.0, pro: 0.0}
+        self.calls = {fast: 0, pro: 0}
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    def choices(self) -> tuple:
+        """Every model generate() may answer with, pro first."""
+        return (self.pro, self.fast)
+
+    def model(self, name: str):
+        with self._lock:
+            if name not in self.models:
+                self.models[name] = lazy(lambda: gemini_model(name))
+            return self.models[name]
+
+    def expected_latency(self, name: str, pct: float = 95.0) -> float:
+        observed = POLICIES[MODEL_OPS[name]].latency.percentile(pct)
+        return observed if observed is not None else DEFAULT_LATENCY_S[name]
+
+    def _fits(self, name: str, deadline) -> bool:
+        return deadline is None or deadline.remaining() >= self.expected_latency(name)
+
+    def _record(self, name: str, ok: bool):
+        with self._lock:
+            self.calls[name] += 1
+            self.error_rate[name] += self.alpha * ((0.0 if ok else 1.0) - self.error_rate[name])
+
+    def choose(self, category: str, prompt: str, deadline=None) -> tuple:
+        """(model name, reason) for one call."""
+        tokens = estimate_tokens(prompt)
+        if not ROUTING_ENABLED:
+            return self.pro, 'routing disabled'
+        if frugal():
+            return self.fast, frugal()  # over a spend budget (see ledger.py), never pro
+        if tokens > LARGE_PROMPT_TOKENS:
+            want, reason = self.pro, 'large prompt'
+        elif category in PRO_CATEGORIES:
+            want, reason = self.pro, 'pro category'
+        elif self.error_rate[self.fast] > MAX_FAST_ERROR_RATE:
+            want, reason = self.pro, f'fast model failing {self.error_rate[self.fast]:.0%}'
+        else:
+            return self.fast, 'small prompt'
+        if not self._fits(self.pro, deadline):
+            return self.fast, f'{reason}, but no budget for pro'
+        return want, reason
+
+    def _call(self, name: str, prompt: str, config: dict, deadline, quota: Quota | None):
+        # same key and priority as the caller asked for, but rate limited as the model we actually use
+        quota = Quota(key=quota.key, model=name, priority=quota.priority) if quota else Quota(model=name)
+        try:
+            text = resilient_call(MODEL_OPS[name], self.model(name).generate_content, prompt,
+                                  generation_config=config, deadline=deadline, quota=quota).text
+        except Exception:
+            self._record(name, False)
+            raise
+        return text
+
+    def generate(self, category: str, prompt: str, config: dict, deadline=None, quota: Quota | None = None,
+                 validate=None) -> tuple:
+        """
+        (response text, model that gave it). If validate(text) is false for a fast-model answer,
+        the call is retried once on pro (budget permitting); the caller still validates the result.
+        """
+        if quota is not None and not quota.key:
+            raise RuntimeError("GEMINI_KEY is not set")
+        name, reason = self.choose(category, prompt, deadline)
+        left = f", {deadline.remaining():.0f}s left" if deadline else ''
+        print(f"model router: {category} -> {name} ({reason}, ~{estimate_tokens(prompt)} tokens{left})")
+
+        text = self._call(name, prompt, config, deadline, quota)
+        ok = validate is None or validate(text)
+        self._record(name, ok)
+        if ok or name == self.pro or frugal():
+            return text, name
+        if not self._fits(self.pro, deadline):
+            print(f"model router: {category} answer from {name} failed validation, no budget to escalate")
+            return text, name
+        print(f"model router: {category} answer from {name} failed validation, escalating to {self.pro}")
+        with self._lock:
+            self.escalations += 1
+        text = self._call(self.pro, prompt, config, deadline, quota)
+        self._record(self.pro, validate(text))
+        return text, self.pro
+
+    def cached_generate(self, location: str, category: str, prompt: str, config: dict, deadline=None,
+                        quota: Quota | None = None, validate=None) -> tuple:
+        """
+        generate() through the location's llm cache. Answers are cached under (model, prompt) for the
+        model that gave them, so a repeat of the prompt still knows which model it is replaying.
+        """
+        for name in self.choices():
+            text = CACHES['llm'].get(location, cache_key((name, prompt)))
+            if text is not None:
+                return text, name
+        text, name = self.generate(category, prompt, config, deadline, quota, validate)
+        if text:
+            CACHES['llm'].put(location, cache_key((name, prompt)), text)
+        return text, name
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'error_rate': {name: round(rate, 3) for name, rate in self.error_rate.items()},
+                'p50_s': {name: POLICIES[op].latency.percentile(50) for name, op in MODEL_OPS.items()},
+                'escalations': self.escalations,
+            }
+
+
+ROUTER = ModelRouter()
@@ -1,61 +1,183 @@
 import os
 import json
-import re
 import time
-import google.generativeai as genai
-from exa_py import Exa
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-load_dotenv()
-
-gemini_api_key = os.getenv('GEMINI_KEY')
-if gemini_api_key:
-    genai.configure(api_key=gemini_api_key)
+from resilience import Deadline, resilient_call
+from rate_limiter import Quota, INTERACTIVE
+from structured_output import generation_config, parse_recommendations
+from vector_index import shared_index
+from venue_catalog import shared_catalog
+from fingerprint import model_fingerprints, reusable_recommendations, saved_recommendations
+from ledger import shared_ledger, frugal
+from singleflight import FLIGHTS
+from storage import storage_client
+from clients import load_env, lazy, exa_client
+from model_router import ROUTER
+from location_cache import cached_call, cached_contents, forget
+from content_cleaner import clean_contents
+from geo import attach_distances
 
 # Supabase configuration
 supabase_url = "https://ivnzekvuouiqasshhlml.supabase.co"
-supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 
 class NightlifeAgent:
+    category = 'nightlife'
+    # members columns this agent reads (also what combined/batch modes select for it)
+    member_columns = 'first_name, dining_preferences, service_preferences, special_occasions'
+
     def __init__(self, debug=False):
-        self.exa = Exa(api_key=os.getenv('BEN_EXA_KEY'))
+        # .env is read and the sdk clients are built on first use, not at import (see clients.py)
+        load_env()
+        self.exa_key = os.getenv('BEN_EXA_KEY')
+        self.gemini_key = os.getenv('GEMINI_KEY')
+        self.exa = lazy(lambda: exa_client(self.exa_key))
         self.location = os.getenv('LOCATION', 'Blacksburg, VA')
         self.debug = debug
-        self.llm = genai.GenerativeModel('gemini-pro-latest') if gemini_api_key else None
-        self.supabase: Client = create_client(supabase_url, supabase_key) if supabase_key else None
+        self.request_budget = float(os.getenv('REQUEST_BUDGET_S', '90'))  # seconds for the whole exa+gemini pipeline
+        # local sqlite mirror of members/recommendations in front of supabase (see storage.py)
+        self.supabase = storage_client(supabase_url, os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+        self.index = shared_index()  # local venue-page index, None if numpy isn't installed
+        self.catalog = shared_catalog()  # canonical venues per location, refreshed in the background
 
-    def get_recommendations(self, member_id):
+    def get_recommendations(self, member_id, priority=INTERACTIVE, max_age=None, location=None):
         # Main flow for nightlife recommendations - uses exa and gemini to find evening entertainment
         # Tailored to user preferences and evening activities
 
+        # location is per request (one process can serve many properties); LOCATION is only the default
+        location = location or self.location
+        # every exa/gemini call below draws its timeout from this one request budget
+        deadline = Deadline(self.request_budget)
+        # kiosk taps run as INTERACTIVE, batch/precompute callers pass BACKGROUND so they yield quota
+        exa_quota = Quota(key=self.exa_key, priority=priority)
+        llm_quota = Quota(key=self.gemini_key, priority=priority)  # the router fills in the model it picks
+
         # Fetch user data from Supabase
         if not self.supabase:
             print("Supabase client not initialized")
             return []
         
         try:
-            # Fetch user data from Supabase, selecting columns that exist
-            response = self.supabase.table('members').select('first_name, dining_preferences, service_preferences, special_occasions').eq('member_id', member_id).execute()
+            response = self.supabase.table('members').select(self.member_columns).eq('member_id', member_id).execute()
             if not response.data:
                 print(f"No member found with ID: {member_id}")
                 return []
             
             user_data = response.data[0]
-            # Reconstruct a dictionary for personal info to match what the LLM prompt expects
-            prefs = {'firstName': user_data.get('first_name')}
-            dining_prefs = user_data.get('dining_preferences', {})
-            service_prefs = user_data.get('service_preferences', {})
-            special_prefs = user_data.get('special_occasions', {})
+            pref_args = self._prefs_from_row(user_data)
         except Exception as e:
             print(f"Error fetching user data: {e}")
             return []
+
+        # max_age (seconds) = "regenerate only if inputs changed or the last run is older than this".
+        # the fingerprint covers this category's preferences, the location, the model and content version
+        # (one per model the router may answer with - the run saves the one for the model that did)
+        fingerprints = model_fingerprints(self.category, pref_args, location, ROUTER.choices())
+        if max_age is not None:
+            saved = reusable_recommendations(self.supabase, member_id, self.category, location, fingerprints.values(), max_age)
+            if saved is not None:
+                print(f"inputs unchanged since last run, reusing {len(saved)} saved nightlife recommendations")
+                return saved
+
+        # over today's spend budget (ledger.py): the last saved list, whatever its age, beats a new run
+        over = shared_ledger().over_budget(member_id, self.category)
+        if over:
+            saved = saved_recommendations(self.supabase, member_id, self.category, location)
+            if saved:
+                print(f"{over}, serving {len(saved)} saved nightlife recommendations")
+                return saved
+            print(f"{over}, generating on the cheap path")
+        
+        # concurrent requests for the same member/category share one run and one saved row.
+        # a caller waiting on another process picks up the row that process saved
+        started = time.time()
+        return FLIGHTS.do(
+            (member_id, self.category, location),
+            lambda: self._generate(member_id, pref_args, fingerprints, deadline, exa_quota, llm_quota, location),
+            follower=lambda: reusable_recommendations(self.supabase, member_id, self.category, location, fingerprints.values(), time.time() - started + 60),
+        )
+
+    def _generate(self, member_id, pref_args, fingerprints, deadline, exa_quota, llm_quota, location=None):
+        location = location or self.location
+        # every exa/gemini call in here is billed to this run (tokens, pages, cost)
+        with shared_ledger().run(member_id, self.category, location):
+            venues, model = self._run_pipeline(pref_args, deadline, exa_quota, llm_quota, location)
+            if not venues:
+                return []
+            if self.catalog:
+                # fold duplicates (same venue under two urls) and remember the venues for the catalog
+                venues = self.catalog.ingest(location, 'nightlife', venues)
+        
+            # coordinates, distance and walk time from the property, so the kiosk doesn't look them up per card
+            venues = attach_distances(location, venues)
+
+            # Save recommendations to Supabase
+            self._save_recommendations(member_id, venues, fingerprints[model], location)
         
+            return venues
+
+    def _run_pipeline(self, pref_args, deadline, exa_quota, llm_quota, location=None):
+        """Retrieve -> prompt -> gemini -> (validated items, model that answered) for one set of preferences."""
+        location = location or self.location
+        prefs, dining_prefs, service_prefs, special_prefs = pref_args
+
         # 1. Search for nightlife venues and evening entertainment
-        search_query = self._build_search_query(prefs, dining_prefs, service_prefs, special_prefs)
+        search_query = self._build_search_query(prefs, dining_prefs, service_prefs, special_prefs, location=location)
         print(f"searching for nightlife with query: {search_query}")
+        contents = self._gather_contents(search_query, deadline, exa_quota, location)
+        if not contents:
+            return [], None
+        # strip nav/cookie chrome and paragraphs repeated across pages before they hit the prompt
+        contents, _ = clean_contents(contents, debug=self.debug)
+
+        # 3. Synthesize recommendations
+        print("concierge evaluating nightlife options...")
+        prompt = self._build_llm_prompt(contents, prefs, dining_prefs, service_prefs, special_prefs)
+        
+        llm_key = None
+        try:
+            # structured-output mode: gemini returns json matching the nightlife schema, and the parser
+            # keeps every valid item even if the array comes back truncated or partly broken
+            # identical prompt at the same property (same prefs, same pages) -> reuse the last answer,
+            # cached under the model that gave it
+            text, model = ROUTER.cached_generate(location, 'nightlife', prompt, generation_config('nightlife'), deadline, llm_quota, validate=lambda t: bool(parse_recommendations(t, 'nightlife')))
+            llm_key = (model, prompt)
+            if self.debug:
+                print(f"--- raw gemini output ---\n{text}\n--------------------")
+
+            venues = parse_recommendations(text, 'nightlife', debug=self.debug)
+            if not venues:
+                raise ValueError("no valid nightlife recommendations in gemini output")
+        except Exception as e:
+            print(f"no results")
+            if self.debug:
+                print(f"    err: {e}")
+            if llm_key is not None:
+                forget('llm', location, llm_key)  # don't replay a bad answer to the next identical request
+            return [], None
+        return venues, model
+
+    def _gather_contents(self, search_query, deadline, exa_quota, location=None):
+        """Cheapest source that covers this query: venue catalog, then local page index, then live exa."""
+        location = location or self.location
+        # a fresh catalog segment means gemini only has to pick and personalize, no page text needed
+        contents = cached_call('venues', location, (self.category, search_query), lambda: self.catalog.venue_pages(location, self.category, search_query)) if self.catalog else []
+        if contents:
+            print(f"using {len(contents)} catalog venues for {location}, skipping exa search")
+            return contents
+        # next the local index: enough fresh, relevant pages for this location already fetched before
+        contents = self.index.retrieve(search_query, location, category=self.category) if self.index else []
+        if contents:
+            print(f"using {len(contents)} indexed pages for {location}, skipping exa search")
+            return contents
+        if frugal():
+            print(f"{frugal()}, skipping live exa search")
+            return []
+        return self._search_and_fetch(search_query, deadline, exa_quota, location)
+
+    def _search_and_fetch(self, search_query, deadline, exa_quota, location=None):
+        """Live path: exa search + batch content fetch, then index the pages for next time."""
+        location = location or self.location
         try:
-            search_results = self.exa.search(search_query, num_results=10, use_autoprompt=True).results
+            search_results = cached_call('search', location, search_query, lambda: resilient_call('exa.search', self.exa.search, search_query, num_results=10, use_autoprompt=True, deadline=deadline, quota=exa_quota).results)
         except Exception as e:
             print(f"exa search failed: {e}")
             return []
@@ -64,37 +186,31 @@ class NightlifeAgent:
         print(f"found {len(search_results)} potential nightlife venues, getting their info...")
         ids = [result.id for result in search_results]
         try:
-            contents = self.exa.get_contents(ids).results
+            # pages this property already fetched recently come from its cache shard, only the rest hit exa
+            contents = cached_contents(location, ids, lambda missing: resilient_call('exa.get_contents', self.exa.get_contents, missing, deadline=deadline, quota=exa_quota).results)
         except Exception as e:
             print(f"exa content fetch failed: {e}")
             return []
 
-        # 3. Synthesize recommendations
-        print("concierge evaluating nightlife options...")
-        prompt = self._build_llm_prompt(contents, prefs, dining_prefs, service_prefs, special_prefs)
-        
-        try:
-            response = self.llm.generate_content(prompt)
-            cleaned_response = re.sub(r'```json\s*|\s*```', '', response.text).strip()
-            if self.debug:
-                print(f"--- raw gemini output ---\n{cleaned_response}\n--------------------")
-            
-            venues = json.loads(cleaned_response)
-            
-            # Save recommendations to Supabase
-            self._save_recommendations(member_id, venues)
-            
-            return venues
+        if self.index:
+            try:
+                self.index.add_pages(location, contents, categories=[self.category])
+            except Exception as e:
+                print(f"couldn't index fetched pages: {e}")
+        return contents
 
-        except Exception as e:
-            print(f"no results")
-            if self.debug:
-                print(f"    err: {e}")
-            return []
+    def _prefs_from_row(self, user_data):
+        """Split a members row into the preference args the query/prompt builders take."""
+        # Reconstruct a dictionary for personal info to match what the LLM prompt expects
+        prefs = {'firstName': user_data.get('first_name')}
+        dining_prefs = user_data.get('dining_preferences', {})
+        service_prefs = user_data.get('service_preferences', {})
+        special_prefs = user_data.get('special_occasions', {})
+        return prefs, dining_prefs, service_prefs, special_prefs
 
-    def _build_search_query(self, prefs, dining_prefs, service_prefs, special_prefs):
+    def _build_search_query(self, prefs, dining_prefs, service_prefs, special_prefs, location=None):
         # Build search query for nightlife based on user preferences
-        query_parts = [f"nightlife bars clubs in {self.location}"]
+        query_parts = [f"nightlife bars clubs in {location or self.location}"]
         
         # Add general nightlife types
         query_parts.append("live music venues")
@@ -173,7 +289,7 @@ class NightlifeAgent:
         prompt += "\nNow, generate the JSON array of nightlife recommendations as instructed. Ensure you provide a variety of different types of venues and consider their schedule preferences."
         return prompt
 
-    def _save_recommendations(self, member_id, recommendations):
+    def _save_recommendations(self, member_id, recommendations, fingerprint=None, location=None):
         """Save recommendations to Supabase recommendations table"""
         if not self.supabase or not recommendations:
             return
@@ -183,8 +299,9 @@ class NightlifeAgent:
             recommendation_data = {
                 'member_id': member_id,
                 'category': 'nightlife',
-                'location': self.location,
-                'description': recommendations
+                'location': location or self.location,
+                'description': recommendations,
+                'fingerprint': fingerprint,  # inputs this set was built from, see fingerprint.py
             }
             
             # Insert into recommendations table
@@ -0,0 +1,420 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from storage import keyset_pages
+
+# Local inverted index over member preferences, for picking members by profile instead of
+# pulling every members row and digging through the jsonb columns in python. Each member's
+# preference columns are flattened to (path, value) postings, one per leaf and one per list
+# element:
+#   dining_preferences.dietaryRestrictions.allergies = shellfish
+#   dining_preferences.cuisinePreferences            = italian
+# and upcoming_reservations are kept alongside so queries can join on arrival dates. Kept in step
+# by json_supabase.upsert_member and seed_db; `python preference_index.py --rebuild` reloads it
+# from supabase.
+#
+# usage:
+#   ids = shared_preference_index().select(
+#       "dining.dietaryRestrictions.dietaryChoice = Pescatarian AND dining.dietaryRestrictions.allergies = Shellfish"
+#       " AND arriving <= 7")
+#   same thing with predicate objects: All(Eq(...), Eq(...), Arriving(7))
+# a leading column name without its _preferences suffix is fine (dining. -> dining_preferences.)
+
+INDEX_DB = os.getenv('PREFERENCE_INDEX_DB', 'preference_index.sqlite')
+
+# members columns worth targeting on (contact details and addresses are deliberately left out)
+INDEXED_COLUMNS = (
+    'elite_status', 'room_preferences', 'dining_preferences', 'service_preferences', 'wellness_preferences',
+    'business_preferences', 'loyalty_preferences', 'transportation_preferences', 'special_occasions',
+    'travel_companions_meta', 'cultural_preferences', 'technology_preferences',
+)
+
+
+def _normalize(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value).strip().lower()
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten(row: dict) -> list:
+    """[(path, value, number)] for every leaf under the indexed columns of a members row."""
+    postings = set()
+
+    def walk(path, value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk(f"{path}.{key}", child)
+        elif isinstance(value, list):
+            for child in value:
+                walk(path, child)
+        elif value is not None and value != '':
+            postings.add((path, _normalize(value), _number(value)))
+
+    for column in INDEXED_COLUMNS:
+        walk(column, row.get(column))
+    return sorted(postings, key=lambda p: (p[0], p[1]))
+
+
+def resolve_path(path: str) -> str:
+    head, _, rest = path.partition('.')
+    if head not in INDEXED_COLUMNS and f"{head}_preferences" in INDEXED_COLUMNS:
+        head = f"{head}_preferences"
+    return f"{head}.{rest}" if rest else head
+
+
+# --- predicates: each one turns into a set of member ids ---
+
+class Eq:
+    def __init__(self, path, value):
+        self.path, self.value = resolve_path(path), _normalize(value)
+
+    def members(self, index):
+        return index._ids("SELECT member_id FROM postings WHERE path = ? AND value = ?", (self.path, self.value))
+
+
+class In:
+    def __init__(self, path, values):
+        self.path, self.values = resolve_path(path), [_normalize(v) for v in values]
+
+    def members(self, index):
+        marks = ', '.join('?' for _ in self.values)
+        return index._ids(f"SELECT member_id FROM postings WHERE path = ? AND value IN ({marks})", (self.path, *self.values))
+
+
+class Has:
+    """Any value at all under path (e.g. members who listed any allergy)."""
+
+    def __init__(self, path):
+        self.path = resolve_path(path)
+
+    def members(self, index):
+        return index._ids("SELECT member_id FROM postings WHERE path = ?", (self.path,))
+
+
+class Range:
+    """Numeric leaves: lo <= value <= hi, either bound optional (strict=True makes them exclusive)."""
+
+    def __init__(self, path, lo=None, hi=None, strict=False):
+        self.path, self.lo, self.hi, self.strict = resolve_path(path), lo, hi, strict
+
+    def members(self, index):
+        query, params = "SELECT member_id FROM postings WHERE path = ? AND num IS NOT NULL", [self.path]
+        if self.lo is not None:
+            query += " AND num > ?" if self.strict else " AND num >= ?"
+            params.append(self.lo)
+        if self.hi is not None:
+            query += " AND num < ?" if self.strict else " AND num <= ?"
+            params.append(self.hi)
+        return index._ids(query, params)
+
+
+class Arriving:
+    """Members with an upcoming reservation checking in within the next `days` days (optionally at a property)."""
+
+    def __init__(self, days, property=None, start=None):
+        self.days, self.property, self.start = days, property, start
+
+    def members(self, index):
+        start = self.start or date.today()
+        query = "SELECT member_id FROM reservations WHERE check_in >= ? AND check_in <= ?"
+        params = [start.isoformat(), (start + timedelta(days=self.days)).isoformat()]
+        if self.property:
+            query += " AND property LIKE ?"
+            params.append(f"%{self.property}%")
+        return index._ids(query, params)
+
+
+class Not:
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def members(self, index):
+        return index.universe() - self.predicate.members(index)
+
+
+class All:
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def members(self, index):
+        # intersect the positive terms smallest first, then subtract the negated ones
+        positive = [p for p in self.predicates if not isinstance(p, Not)]
+        negative = [p.predicate for p in self.predicates if isinstance(p, Not)]
+        sets = sorted((p.members(index) for p in positive), key=len)
+        result = sets[0] if sets else index.universe()
+        for other in sets[1:]:
+            if not result:
+                break
+            result &= other
+        for predicate in negative:
+            if not result:
+                break
+            result -= predicate.members(index)
+        return result
+
+
+class Any:
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def members(self, index):
+        result = set()
+        for predicate in self.predicates:
+            result |= predicate.members(index)
+        return result
+
+
+# --- text form: path = value, path != value, path < n, path ?, arriving <= days[@property or @"property"],
+#     value1|value2 for IN, AND / OR / NOT and parentheses ---
+
+_TOKEN = re.compile(r"\s*(\(|\)|!=|<=|>=|=|<|>|\?|\bAND\b|\bOR\b|\bNOT\b|\"[^\"]*\"|[^\s()=<>!?\"@]*@\"[^\"]*\"|[^\s()=<>!?\"]+)")
+
+
+class QueryError(ValueError):
+    """Raised for a query string that doesn't parse."""
+
+
+def parse(text: str):
+    tokens = [t for t in _TOKEN.findall(text) if t]
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take(expected=None):
+        nonlocal position
+        token = peek()
+        if token is None or (expected and token != expected):
+            raise QueryError(f"expected {expected or 'more'} at the end of {text!r}" if token is None
+                             else f"expected {expected}, got {token!r}")
+        position += 1
+        return token.strip('"')
+
+    def expr():
+        terms = [term()]
+        while peek() == 'OR':
+            take()
+            terms.append(term())
+        return terms[0] if len(terms) == 1 else Any(*terms)
+
+    def term():
+        factors = [factor()]
+        while peek() == 'AND':
+            take()
+            factors.append(factor())
+        return factors[0] if len(factors) == 1 else All(*factors)
+
+    def factor():
+        if peek() == 'NOT':
+            take()
+            return Not(factor())
+        if peek() == '(':
+            take('(')
+            inner = expr()
+            take(')')
+            return inner
+        return leaf()
+
+    def leaf():
+        path = take()
+        op = take()
+        if op == '?':
+            return Has(path)
+        value = take()
+        if path == 'arriving':
+            days, _, prop = value.partition('@')
+            prop = prop.strip('"')  # arriving <= 7@"The Inn at Virginia Tech"
+            if op not in ('<=', '<', '=') or not days.isdigit():
+                raise QueryError("use arriving <= DAYS or arriving <= DAYS@Property")
+            return Arriving(int(days), prop or None)
+        if op in ('<', '<=', '>', '>='):
+            number = _number(value)
+            if number is None:
+                raise QueryError(f"{path} {op} needs a number, got {value!r}")
+            if op in ('<', '<='):
+                return Range(path, hi=number, strict=op == '<')
+            return Range(path, lo=number, strict=op == '>')
+        leaf_pred = In(path, value.split('|')) if '|' in value else Eq(path, value)
+        if op == '!=':
+            return Not(leaf_pred)
+        if op != '=':
+            raise QueryError(f"unknown operator {op!r}")
+        return leaf_pred
+
+    result = expr()
+    if peek() is not None:
+        raise QueryError(f"unexpected {peek()!r} in {text!r}")
+    return result
+
+
+class PreferenceIndex:
+    """sqlite postings (path, value, member) plus upcoming reservations, one connection per thread."""
+
+    def __init__(self, path: str = INDEX_DB):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS postings (
+                path TEXT NOT NULL,
+                value TEXT NOT NULL,
+                member_id TEXT NOT NULL,
+                num REAL,
+                PRIMARY KEY (path, value, member_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_member ON postings (member_id);
+            CREATE INDEX IF NOT EXISTS postings_num ON postings (path, num) WHERE num IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS indexed_members (
+                member_id TEXT PRIMARY KEY,
+                indexed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS reservations (
+                member_id TEXT NOT NULL,
+                confirmation_number TEXT,
+                property TEXT,
+                check_in TEXT,
+                check_out TEXT
+            );
+            CREATE INDEX IF NOT EXISTS reservations_check_in ON reservations (check_in);
+            CREATE INDEX IF NOT EXISTS reservations_member ON reservations (member_id);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _ids(self, query, params) -> set:
+        return {row[0] for row in self._conn().execute(query, params)}
+
+    def universe(self) -> set:
+        return self._ids("SELECT member_id FROM indexed_members", ())
+
+    def index_member(self, row: dict, reservations: list | None = None):
+        """(Re)index one members row; reservations, if given, replace that member's upcoming ones."""
+        member_id = row['member_id']
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM postings WHERE member_id = ?", (member_id,))
+                conn.executemany("INSERT INTO postings (path, value, member_id, num) VALUES (?, ?, ?, ?)",
+                                 [(path, value, member_id, num) for path, value, num in flatten(row)])
+                conn.execute("INSERT OR REPLACE INTO indexed_members (member_id, indexed_at) VALUES (?, ?)",
+                             (member_id, time.time()))
+                if reservations is not None:
+                    conn.execute("DELETE FROM reservations WHERE member_id = ?", (member_id,))
+                    conn.executemany(
+                        "INSERT INTO reservations (member_id, confirmation_number, property, check_in, check_out) VALUES (?, ?, ?, ?, ?)",
+                        [(member_id, r.get('confirmation_number'), r.get('property'), r.get('check_in'), r.get('check_out'))
+                         for r in reservations])
+
+    def remove_member(self, member_id: str):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for table in ('postings', 'indexed_members', 'reservations'):
+                    conn.execute(f"DELETE FROM {table} WHERE member_id = ?", (member_id,))
+
+    def select(self, query) -> set:
+        """Member ids matching a predicate object or a query string."""
+        predicate = parse(query) if isinstance(query, str) else query
+        return predicate.members(self)
+
+    def values(self, path: str, limit: int = 50) -> list:
+        """Most common values under a path with member counts - handy for building queries."""
+        return [(row['value'], row['n']) for row in self._conn().execute(
+            "SELECT value, COUNT(*) AS n FROM postings WHERE path = ? GROUP BY value ORDER BY n DESC LIMIT ?",
+            (resolve_path(path), limit))]
+
+    def rebuild(self, supabase, page: int = 500) -> int:
+        """Reindex every member (and their upcoming reservations) from supabase; drop members it no longer has."""
+        # paged like members below - one unbounded select gets cut off at supabase's row cap
+        reservations = {}
+        for rows in keyset_pages(supabase, 'upcoming_reservations', 'member_id', 'confirmation_number',
+                                 columns='member_id, confirmation_number, property, check_in, check_out', page=page):
+            for r in rows:
+                reservations.setdefault(r['member_id'], []).append(r)
+        seen, last = set(), ''
+        while True:
+            rows = (supabase.table('members').select(f"member_id, {', '.join(INDEXED_COLUMNS)}")
+                    .gt('member_id', last).order('member_id').limit(page).execute().data or [])
+            for row in rows:
+                self.index_member(row, reservations.get(row['member_id'], []))
+                seen.add(row['member_id'])
+            if len(rows) < page:
+                break
+            last = rows[-1]['member_id']
+        gone = self.universe() - seen
+        for member_id in gone:
+            self.remove_member(member_id)
+        if gone:
+            print(f"dropped {len(gone)} members no longer in supabase from the preference index")
+        return len(seen)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_preference_index():
+    """Process-wide index, or None with PREFERENCE_INDEX=off."""
+    global _shared
+    if os.getenv('PREFERENCE_INDEX', 'on').lower() == 'off':
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = PreferenceIndex()
+        return _shared
+
+
+def index_member(row: dict, reservations: list | None = None):
+    """Write hook for upsert paths: never fails the write it's following."""
+    index = shared_preference_index()
+    if index is None:
+        return
+    try:
+        index.index_member(row, reservations)
+    except sqlite3.Error as e:
+        print(f"couldn't update preference index for {row.get('member_id')}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='query members by preferences')
+    parser.add_argument('query', nargs='?', help='e.g. "dining.dietaryRestrictions.allergies = Shellfish AND arriving <= 7"')
+    parser.add_argument('--rebuild', action='store_true', help='reindex every member from supabase')
+    parser.add_argument('--values', metavar='PATH', help='list the values stored under PATH')
+    cli = parser.parse_args()
+
+    index = PreferenceIndex()
+    if cli.rebuild:
+        from clients import load_env
+        from storage import storage_client
+        load_env()
+        supabase = storage_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+        print(f"indexed {index.rebuild(supabase)} members")
+    if cli.values:
+        for value, n in index.values(cli.values):
+            print(f"{n:>6}  {value}")
+    if cli.query:
+        started = time.perf_counter()
+        ids = index.select(cli.query)
+        print(f"{len(ids)} members in {(time.perf_counter() - started) * 1000:.1f}ms")
+        for member_id in sorted(ids):
+            print(member_id)
@@ -0,0 +1,156 @@
+import os
+import re
+
+from resilience import resilient_call
+
+# Query planning for the full-feed path. Every category builds its own exa query for the same
+# LOCATION, and their result sets overlap a lot (the same TripAdvisor listing shows up for dining
+# and nightlife). The planner collects all category queries for one request, merges the ones that
+# are near-duplicates into a single search, unions and dedups the result ids, fetches every page
+# with one batched get_contents, then routes each page back to the categories it belongs to.
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {'in', 'the', 'and', 'or', 'of', 'a', 'to', 'with', 'for', 'today', 'top', 'rated'}
+
+# words that mark a page as relevant to a category even if another category's search found it
+ROUTING_TERMS = {
+    'dining': ('restaurant', 'menu', 'cuisine', 'dining', 'dinner', 'brunch', 'chef'),
+    'attractions': ('museum', 'park', 'trail', 'attraction', 'tour', 'landmark', 'gallery'),
+    'nightlife': ('bar', 'nightlife', 'live music', 'cocktail', 'lounge', 'club', 'brewery', 'wine bar'),
+    'surprise': (),  # surprise only takes what its own search turns up
+}
+MIN_ROUTING_HITS = 2
+
+MAX_MERGED_RESULTS = int(os.getenv('PLANNER_MAX_MERGED_RESULTS', '20'))
+# calibrated on the sample member: attractions/nightlife and attractions/surprise share 1 in 6 of
+# their neutral terms ("entertainment venues", "wellness activities") while dining shares none
+MERGE_THRESHOLD = float(os.getenv('PLANNER_MERGE_THRESHOLD', '0.15'))
+# optional cap on text per page; exa returns full page text when unset
+MAX_PAGE_CHARS = int(os.getenv('EXA_MAX_CHARS', '0')) or None
+
+
+class PlannedQuery:
+    """One exa search the planner will actually issue, and which categories it serves."""
+
+    def __init__(self, text: str, categories: list, num_results: int):
+        self.text = text
+        self.categories = categories
+        self.num_results = num_results
+
+    def __repr__(self):
+        return f"PlannedQuery({self.text!r}, categories={self.categories}, num_results={self.num_results})"
+
+
+def _terms(query: str, location: str) -> set:
+    location_words = set(_WORD.findall(location.lower()))
+    return {w for w in _WORD.findall(query.lower()) if w not in _STOPWORDS and w not in location_words}
+
+
+def _stem(word: str) -> str:
+    word = word.strip("'")
+    return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+
+# words that only say which category a query is for ("bars", "restaurants", "museums"). two
+# categories' queries never share these, so they're left out when deciding what to merge
+CATEGORY_WORDS = {_stem(w) for w in ROUTING_TERMS} | {
+    _stem(w) for terms in ROUTING_TERMS.values() for term in terms for w in term.split()}
+
+
+def _neutral_terms(query: str, location: str) -> set:
+    return {_stem(w) for w in _terms(query, location)} - CATEGORY_WORDS - {''}
+
+
+def _overlap(a: set, b: set) -> float:
+    # overlap coefficient rather than jaccard: the category queries are long and differ mostly in
+    # category vocabulary, so jaccard of two related queries stays under 0.1
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+
+def plan_queries(category_queries: dict, location: str, num_results: int = 10,
+                 merge_threshold: float = MERGE_THRESHOLD) -> list:
+    """
+    Group {category: query} into the searches to run. Queries whose category-neutral terms
+    overlap by at least merge_threshold become one search that asks for proportionally more results.
+    """
+    groups = []  # [neutral terms, PlannedQuery]
+    for category, query in category_queries.items():
+        terms = _neutral_terms(query, location)
+        for group in groups:
+            if _overlap(terms, group[0]) >= merge_threshold:
+                planned = group[1]
+                have = set(_WORD.findall(planned.text.lower()))
+                extra = list(dict.fromkeys(w for w in _WORD.findall(query.lower())
+                                           if w in _terms(query, location) and w not in have))
+                if extra:
+                    planned.text = f"{planned.text} {' '.join(extra)}"
+                planned.categories.append(category)
+                planned.num_results = min(MAX_MERGED_RESULTS, planned.num_results + num_results)
+                group[0] |= terms
+                break
+        else:
+            groups.append([terms, PlannedQuery(query, [category], num_results)])
+    return [planned for _, planned in groups]
+
+
+def _route(content, origin_categories: list, categories) -> list:
+    routed = list(origin_categories)
+    haystack = f"{getattr(content, 'title', '') or ''} {(content.text or '')[:4000]}".lower()
+    for category in categories:
+        if category in routed:
+            continue
+        hits = sum(1 for term in ROUTING_TERMS.get(category, ()) if term in haystack)
+        if hits >= MIN_ROUTING_HITS:
+            routed.append(category)
+    return routed
+
+
+def execute_plan(exa, plan: list, deadline=None, quota=None, debug=False):
+    """
+    Run the planned searches, fetch the deduplicated pages in one batch, and route them.
+
+    Returns (contents, routes, stats): the fetched pages, {page id: [categories]}, and
+    a dict of call/page counts for logging.
+    """
+    origins = {}  # result id -> categories whose search found it
+    stats = {'searches': 0, 'results': 0, 'unique_ids': 0, 'fetched': 0, 'chars': 0}
+    for planned in plan:
+        try:
+            results = resilient_call('exa.search', exa.search, planned.text, num_results=planned.num_results, use_autoprompt=True, deadline=deadline, quota=quota).results
+        except Exception as e:
+            print(f"exa search failed for {', '.join(planned.categories)}: {e}")
+            continue
+        stats['searches'] += 1
+        stats['results'] += len(results)
+        for result in results:
+            found = origins.setdefault(result.id, [])
+            found.extend(c for c in planned.categories if c not in found)
+
+    stats['unique_ids'] = len(origins)
+    if not origins:
+        return [], {}, stats
+
+    content_kwargs = {'text': {'max_characters': MAX_PAGE_CHARS}} if MAX_PAGE_CHARS else {}
+    contents = resilient_call('exa.get_contents', exa.get_contents, list(origins), deadline=deadline, quota=quota, **content_kwargs).results
+
+    all_categories = [c for planned in plan for c in planned.categories]
+    routes = {}
+    kept = {}  # url -> id of the copy we kept
+    unique_contents = []
+    for content in contents:
+        # the same page can come back under two ids (tracking params, redirects) - keep the first,
+        # but it still belongs to every category whose search found either copy
+        if content.url in kept:
+            tags = routes[kept[content.url]]
+            tags.extend(c for c in origins.get(content.id, []) if c not in tags)
+            continue
+        kept[content.url] = content.id
+        unique_contents.append(content)
+        routes[content.id] = _route(content, origins.get(content.id, []), all_categories)
+        stats['chars'] += len(content.text or '')
+    stats['fetched'] = len(unique_contents)
+
+    if debug:
+        print(f"    planner: {len(plan)} searches for {len(all_categories)} categories, "
+              f"{stats['results']} hits -> {stats['unique_ids']} unique ids -> {stats['fetched']} pages, {stats['chars']} chars")
+    return unique_contents, routes, stats
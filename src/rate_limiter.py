@@ -0,0 +1,241 @@
+import hashlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Process-wide rate scheduler for the exa and gemini keys every agent shares.
+# Each call takes one token from a bucket per provider, per api key and (for gemini) per model,
+# so we can run right up to the provider quota instead of bouncing off 429s that the agents'
+# except blocks then swallow. Interactive kiosk requests always go ahead of background precompute:
+# in-process they jump the wait queue, and across processes background work has to leave a
+# reserve of tokens in every bucket for interactive callers.
+#
+# set RATE_LIMIT_DB=/path/to/ratelimit.sqlite to share the buckets between processes
+# (workers, batch scripts, the serving process) on the same machine.
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = {INTERACTIVE: 0, BACKGROUND: 1}
+# longest a waiter sleeps before looking at its buckets again (a bucket with rate 0 never says when)
+MAX_WAIT_S = 5.0
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when no token became available before the caller's timeout."""
+
+
+class Limit:
+    """Refill rate (tokens per second) and burst size of one bucket."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def per_minute(cls, rpm: float, burst: float | None = None):
+        return cls(rpm / 60.0, burst if burst is not None else max(1.0, rpm / 10.0))
+
+
+PROVIDER_LIMITS = {
+    'exa': Limit(float(os.getenv('EXA_RPS', '5')), float(os.getenv('EXA_BURST', '10'))),
+    'gemini': Limit.per_minute(float(os.getenv('GEMINI_RPM', '60'))),
+}
+
+# per-key overrides, keyed by key_fingerprint(); keys without an entry use the provider limit
+KEY_LIMITS: dict[str, Limit] = {}
+
+MODEL_LIMITS = {
+    'gemini-pro-latest': Limit.per_minute(float(os.getenv('GEMINI_PRO_RPM', '60'))),
+    os.getenv('GEMINI_FAST_MODEL', 'gemini-flash-latest'): Limit.per_minute(float(os.getenv('GEMINI_FAST_RPM', '300'))),
+}
+
+
+def key_fingerprint(api_key: str | None) -> str:
+    # bucket names end up in the sqlite file, so never store the raw key
+    if not api_key:
+        return 'default'
+    return hashlib.sha256(api_key.encode('utf8')).hexdigest()[:12]
+
+
+class Quota:
+    """Who is asking: which api key, which model, and how urgently."""
+
+    def __init__(self, key: str | None = None, model: str | None = None, priority: str = INTERACTIVE):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority: {priority}")
+        self.key = key
+        self.model = model
+        self.priority = priority
+
+
+class MemoryBuckets:
+    """Token buckets held in this process."""
+
+    def __init__(self):
+        self._state = {}  # name -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, specs, reserve: float) -> float:
+        """Take one token from every bucket in specs, or return seconds until that could succeed."""
+        with self._lock:
+            now = time.time()
+            levels = {}
+            for name, limit in specs:
+                tokens, updated = self._state.get(name, (limit.burst, now))
+                levels[name] = min(limit.burst, tokens + (now - updated) * limit.rate)
+            wait = _wait_for(specs, levels, reserve)
+            if wait == 0:
+                for name, _ in specs:
+                    levels[name] -= 1
+            for name in levels:
+                self._state[name] = (levels[name], now)
+            return wait
+
+    def drain(self, specs, seconds: float):
+        with self._lock:
+            now = time.time()
+            for name, limit in specs:
+                self._state[name] = (-limit.rate * seconds, now)
+
+
+class SqliteBuckets:
+    """Token buckets in a local sqlite file so several processes share one quota."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, specs, reserve: float) -> float:
+        conn = self._conn()
+        # BEGIN IMMEDIATE grabs the write lock up front, so read-refill-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            levels = {}
+            for name, limit in specs:
+                row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+                tokens, updated = row if row else (limit.burst, now)
+                levels[name] = min(limit.burst, tokens + (now - updated) * limit.rate)
+            wait = _wait_for(specs, levels, reserve)
+            if wait == 0:
+                for name, _ in specs:
+                    levels[name] -= 1
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                [(name, tokens, now) for name, tokens in levels.items()],
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def drain(self, specs, seconds: float):
+        conn = self._conn()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+            [(name, -limit.rate * seconds, now) for name, limit in specs],
+        )
+
+
+def _wait_for(specs, levels, reserve: float) -> float:
+    # 0 if every bucket can give a token (keeping `reserve` of its burst untouched), else the longest refill wait
+    wait = 0.0
+    for name, limit in specs:
+        # never ask for more than the bucket can hold, or tiny buckets would starve background work
+        needed = min(limit.burst, 1.0 + reserve * limit.burst) if reserve else 1.0
+        if levels[name] < needed:
+            wait = max(wait, (needed - levels[name]) / limit.rate if limit.rate > 0 else float('inf'))
+    return wait
+
+
+class RateScheduler:
+    """Hands out upstream call tokens in priority order."""
+
+    def __init__(self, backend=None, background_reserve: float = 0.2):
+        self.backend = backend or MemoryBuckets()
+        self.background_reserve = background_reserve
+        self._cond = threading.Condition()
+        # (provider, bucket names) -> heap of (priority, seq). one queue per bucket set, so a caller
+        # stuck on an empty pro-model or per-key bucket doesn't hold up callers whose buckets have tokens
+        self._waiters = {}
+        self._seq = itertools.count()
+
+    def _specs(self, provider: str, quota: Quota):
+        provider_limit = PROVIDER_LIMITS[provider]
+        fingerprint = key_fingerprint(quota.key)
+        specs = [
+            (provider, provider_limit),
+            (f"{provider}:key:{fingerprint}", KEY_LIMITS.get(fingerprint, provider_limit)),
+        ]
+        if quota.model and quota.model in MODEL_LIMITS:
+            specs.append((f"{provider}:model:{quota.model}", MODEL_LIMITS[quota.model]))
+        return specs
+
+    def _reserve(self, quota: Quota) -> float:
+        return self.background_reserve if quota.priority == BACKGROUND else 0.0
+
+    def _outranked(self, provider: str, priority: int) -> bool:
+        # interactive callers queued on any of the provider's bucket sets go before background ones
+        return any(heap and heap[0][0] < priority for (name, _), heap in self._waiters.items() if name == provider)
+
+    def acquire(self, provider: str, quota: Quota, timeout: float | None = None):
+        """Block until a token is available for this call; raises RateLimitTimeout after timeout seconds."""
+        specs = self._specs(provider, quota)
+        reserve = self._reserve(quota)
+        ticket = (PRIORITIES[quota.priority], next(self._seq))
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+
+        with self._cond:
+            queue = (provider, tuple(name for name, _ in specs))
+            heap = self._waiters.setdefault(queue, [])
+            heapq.heappush(heap, ticket)
+            try:
+                while True:
+                    wait = None
+                    if heap[0] == ticket and not self._outranked(provider, ticket[0]):
+                        wait = min(self.backend.take(specs, reserve), MAX_WAIT_S)
+                        if wait == 0:
+                            return
+                    if give_up_at is not None:
+                        remaining = give_up_at - time.monotonic()
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"no {provider} quota available within {timeout:.1f}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                heap.remove(ticket)
+                heapq.heapify(heap)
+                if not heap:
+                    del self._waiters[queue]
+                self._cond.notify_all()
+
+    def try_acquire(self, provider: str, quota: Quota) -> bool:
+        """Take a token only if one is free right now and nobody is queued ahead (used for hedges)."""
+        with self._cond:
+            if any(name == provider for name, _ in self._waiters):
+                return False
+            return self.backend.take(self._specs(provider, quota), self._reserve(quota)) == 0
+
+    def drain(self, provider: str, quota: Quota, seconds: float = 5.0):
+        """The provider told us to slow down (429) - empty the buckets so everyone backs off."""
+        with self._cond:
+            self.backend.drain(self._specs(provider, quota), seconds)
+
+
+_db_path = os.getenv('RATE_LIMIT_DB')
+SCHEDULER = RateScheduler(SqliteBuckets(_db_path) if _db_path else MemoryBuckets())
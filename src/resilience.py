@@ -0,0 +1,298 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from rate_limiter import SCHEDULER, Quota
+from ledger import charge_call, current_run
+
+# Resilience layer for the upstream calls the agents make (exa.search, exa.get_contents,
+# gemini generate_content). Every call gets a deadline carved out of the overall request
+# budget, retryable errors get retried with jittered backoff, slow calls get a hedged
+# duplicate after the op's observed p95, and a circuit breaker per provider fails fast
+# when the upstream is down instead of making the kiosk wait for a timeout every time.
+#
+# usage (inside an agent):
+#   deadline = Deadline(self.request_budget)
+#   results = resilient_call('exa.search', self.exa.search, query, num_results=10, deadline=deadline,
+#                            quota=Quota(key=exa_key, priority=priority))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the request budget runs out before (or during) an upstream call."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker for a provider is open and the call is skipped."""
+
+
+class Deadline:
+    """Overall time budget for one request, shared by every upstream call it makes."""
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout_for(self, cap: float | None = None) -> float:
+        # per-call timeout = whatever is left of the budget, capped by the op's own limit
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"request budget of {self.budget_s:.1f}s exhausted")
+        return min(remaining, cap) if cap else remaining
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker, one per upstream provider."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                # let exactly one trial call through to see if the upstream is back
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        # an allowed call that never reached the upstream (deadline, quota) hands its trial back
+        with self._lock:
+            if self.state == 'half_open':
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class OpPolicy:
+    """Per-operation knobs: timeout cap, retry/backoff and hedging."""
+
+    def __init__(self, provider: str, timeout: float, max_attempts: int = 3, base_backoff: float = 0.5,
+                 max_backoff: float = 8.0, hedge: bool = True, hedge_percentile: float = 95.0,
+                 min_hedge_delay: float = 0.25):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.latency = LatencyTracker()
+
+    def hedge_delay(self) -> float | None:
+        if not self.hedge:
+            return None
+        p = self.latency.percentile(self.hedge_percentile)
+        return None if p is None else max(p, self.min_hedge_delay)
+
+    def backoff(self, attempt: int) -> float:
+        # "full jitter" backoff so a burst of failing kiosks doesn't retry in lockstep
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+
+BREAKERS = {
+    'exa': CircuitBreaker('exa'),
+    'gemini': CircuitBreaker('gemini'),
+}
+
+POLICIES = {
+    'exa.search': OpPolicy('exa', timeout=float(os.getenv('EXA_SEARCH_TIMEOUT_S', '10'))),
+    'exa.get_contents': OpPolicy('exa', timeout=float(os.getenv('EXA_CONTENTS_TIMEOUT_S', '20'))),
+    # gemini calls are expensive, so only hedge once we're well into the tail
+    'gemini.generate': OpPolicy('gemini', timeout=float(os.getenv('GEMINI_TIMEOUT_S', '60')),
+                                max_attempts=2, hedge_percentile=99.0),
+    # the fast model (see model_router.py) is cheap enough to hedge at the usual p95
+    'gemini.generate.fast': OpPolicy('gemini', timeout=float(os.getenv('GEMINI_FAST_TIMEOUT_S', '30')),
+                                     max_attempts=2),
+}
+
+# sdk calls are blocking, so they run on a shared pool and the caller waits with a timeout.
+# a timed-out/hedged-away call keeps running in the background - nobody waits on it, but it is
+# still charged to its run when it finishes.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('UPSTREAM_WORKERS', '16')),
+                               thread_name_prefix='upstream')
+
+_RETRYABLE_NAMES = {
+    'TimeoutError', 'ConnectionError', 'ConnectTimeout', 'ReadTimeout', 'RemoteDisconnected',
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+    'TooManyRequests', 'BadGateway', 'GatewayTimeout',
+}
+_RETRYABLE_STATUS = re.compile(r'\b(408|429|5\d\d)\b')
+_THROTTLE_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Best-effort check for transient upstream errors without importing the SDKs."""
+    if isinstance(exc, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in _RETRYABLE_NAMES for cls in type(exc).__mro__):
+        return True
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    if status is None and getattr(exc, 'response', None) is not None:
+        status = getattr(exc.response, 'status_code', None)
+    if isinstance(status, int):
+        return status in (408, 429) or 500 <= status < 600
+    return bool(_RETRYABLE_STATUS.search(str(exc)))
+
+
+def is_throttled(exc: BaseException) -> bool:
+    """True if the upstream rejected the call for exceeding its rate limit."""
+    if any(cls.__name__ in _THROTTLE_NAMES for cls in type(exc).__mro__):
+        return True
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    return status == 429 or (status is None and '429' in str(exc))
+
+
+def _attempt(policy: OpPolicy, fn, args, kwargs, timeout: float, can_hedge, charge):
+    # one logical attempt: the original call plus (maybe) one hedged duplicate.
+    # charge(future) bills each call once it has finished
+    start = time.monotonic()
+    end = start + timeout
+    hedge_at = policy.hedge_delay()
+    pending = {_executor.submit(fn, *args, **kwargs)}
+    hedged = False
+    first_error = None
+
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= end:
+                raise TimeoutError(f"upstream call timed out after {timeout:.1f}s")
+            wait_for = end - now
+            if hedge_at is not None and not hedged:
+                wait_for = min(wait_for, max(0.0, start + hedge_at - now))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                charge(future)
+            for future in done:
+                if future.exception() is None:
+                    policy.latency.record(time.monotonic() - start)
+                    return future.result()
+                first_error = first_error or future.exception()
+
+            if hedge_at is not None and not hedged and time.monotonic() >= start + hedge_at:
+                # the duplicate costs quota too, so only hedge if a token is free right now
+                if can_hedge():
+                    pending.add(_executor.submit(fn, *args, **kwargs))
+                hedged = True
+
+        raise first_error
+    finally:
+        # timed out, or the hedge that lost: still billed by the provider whenever it finishes
+        for future in pending:
+            future.add_done_callback(charge)
+
+
+def resilient_call(op: str, fn, *args, deadline: Deadline | None = None, quota: Quota | None = None, **kwargs):
+    """
+    Call fn(*args, **kwargs) under the policy registered for op ('exa.search', ...).
+    Every attempt first takes a token from the shared rate scheduler for quota.
+    Raises DeadlineExceeded, CircuitOpenError, RateLimitTimeout or the last upstream error.
+    """
+    policy = POLICIES[op]
+    breaker = BREAKERS[policy.provider]
+    quota = quota or Quota()
+    last_error = None
+    run = current_run()  # the callbacks below run on the pool's threads, outside this context
+
+    def charge(future):
+        # every submitted call is charged: the winner, a hedged duplicate, a failed attempt.
+        # a throttled call was rejected before any work was done, so it costs nothing
+        error = future.exception()
+        if error is None or not is_throttled(error):
+            charge_call(op, args, None if error else future.result(), quota.model, run)
+
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{policy.provider} circuit is open, skipping {op}")
+        try:
+            SCHEDULER.acquire(policy.provider, quota, timeout=deadline.timeout_for() if deadline else None)
+            timeout = deadline.timeout_for(policy.timeout) if deadline else policy.timeout
+        except BaseException:
+            # otherwise a half-open breaker keeps waiting on a trial that never ran
+            breaker.release()
+            raise
+
+        try:
+            result = _attempt(policy, fn, args, kwargs, timeout,
+                              can_hedge=lambda: SCHEDULER.try_acquire(policy.provider, quota), charge=charge)
+        except Exception as e:
+            if not is_retryable(e):
+                # the upstream answered (e.g. a 400), so it's alive - don't trip the breaker
+                breaker.record_success()
+                raise
+            if is_throttled(e):
+                # we're over quota somewhere (another process, another tool) - make everyone back off
+                SCHEDULER.drain(policy.provider, quota)
+            breaker.record_failure()
+            last_error = e
+            if attempt + 1 >= policy.max_attempts:
+                break
+            delay = policy.backoff(attempt)
+            if deadline and deadline.remaining() <= delay:
+                break
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
+
+    raise last_error
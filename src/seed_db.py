@@ -2,6 +2,7 @@ import os
 import json
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from preference_index import index_member
 
 load_dotenv()
 
@@ -81,6 +82,13 @@ def seed_database():
         # Insert the transformed record into the members table
         response = supabase.table('members').insert(member_record).execute()
         print(f"Successfully seeded member data for {member_id} to Supabase.")
+        # keep the local preference index (preference_index.py) in step with the new member
+        index_member(member_record, [{
+            'confirmation_number': r.get('confirmationNumber'),
+            'property': r.get('property'),
+            'check_in': r.get('checkIn'),
+            'check_out': r.get('checkOut'),
+        } for r in user_data.get('upcomingReservations', [])])
         
     except Exception as e:
         print(f"Error inserting data into Supabase: {e}")
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from rate_limiter import BACKGROUND
+from fingerprint import model_fingerprints, latest_row, age_seconds, parse_timestamp
+from jobqueue import JobQueue, enqueue_recommendations
+from model_router import ROUTER
+
+# Stale-while-revalidate serving for the kiosk. A category tap used to mean a full synchronous
+# exa+gemini run. serve() instead answers from the newest stored recommendations row right away,
+# even if it's past its freshness window or was built from older preferences, and kicks off a
+# background refresh so the next tap gets the new set. Only when nothing is stored at all does it
+# run the pipeline live, and then only for as long as the latency SLO allows - if the run doesn't
+# finish in time the kiosk gets an empty "pending" response and the run keeps going and saves.
+#
+# usage:
+#   result = serve(DiningAgent(), member_id)
+#   result['recommendations'], result['source'], result['stale'], result['age_s'], ...
+
+FRESH_FOR_S = float(os.getenv('SERVE_FRESH_FOR_S', str(6 * 3600)))   # rows younger than this don't refresh
+SERVE_SLO_S = float(os.getenv('SERVE_SLO_S', '8'))                    # max wait for a live run on a cache miss
+REFRESH_WORKERS = int(os.getenv('SERVE_REFRESH_WORKERS', '4'))
+
+_refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='serve-refresh')
+_live_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='serve-live')
+_refreshing = set()  # (member_id, category, location) with a refresh already queued
+_refreshing_lock = threading.Lock()
+_live_inflight = 0   # live runs submitted and not finished yet, including ones nobody waits on anymore
+
+# with JOB_QUEUE_DB set, refreshes go to the durable job queue instead of this process's pool
+_job_queue = JobQueue(os.getenv('JOB_QUEUE_DB')) if os.getenv('JOB_QUEUE_DB') else None
+
+
+def _response(recommendations, source, stale=False, age=None, generated_at=None, refreshing=False, fingerprint_match=None, started=None):
+    return {
+        'recommendations': recommendations or [],
+        'source': source,                    # 'cache' | 'live' | 'pending' | 'none'
+        'stale': stale,                      # True if older than the freshness window or built from old prefs
+        'age_s': round(age, 1) if age is not None else None,
+        'generated_at': generated_at,
+        'refreshing': refreshing,            # a background refresh is running for this key
+        'fingerprint_match': fingerprint_match,
+        'served_in_ms': round((time.monotonic() - started) * 1000, 1) if started else None,
+    }
+
+
+def _run_refresh(agent, member_id, key):
+    try:
+        agent.get_recommendations(member_id, priority=BACKGROUND, location=key[2])
+    except Exception as e:
+        print(f"background refresh failed for {key}: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def schedule_refresh(agent, member_id, location=None) -> bool:
+    """Queue a background regeneration for this member/category unless one is already queued."""
+    if _job_queue is not None:
+        # durable path: a worker process picks it up, and the queue dedupes repeat taps
+        try:
+            enqueue_recommendations(_job_queue, member_id, agent.category, location=location)
+            return True
+        except Exception as e:
+            print(f"couldn't enqueue refresh, running it in-process: {e}")
+    key = (member_id, agent.category, location or agent.location)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return True
+        _refreshing.add(key)
+    _refresh_pool.submit(_run_refresh, agent, member_id, key)
+    return True
+
+
+def is_refreshing(agent, member_id, location=None) -> bool:
+    with _refreshing_lock:
+        return (member_id, agent.category, location or agent.location) in _refreshing
+
+
+def backlog() -> dict:
+    """Live runs in flight and refreshes queued in this process (for admission control upstream)."""
+    with _refreshing_lock:
+        return {'live': _live_inflight, 'refresh': len(_refreshing)}
+
+
+def _submit_live(agent, member_id, location):
+    global _live_inflight
+    with _refreshing_lock:
+        _live_inflight += 1
+    live = _live_pool.submit(agent.get_recommendations, member_id, location=location)
+    live.add_done_callback(_live_done)
+    return live
+
+
+def _live_done(_):
+    global _live_inflight
+    with _refreshing_lock:
+        _live_inflight -= 1
+
+
+def serve(agent, member_id, fresh_for: float = FRESH_FOR_S, slo_s: float = SERVE_SLO_S, location=None) -> dict:
+    """
+    Latest stored recommendations for one agent's category, immediately, plus freshness metadata.
+    Stale or out-of-date rows are still served and trigger a background refresh. On a miss, a live
+    run is attempted only if slo_s > 0, and waited on for at most slo_s seconds.
+    """
+    started = time.monotonic()
+    location = location or agent.location
+    if not agent.supabase:
+        print("Supabase client not initialized")
+        return _response([], 'none', started=started)
+
+    try:
+        member = agent.supabase.table('members').select(agent.member_columns).eq('member_id', member_id).execute()
+        if not member.data:
+            print(f"No member found with ID: {member_id}")
+            return _response([], 'none', started=started)
+        fingerprints = model_fingerprints(agent.category, agent._prefs_from_row(member.data[0]), location, ROUTER.choices())
+        row = latest_row(agent.supabase, member_id, agent.category, location)
+    except Exception as e:
+        print(f"Error reading saved recommendations: {e}")
+        return _response([], 'none', started=started)
+
+    if row and row.get('description'):
+        age = age_seconds(row)
+        matches = row.get('fingerprint') in fingerprints.values()
+        stale = not matches or age is None or age > fresh_for
+        refreshing = schedule_refresh(agent, member_id, location) if stale else is_refreshing(agent, member_id, location)
+        created = parse_timestamp(row.get('created_at'))
+        return _response(row['description'], 'cache', stale=stale, age=age,
+                         generated_at=created.isoformat() if created else None,
+                         refreshing=refreshing, fingerprint_match=matches, started=started)
+
+    # nothing stored: the only choice is to generate, but never hold the kiosk past the SLO
+    remaining = slo_s - (time.monotonic() - started)
+    if remaining <= 0:
+        schedule_refresh(agent, member_id, location)
+        return _response([], 'pending', refreshing=True, started=started)
+
+    live = _submit_live(agent, member_id, location)
+    try:
+        recommendations = live.result(timeout=remaining)
+    except FutureTimeout:
+        # the run keeps going on the pool and saves its row; the next tap will find it
+        print(f"live {agent.category} run exceeded the {slo_s:.1f}s SLO, returning pending")
+        return _response([], 'pending', refreshing=True, started=started)
+    except Exception as e:
+        print(f"live {agent.category} run failed: {e}")
+        return _response([], 'none', started=started)
+    return _response(recommendations, 'live' if recommendations else 'none', age=0.0 if recommendations else None,
+                     fingerprint_match=True if recommendations else None, started=started)
+
+
+if __name__ == "__main__":
+    from dining_agent import DiningAgent
+
+    result = serve(DiningAgent(), "MB789456123")
+    print(f"{result['source']} ({'stale' if result['stale'] else 'fresh'}, age {result['age_s']}s, "
+          f"served in {result['served_in_ms']}ms, refreshing={result['refreshing']})")
+    for i, r in enumerate(result['recommendations'], 1):
+        print(f"{i}. {r.get('name', 'N/A')}")
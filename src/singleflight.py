@@ -0,0 +1,157 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Single-flight coalescing for recommendation runs. Two kiosks (or one double tap) asking for the
+# same member/category/location at once used to run the whole exa+gemini pipeline twice and insert
+# two recommendations rows. Now the first caller for a key leads and everyone else who arrives
+# while it's in flight waits for the leader's result instead of starting their own run.
+#
+# In-process this is a dict of in-flight calls. Across processes (several kiosk servers on one
+# box) set SINGLEFLIGHT_DB to a local sqlite file: the leader takes a leased row in an inflight
+# table, and a process that finds the row taken waits for it to go away and then reads the row the
+# other process saved (via the follower callback) instead of generating again.
+#
+# usage:
+#   return FLIGHTS.do((member_id, category, location), generate, follower=load_saved)
+
+LEASE_S = float(os.getenv('SINGLEFLIGHT_LEASE_S', '180'))  # lock outlives a crashed leader by at most this
+POLL_S = 0.25
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SqliteLocks:
+    """Leased per-key locks in a local sqlite file, shared by every process on the box."""
+
+    def __init__(self, path: str, lease_s: float = LEASE_S):
+        self.path = path
+        self.lease_s = lease_s
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # an expired lease means its leader died mid-run; take it over
+            conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at < ?", (key, now))
+            taken = conn.execute("INSERT OR IGNORE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                                 (key, self.owner, now + self.lease_s)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return taken == 1
+
+    def release(self, key: str):
+        self._conn().execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def held(self, key: str) -> bool:
+        row = self._conn().execute("SELECT expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+        return bool(row) and row[0] >= time.time()
+
+
+class SingleFlight:
+    """One in-flight computation per key; concurrent callers for the key share its result."""
+
+    def __init__(self, locks: SqliteLocks | None = None, wait_s: float = LEASE_S):
+        self.locks = locks
+        self.wait_s = wait_s
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0, 'cross_process': 0}
+
+    def do(self, key, fn, follower=None):
+        """
+        Run fn() once for everyone asking for key at the same time. follower() is used when
+        another *process* holds the key: it should return that process's saved result, or None
+        to fall back to computing it here.
+        """
+        key = '|'.join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats['leaders'] += 1
+            else:
+                call.followers += 1
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn, follower)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lead(self, key, fn, follower):
+        if self.locks is None:
+            return fn()
+        # the lock table is an optimization, never a reason to fail the request: any sqlite error
+        # (locked past its timeout, disk full, file gone) means we just run it here
+        acquired = self._try(self.locks.acquire, key)
+        if acquired is None:
+            return fn()
+
+        if not acquired:
+            self.stats['cross_process'] += 1
+            give_up = time.monotonic() + self.wait_s
+            while time.monotonic() < give_up and self._try(self.locks.held, key):
+                time.sleep(POLL_S)
+            result = follower() if follower else None
+            if result:
+                return result
+            # the other process failed (or left nothing usable) - compute it ourselves
+            acquired = self._try(self.locks.acquire, key)
+
+        try:
+            return fn()
+        finally:
+            if acquired:
+                self._try(self.locks.release, key)
+
+    def _try(self, op, key):
+        try:
+            return op(key)
+        except sqlite3.Error as e:
+            print(f"single-flight lock unavailable, running anyway: {e}")
+            return None
+
+def _shared_flights():
+    path = os.getenv('SINGLEFLIGHT_DB')
+    return SingleFlight(SqliteLocks(path) if path else None)
+
+
+# one per process, shared by every agent
+FLIGHTS = _shared_flights()
@@ -0,0 +1,431 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from clients import lazy, supabase_client
+
+# Storage layer for members and recommendations. Every agent read used to be a round trip to the
+# remote supabase project; now agents talk to a MirroredClient that looks like the supabase client
+# (table().select().eq().order().limit().execute() etc.) but:
+#   - serves reads of `members` and `recommendations` from a local sqlite mirror
+#   - sends writes (insert/upsert/delete) to supabase first, then applies what supabase returned
+#     to the mirror, so this kiosk reads its own writes immediately
+#   - pulls writes made elsewhere (other kiosks, the seeder, the app) in a periodic sync
+# every other table goes straight to supabase.
+#
+# STORAGE_BACKEND=fake swaps supabase for FakeSupabase, an in-memory implementation of the same
+# query surface, so agents / serving / cohorts run fully offline.
+# STORAGE_MIRROR=off goes back to talking to supabase directly.
+
+MIRROR_DB = os.getenv('STORAGE_MIRROR_DB', 'mirror.sqlite')
+SYNC_INTERVAL_S = float(os.getenv('STORAGE_SYNC_INTERVAL_S', '60'))
+SYNC_PAGE = 1000
+
+MIRRORED_TABLES = {'members': 'member_id', 'recommendations': 'id'}
+
+
+class Result:
+    """What .execute() returns - same .data shape as the supabase client."""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class Query:
+    """Records a supabase-style query so a backend can run it (or replay it on the real client)."""
+
+    def __init__(self, backend, table):
+        self.backend = backend
+        self.table = table
+        self.op = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []   # (op, column, value)
+        self.orders = []    # (column, desc)
+        self.limit_n = None
+        self.single_row = False
+
+    def select(self, columns='*'):
+        self.op, self.columns = 'select', columns
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict=None):
+        self.op, self.payload, self.on_conflict = 'upsert', payload, on_conflict
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(('eq', column, value))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(('in', column, list(values)))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(('gt', column, value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(('gte', column, value))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        return self.backend._run(self)
+
+    def replay(self, client):
+        """Build the same query on a real supabase client and execute it there."""
+        builder = client.table(self.table)
+        if self.op == 'select':
+            builder = builder.select(self.columns)
+        elif self.op == 'insert':
+            builder = builder.insert(self.payload)
+        elif self.op == 'upsert':
+            builder = builder.upsert(self.payload, on_conflict=self.on_conflict) if self.on_conflict else builder.upsert(self.payload)
+        elif self.op == 'delete':
+            builder = builder.delete()
+        for op, column, value in self.filters:
+            builder = getattr(builder, 'in_' if op == 'in' else op)(column, value)
+        for column, desc in self.orders:
+            builder = builder.order(column, desc=desc)
+        if self.limit_n is not None:
+            builder = builder.limit(self.limit_n)
+        if self.single_row:
+            builder = builder.single()
+        return builder.execute()
+
+
+# --- shared row helpers (both backends filter/sort rows the same way) ---
+
+def _matches(row, filters):
+    for op, column, value in filters:
+        current = row.get(column)
+        if op == 'eq' and current != value:
+            return False
+        if op == 'in' and current not in value:
+            return False
+        if op in ('gt', 'gte') and (current is None or (current <= value if op == 'gt' else current < value)):
+            return False
+    return True
+
+
+def _shape(rows, query):
+    for column, desc in reversed(query.orders):
+        rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+    if query.limit_n is not None:
+        rows = rows[:query.limit_n]
+    if query.columns and query.columns.strip() != '*':
+        wanted = [column.strip() for column in query.columns.split(',')]
+        rows = [{column: row.get(column) for column in wanted} for row in rows]
+    if query.single_row:
+        if len(rows) != 1:
+            raise LookupError(f"expected one {query.table} row, got {len(rows)}")
+        return Result(rows[0])
+    return Result(rows)
+
+
+def keyset_pages(client, table: str, column: str, key: str, after=(None, None), columns: str = '*',
+                 page: int | None = None):
+    """
+    Pages of rows ordered by (column, key), strictly after the `after` = (column, key) watermark.
+    Rows that share the watermark's column value are drained first (eq + gt key), then everything
+    past it, so neither a row-count cap nor a burst of rows written in the same instant loses any.
+    """
+    page = page or SYNC_PAGE
+    last_value, last_key = after
+    while True:
+        rows = []
+        if last_value is not None and last_key is not None:
+            rows = (client.table(table).select(columns).eq(column, last_value).gt(key, last_key)
+                    .order(key).limit(page).execute().data or [])
+        if len(rows) < page:
+            query = client.table(table).select(columns)
+            if last_value is not None:
+                query = query.gt(column, last_value)
+            rows += query.order(column).order(key).limit(page - len(rows)).execute().data or []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page or rows[-1].get(column) is None:
+            return  # done, or into rows without a value for column, which can't be paged past
+        last_value, last_key = rows[-1][column], rows[-1][key]
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeSupabase:
+    """In-memory stand-in for the supabase client (members, recommendations and any other table)."""
+
+    def __init__(self, tables=None):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls = 0  # round trips, so tests can check the mirror actually saves them
+
+    def table(self, name):
+        return Query(self, name)
+
+    def _run(self, query):
+        with self._lock:
+            self.calls += 1
+            rows = self.tables.setdefault(query.table, [])
+            if query.op == 'select':
+                return _shape([dict(row) for row in rows if _matches(row, query.filters)], query)
+            if query.op == 'delete':
+                removed = [row for row in rows if _matches(row, query.filters)]
+                self.tables[query.table] = [row for row in rows if not _matches(row, query.filters)]
+                return Result(removed)
+            payload = query.payload if isinstance(query.payload, list) else [query.payload]
+            written = []
+            for item in payload:
+                row = dict(item)
+                if query.op == 'upsert':
+                    key = query.on_conflict or MIRRORED_TABLES.get(query.table, 'id')
+                    existing = next((r for r in rows if r.get(key) == row.get(key)), None)
+                    if existing is not None:
+                        existing.update(row)
+                        written.append(dict(existing))
+                        continue
+                row.setdefault('id', next(self._ids))
+                row.setdefault('created_at', _now_iso())
+                rows.append(row)
+                written.append(dict(row))
+            return Result(written)
+
+
+class LocalMirror:
+    """sqlite copy of the mirrored tables: one json row per key, plus the columns we filter on."""
+
+    def __init__(self, path: str = MIRROR_DB):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS members (member_id TEXT PRIMARY KEY, row TEXT NOT NULL, synced_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS recommendations (
+                id TEXT PRIMARY KEY, member_id TEXT, category TEXT, location TEXT, created_at TEXT, row TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS recommendations_latest ON recommendations (member_id, category, location, created_at);
+            CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def select(self, query) -> Result:
+        conn = self._conn()
+        # narrow with the indexed key when the query has one, the rest is filtered in python
+        key = MIRRORED_TABLES[query.table] if query.table == 'members' else 'member_id'
+        pinned = next((value for op, column, value in query.filters if op == 'eq' and column == key), None)
+        if pinned is not None:
+            raw = conn.execute(f"SELECT row FROM {query.table} WHERE {key} = ?", (str(pinned),)).fetchall()
+        else:
+            raw = conn.execute(f"SELECT row FROM {query.table}").fetchall()
+        rows = [json.loads(r[0]) for r in raw]
+        return _shape([row for row in rows if _matches(row, query.filters)], query)
+
+    def has(self, table, member_id) -> bool:
+        key = MIRRORED_TABLES[table] if table == 'members' else 'member_id'
+        return self._conn().execute(f"SELECT 1 FROM {table} WHERE {key} = ? LIMIT 1", (str(member_id),)).fetchone() is not None
+
+    def apply(self, table, rows):
+        """Write rows exactly as supabase returned them."""
+        conn = self._conn()
+        now = time.time()
+        for row in rows or []:
+            if table == 'members':
+                conn.execute("INSERT OR REPLACE INTO members (member_id, row, synced_at) VALUES (?, ?, ?)",
+                             (str(row['member_id']), json.dumps(row, default=str), now))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO recommendations (id, member_id, category, location, created_at, row) VALUES (?, ?, ?, ?, ?, ?)",
+                    (str(row['id']), row.get('member_id'), row.get('category'), row.get('location'),
+                     str(row.get('created_at') or ''), json.dumps(row, default=str)),
+                )
+
+    def remove(self, table, rows):
+        key = MIRRORED_TABLES[table]
+        self._conn().executemany(f"DELETE FROM {table} WHERE {key} = ?", [(str(row[key]),) for row in rows or []])
+
+    def get_state(self, name, default=None):
+        row = self._conn().execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, name, value):
+        self._conn().execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, str(value)))
+
+
+class MirroredClient:
+    """Supabase-client lookalike: local reads, write-through writes, periodic pull of remote changes."""
+
+    def __init__(self, remote, mirror: LocalMirror):
+        self.remote = remote
+        self.mirror = mirror
+        self._sync_thread = None
+        self._stop = threading.Event()
+        self._pulled = set()  # (table, member_id) already read through from supabase
+
+    def table(self, name):
+        return Query(self, name)
+
+    def _run(self, query):
+        if query.table not in MIRRORED_TABLES:
+            return query.replay(self.remote)
+
+        if query.op == 'select':
+            member_id = self._pinned_member(query)
+            if member_id is not None and not self._covered(query.table, member_id):
+                # member we haven't seen locally yet (new, or the first sync hasn't finished) - read through once
+                self._pull_member(query.table, member_id)
+            return self.mirror.select(query)
+
+        result = query.replay(self.remote)
+        try:
+            if query.op == 'delete':
+                self.mirror.remove(query.table, result.data)
+            else:
+                self.mirror.apply(query.table, result.data if isinstance(result.data, list) else [result.data])
+        except (sqlite3.Error, KeyError) as e:
+            # the remote write went through; the next sync brings the mirror back in line
+            print(f"mirror write failed for {query.table}: {e}")
+        return result
+
+    @staticmethod
+    def _pinned_member(query):
+        key = MIRRORED_TABLES[query.table] if query.table == 'members' else 'member_id'
+        return next((value for op, column, value in query.filters if op == 'eq' and column == key), None)
+
+    def _covered(self, table, member_id) -> bool:
+        if (table, member_id) in self._pulled:
+            return True
+        if table == 'recommendations' and self.mirror.get_state('synced'):
+            return True  # a full sync has run, so an empty local answer is the real answer
+        return self.mirror.has(table, member_id)
+
+    def _pull_member(self, table, member_id):
+        key = MIRRORED_TABLES[table] if table == 'members' else 'member_id'
+        rows = self.remote.table(table).select('*').eq(key, member_id).execute().data
+        self.mirror.apply(table, rows)
+        self._pulled.add((table, member_id))
+
+    def sync(self) -> dict:
+        """Pull recommendations written since the last sync and every member, a page at a time."""
+        # recommendations are insert-only: compound watermark on the last (created_at, id) pulled, so
+        # rows sharing a timestamp aren't skipped. mirrors synced before this only have created_at
+        state = json.loads(self.mirror.get_state('recommendations.watermark', 'null'))
+        if state is None:
+            state = [self.mirror.get_state('recommendations.created_at') or None, None]
+        pulled = {'recommendations': 0, 'members': 0}
+        for rows in keyset_pages(self.remote, 'recommendations', 'created_at', 'id', after=tuple(state)):
+            self.mirror.apply('recommendations', rows)
+            pulled['recommendations'] += len(rows)
+            self.mirror.set_state('recommendations.watermark', json.dumps([rows[-1].get('created_at'), rows[-1]['id']], default=str))
+
+        # members are upserted in place (the app, seed_db, other kiosks) and member_row sets no
+        # timestamp to page on, so every sync walks the whole table by member_id
+        last = ''
+        while True:
+            rows = (self.remote.table('members').select('*').gt('member_id', last).order('member_id')
+                    .limit(SYNC_PAGE).execute().data or [])
+            self.mirror.apply('members', rows)
+            pulled['members'] += len(rows)
+            if len(rows) < SYNC_PAGE:
+                break
+            last = rows[-1]['member_id']
+        self.mirror.set_state('synced', time.time())
+        return pulled
+
+    def start_sync(self, interval_s: float = SYNC_INTERVAL_S):
+        """Background thread that keeps the mirror up to date with writes made elsewhere."""
+        if self._sync_thread is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"mirror sync failed: {e}")
+                self._stop.wait(interval_s)
+
+        self._sync_thread = threading.Thread(target=loop, name='mirror-sync', daemon=True)
+        self._sync_thread.start()
+
+    def stop_sync(self):
+        self._stop.set()
+
+
+_clients = {}
+_mirrors = {}
+_clients_lock = threading.RLock()
+
+
+def shared_mirror(path: str = MIRROR_DB) -> LocalMirror | None:
+    """The process's LocalMirror for path (None with STORAGE_MIRROR=off) - also used by the async layer."""
+    if os.getenv('STORAGE_MIRROR', 'on').lower() == 'off':
+        return None
+    with _clients_lock:
+        if path not in _mirrors:
+            _mirrors[path] = LocalMirror(path)
+        return _mirrors[path]
+
+
+def mirrored(remote, path: str = MIRROR_DB, sync: bool = True):
+    """Wrap an existing client with the local mirror (one mirror per file per process)."""
+    if remote is None or os.getenv('STORAGE_MIRROR', 'on').lower() == 'off':
+        return remote
+    with _clients_lock:
+        if path not in _clients:
+            client = MirroredClient(remote, shared_mirror(path))
+            if sync:
+                client.start_sync()
+            _clients[path] = client
+        return _clients[path]
+
+
+_fake = None
+
+
+def storage_client(url: str, key: str | None):
+    """What agents use as self.supabase: mirrored supabase, the offline fake, or None without a key."""
+    global _fake
+    if os.getenv('STORAGE_BACKEND', 'supabase').lower() == 'fake':
+        with _clients_lock:
+            if _fake is None:
+                _fake = FakeSupabase()
+        return _fake
+    if not key:
+        return None
+    # the supabase sdk is only imported once the first query actually needs it
+    return mirrored(lazy(lambda: supabase_client(url, key)))
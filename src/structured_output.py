@@ -0,0 +1,292 @@
+import json
+import re
+
+# Structured output for the gemini step. Instead of regex-stripping ```json fences and hoping
+# json.loads works, every agent asks gemini for application/json constrained to its category's
+# schema, then parses with parse_recommendations() which salvages every valid element out of a
+# truncated or slightly broken array. One stray token no longer turns a full exa+llm run into [].
+
+# field name -> (type, required). 'url' fields must look like http(s) links.
+CATEGORY_FIELDS = {
+    'dining': {
+        'name': ('string', True),
+        'description': ('string', True),
+        'url': ('url', True),
+    },
+    'attractions': {
+        'name': ('string', True),
+        'description': ('string', True),
+        'url': ('url', True),
+        'category': ('string', False),
+        'best_time': ('string', False),
+    },
+    'nightlife': {
+        'name': ('string', True),
+        'description': ('string', True),
+        'url': ('url', True),
+        'venue_type': ('string', False),
+        'best_time': ('string', False),
+        'dress_code': ('string', False),
+    },
+    'surprise': {
+        'name': ('string', True),
+        'description': ('string', True),
+        'url': ('url', True),
+        'surprise_factor': ('integer', False),
+    },
+    # neutral venue records extracted by the venue catalog refresh job
+    'catalog': {
+        'name': ('string', True),
+        'url': ('url', True),
+        'summary': ('string', True),
+        'venue_type': ('string', False),
+        'best_time': ('string', False),
+        'dress_code': ('string', False),
+    },
+}
+
+_GEMINI_TYPES = {'string': 'STRING', 'url': 'STRING', 'integer': 'INTEGER'}
+
+
+def response_schema(category: str) -> dict:
+    """Gemini response_schema (OpenAPI subset) for a JSON array of this category's items."""
+    fields = CATEGORY_FIELDS[category]
+    return {
+        'type': 'ARRAY',
+        'items': {
+            'type': 'OBJECT',
+            'properties': {name: {'type': _GEMINI_TYPES[kind]} for name, (kind, _) in fields.items()},
+            'required': [name for name, (_, required) in fields.items() if required],
+        },
+    }
+
+
+def generation_config(category: str) -> dict:
+    """generation_config for generate_content that puts gemini in structured-output mode."""
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': response_schema(category),
+    }
+
+
+def combined_generation_config(categories) -> dict:
+    """generation_config for one call that answers several categories as {category: [items]}."""
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': {
+            'type': 'OBJECT',
+            'properties': {category: response_schema(category) for category in categories},
+            'required': list(categories),
+        },
+    }
+
+
+def _check_string(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def _check_url(value):
+    value = _check_string(value)
+    if value and value.startswith(('http://', 'https://')):
+        return value
+    return None
+
+
+def _check_surprise_factor(value):
+    # models sometimes send "8" or "8/10" or 8.5 - keep the number, clamp to 1-10
+    if isinstance(value, str):
+        value = value.split('/')[0].strip()
+    try:
+        value = int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return min(10, max(1, value))
+
+
+def _check_integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_CHECKERS = {'string': _check_string, 'url': _check_url, 'integer': _check_integer}
+_FIELD_CHECKERS = {'surprise_factor': _check_surprise_factor}
+
+
+def compile_validator(category: str):
+    """
+    Build a validator for one category up front, so per-item validation is just a loop over
+    prebound (field, checker, required) tuples. Returns fn(item) -> cleaned dict or None.
+    """
+    plan = tuple(
+        (name, _FIELD_CHECKERS.get(name, _CHECKERS[kind]), required)
+        for name, (kind, required) in CATEGORY_FIELDS[category].items()
+    )
+
+    def validate(item):
+        if not isinstance(item, dict):
+            return None
+        cleaned = {}
+        for name, check, required in plan:
+            value = check(item.get(name)) if name in item else None
+            if value is None:
+                if required:
+                    return None
+                continue
+            cleaned[name] = value
+        return cleaned
+
+    return validate
+
+
+VALIDATORS = {category: compile_validator(category) for category in CATEGORY_FIELDS}
+
+_decoder = json.JSONDecoder()
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        if text.rstrip().endswith('```'):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def salvage_array(text: str) -> list:
+    """
+    Pull every complete element out of a JSON array, even if the array is truncated
+    or one element in the middle is garbage. Falls back to a single top-level value.
+    """
+    text = _strip_fences(text)
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            # {"recommendations": [...]} or a single object
+            lists = [v for v in parsed.values() if isinstance(v, list)]
+            return lists[0] if len(lists) == 1 else [parsed]
+    except ValueError:
+        pass
+
+    start = text.find('[')
+    if start == -1:
+        start = text.find('{') - 1
+        if start < -1:
+            return []
+    pos = start + 1
+    items = []
+    while pos < len(text):
+        # skip separators between elements
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(text) or text[pos] == ']':
+            break
+        try:
+            item, pos = _decoder.raw_decode(text, pos)
+            items.append(item)
+        except ValueError:
+            # broken element - resync on the next object start and keep going
+            next_obj = text.find('{', pos + 1)
+            if next_obj == -1:
+                break
+            pos = next_obj
+    return items
+
+
+def parse_recommendations(text: str, category: str, debug: bool = False) -> list:
+    """Parse gemini output into validated recommendation dicts for category, dropping bad items."""
+    validate = VALIDATORS[category]
+    raw_items = salvage_array(text or '')
+    items = []
+    seen = set()
+    for raw in raw_items:
+        item = validate(raw)
+        if item is None:
+            continue
+        key = (item['name'].lower(), item['url'])
+        if key in seen:
+            continue
+        seen.add(key)
+        items.append(item)
+    if debug and len(items) != len(raw_items):
+        print(f"    kept {len(items)} of {len(raw_items)} {category} items from gemini output")
+    return items
+
+
+def parse_combined_recommendations(text: str, categories, debug: bool = False) -> dict:
+    """
+    Parse a combined {category: [items]} reply into validated lists per category.
+    If the object is broken, each category's array is salvaged from between its key and the next one.
+    """
+    text = _strip_fences(text or '')
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+
+    # where each category's key starts, so a truncated array can't run on into the next category's items
+    keys = _top_level_keys(text, categories)
+    keys_at = sorted(start for start, _ in keys.values())
+    results = {}
+    for category in categories:
+        if isinstance(parsed, dict):
+            chunk = json.dumps(parsed.get(category) or [])
+        elif category in keys:
+            key_at, value_at = keys[category]
+            end = next((at for at in keys_at if at > key_at), len(text))
+            chunk = text[value_at:end]
+        else:
+            chunk = ''
+        results[category] = parse_recommendations(chunk, category, debug=debug)
+    return results
+
+
+def _top_level_keys(text: str, names) -> dict:
+    """
+    {name: (where the key starts, where its value starts)} for "name": keys directly inside the
+    outer object. A "nightlife" string value or a key nested in an item doesn't count. Items only
+    have scalar fields, so a "name": [ key deeper down means an earlier item was cut off - it's
+    taken as top level and the depth count starts over from there.
+    """
+    names = set(names)
+    found = {}
+    depth, pos = 0, 0
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            try:
+                value, end = _decoder.raw_decode(text, pos)
+            except ValueError:
+                break  # unterminated string: the reply was cut off here
+            after = end
+            while after < len(text) and text[after] in ' \t\r\n':
+                after += 1
+            if value in names and value not in found and text[after:after + 1] == ':':
+                value_at = after + 1
+                while value_at < len(text) and text[value_at] in ' \t\r\n':
+                    value_at += 1
+                if depth == 1 or text[value_at:value_at + 1] == '[':
+                    found[value] = (pos, value_at)
+                    depth = 1
+            pos = end
+            continue
+        if char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+        pos += 1
+    # a string cut off mid-item flips which quotes open strings for the rest of the text, so the
+    # scan can miss later keys - those are found by their "name": [ shape, which no value has
+    for name in names - found.keys():
+        match = re.search(r'"' + re.escape(name) + r'"\s*:\s*(?=\[)', text)
+        if match:
+            found[name] = (match.start(), match.end())
+    return found
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# the modules are flat siblings in src/, imported the same way the scripts import each other
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# keep every local sqlite file and the storage layer out of the working tree and off the network.
+# this runs before any test module imports the code, which reads these at import time
+_scratch = tempfile.mkdtemp(prefix='kiosk-tests-')
+for name, filename in (('LEDGER_DB', 'ledger.sqlite'), ('GEO_DB', 'geo.sqlite'), ('JOB_QUEUE_DB', 'jobs.sqlite'),
+                       ('PREFERENCE_INDEX_DB', 'preference_index.sqlite'), ('STORAGE_MIRROR_DB', 'mirror.sqlite'),
+                       ('VENUE_CATALOG_DB', 'venue_catalog.sqlite'), ('VECTOR_INDEX_DIR', 'vector_index'),
+                       ('HISTORY_EXPORT_DIR', 'history')):
+    os.environ.setdefault(name, os.path.join(_scratch, filename))
+os.environ.setdefault('STORAGE_BACKEND', 'fake')
@@ -0,0 +1,89 @@
+from functools import partial
+
+import cohorts
+from cohorts import member_filter
+from fingerprint import model_fingerprints, reusable_recommendations
+from model_router import FAST_MODEL, ROUTER
+from preference_index import PreferenceIndex
+from storage import FakeSupabase
+
+SHELLFISH_PESCATARIAN = ({'dietaryRestrictions': {'dietaryChoice': 'Pescatarian', 'allergies': ['Shellfish']}},)
+FISH = ({'dietaryRestrictions': {'allergies': ['Fish']}},)
+
+
+def names(items):
+    return [item['name'] for item in items]
+
+
+def test_allergens_match_whole_words():
+    items = [{'name': 'Crabtree Falls'}, {'name': 'The Crab Shack'}, {'name': 'Oysters on the Half Shell'},
+             {'name': 'Shrimpy Joe Tees'}, {'name': 'Cascades Trail'}]
+    assert names(member_filter(items, SHELLFISH_PESCATARIAN)) == ['Crabtree Falls', 'Shrimpy Joe Tees', 'Cascades Trail']
+
+
+def test_fish_allergy_keeps_spokes():
+    items = [{'name': 'Spokes', 'venue_type': 'bike bar'}, {'name': 'Poke Bowl Co'}, {'name': 'Sushi Kingdom'}]
+    assert names(member_filter(items, FISH)) == ['Spokes']
+
+
+def test_diet_excludes_by_venue_type():
+    items = [{'name': 'Smokehouse 52', 'venue_type': 'bbq'}, {'name': 'Zeppoli\'s', 'venue_type': 'italian'}]
+    assert names(member_filter(items, SHELLFISH_PESCATARIAN)) == ["Zeppoli's"]
+
+
+def test_no_restrictions_keeps_everything():
+    items = [{'name': 'Crabtree Falls'}]
+    assert member_filter(items, ({},)) == items
+
+
+class Agent:
+    category = 'dining'
+    location = 'Blacksburg, VA'
+    member_columns = 'dining_preferences'
+    request_budget = 30
+    exa_key = gemini_key = 'k'
+    catalog = None
+
+    def __init__(self, members):
+        self.supabase = FakeSupabase({'members': members})
+        self.runs = []
+
+    def _prefs_from_row(self, row):
+        return (row['dining_preferences'],)
+
+    def _run_pipeline(self, pref_args, deadline, exa_quota, llm_quota, location):
+        self.runs.append(pref_args)
+        return [{'name': 'Zeppoli\'s', 'description': f"for {pref_args[0]['cuisine']}"}], FAST_MODEL
+
+    def _save_recommendations(self, member_id, recommendations, fingerprint=None, location=None):
+        self.supabase.table('recommendations').insert({
+            'member_id': member_id, 'category': self.category, 'location': location,
+            'description': recommendations, 'fingerprint': fingerprint}).execute()
+
+
+def test_cohort_rows_are_reused_by_the_cohort_but_not_by_the_members_own_check(monkeypatch):
+    monkeypatch.setattr(cohorts, 'attach_distances', lambda location, items: items)
+    monkeypatch.setattr(cohorts, '_member_rows', partial(cohorts._member_rows, page=1))  # page through members
+    italian = {'cuisine': 'italian', 'style': 'casual'}
+    agent = Agent([{'member_id': 'm1', 'dining_preferences': italian},
+                   {'member_id': 'm2', 'dining_preferences': {**italian, 'dietaryRestrictions': {'allergies': []}}}])
+
+    first = cohorts.run_cohorts(agent, threshold=0.5, max_age=3600)
+    assert set(first) == {'m1', 'm2'} and len(agent.runs) == 1
+    assert cohorts.run_cohorts(agent, threshold=0.5, max_age=3600) == first
+    assert len(agent.runs) == 1  # the nightly rerun reuses the cohort's rows
+
+    # m2's own request checks m2's own inputs, which the leader-written row wasn't built from
+    m2_prefs = agent._prefs_from_row(agent.supabase.tables['members'][1])
+    own = model_fingerprints('dining', m2_prefs, agent.location, ROUTER.choices())
+    assert reusable_recommendations(agent.supabase, 'm2', 'dining', agent.location, own.values(), 3600) is None
+
+
+def test_where_on_a_never_built_index_rebuilds_it_first(monkeypatch, tmp_path):
+    monkeypatch.setattr(cohorts, 'attach_distances', lambda location, items: items)
+    index = PreferenceIndex(str(tmp_path / 'preference_index.sqlite'))
+    monkeypatch.setattr(cohorts, 'shared_preference_index', lambda: index)
+    agent = Agent([{'member_id': 'm1', 'dining_preferences': {'cuisine': 'italian'}},
+                   {'member_id': 'm2', 'dining_preferences': {'cuisine': 'thai'}}])
+    assert set(cohorts.run_cohorts(agent, where='dining.cuisine = thai')) == {'m2'}
+    assert index.universe() == {'m1', 'm2'}
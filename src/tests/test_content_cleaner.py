@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from content_cleaner import clean_contents, strip_boilerplate
+
+LISTING = """[Home](https://example.com) [Dining](https://example.com/dining)
+Home
+Book now
+## Ocean Samurai
+Sushi and hibachi with a long sake list, open late on weekends.
+### Zeppoli's
+Zeppoli's
+Handmade pasta and a wine shop attached, with pescatarian plates.
+Accept all cookies"""
+
+
+def test_venue_names_survive_and_chrome_does_not():
+    text = strip_boilerplate(LISTING)
+    assert '## Ocean Samurai' in text and "### Zeppoli's" in text
+    assert "\nZeppoli's\n" in text
+    for chrome in ('Home', 'Book now', 'cookies', '[Dining]'):
+        assert chrome not in text
+
+
+def page(n, text):
+    return SimpleNamespace(id=n, url=f"https://example.com/{n}", title=str(n), text=text)
+
+
+def test_short_facts_repeated_on_other_pages_survive():
+    hours = 'Open daily 11am - 9pm'
+    pages = [page(1, f"# First Venue\n\n{hours}\n\n{hours}"), page(2, f"# Second Venue\n\n{hours}")]
+    cleaned, _ = clean_contents(pages)
+    assert cleaned[0].text.count(hours) == 1  # repeats within a page still go
+    assert hours in cleaned[1].text
+
+
+def test_blurbs_copied_across_sites_are_still_dropped():
+    blurb = ("Zeppoli's has served handmade pasta, seafood risotto and a long Italian wine list "
+             "in downtown Blacksburg since 1987, with a wine shop next door.")
+    cleaned, _ = clean_contents([page(1, f"# Zeppoli's\n\n{blurb}"), page(2, f"Other intro here please\n\n{blurb}")])
+    assert blurb in cleaned[0].text and blurb not in cleaned[1].text
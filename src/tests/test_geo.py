@@ -0,0 +1,47 @@
+from geo import GridIndex, Gazetteer, attach_distances
+
+LOCATION = 'Blacksburg, VA'
+PROPERTY = (37.19928, -80.40117)
+
+
+def near(north_m, east_m=0.0):
+    # a point this many meters north/east of the property
+    return {'lat': PROPERTY[0] + north_m / 111320.0, 'lon': PROPERTY[1] + east_m / 88700.0}
+
+
+def test_grid_returns_points_in_radius_nearest_first():
+    grid = GridIndex(PROPERTY)
+    for name, north in (('far', 3000), ('close', 100), ('mid', 600)):
+        point = near(north)
+        grid.add(point['lat'], point['lon'], name)
+    assert [name for _, name in grid.within(*PROPERTY, 1000)] == ['close', 'mid']
+    assert [name for _, name in grid.nearest(*PROPERTY, k=3)] == ['close', 'mid', 'far']
+
+
+def test_same_name_with_different_sites_are_two_places(tmp_path):
+    gazetteer = Gazetteer(str(tmp_path / 'geo.sqlite'))
+    gazetteer.add_places(LOCATION, [{'name': 'The Cellar', 'url': 'https://thecellar.com', **near(200)},
+                                    {'name': 'The Cellar', 'url': 'https://cellarrestaurant.com', **near(5000)}])
+    assert len(gazetteer.nearby(LOCATION, 10000)) == 2
+    assert gazetteer.lookup(LOCATION, 'The Cellar', 'https://cellarrestaurant.com/menu')['lat'] == near(5000)['lat']
+
+    # re-importing updates in place, and a row without a site picks up the one it now has
+    gazetteer.add_places(LOCATION, [{'name': 'The Cellar', 'url': 'https://thecellar.com', **near(250)},
+                                    {'name': 'Rivermill', **near(400)}])
+    gazetteer.add_places(LOCATION, [{'name': 'Rivermill', 'url': 'https://rivermill.com', **near(450)}])
+    places = sorted((place['name'], place['domain']) for _, place in gazetteer.nearby(LOCATION, 10000))
+    assert places == [('Rivermill', 'rivermill.com'), ('The Cellar', 'cellarrestaurant.com'), ('The Cellar', 'thecellar.com')]
+
+
+def test_attach_distances_puts_nearer_walk_buckets_first(tmp_path):
+    gazetteer = Gazetteer(str(tmp_path / 'geo.sqlite'))
+    gazetteer.add_places(LOCATION, [{'name': 'Far Winery', **near(8000)}, {'name': 'Corner Cafe', **near(150)},
+                                    {'name': 'Main Street Diner', **near(250)}])
+    items = [{'name': 'Far Winery'}, {'name': 'Mystery Spot'}, {'name': 'Main Street Diner'}, {'name': 'Corner Cafe'}]
+    located = attach_distances(LOCATION, items, gazetteer=gazetteer)
+    # both cafes are under 5 minutes, so they keep the model's order; unknown venues go last
+    assert [item['name'] for item in located] == ['Main Street Diner', 'Corner Cafe', 'Far Winery', 'Mystery Spot']
+    assert located[0]['walk_bucket'] == 'under 5 min walk' and located[2]['walk_bucket'] == 'drive'
+    assert 'distance_m' not in located[3]
+    assert [item['name'] for item in attach_distances(LOCATION, items, max_distance_m=1000, gazetteer=gazetteer)] == \
+        ['Main Street Diner', 'Corner Cafe', 'Mystery Spot']
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import history_export
+from history_export import HistoryExporter, volume
+from storage import FakeSupabase
+
+
+def run(i, day='2025-10-12'):
+    return {'id': i, 'member_id': f"M{i}", 'category': 'dining', 'location': 'Blacksburg, VA',
+            'description': [{'name': f"Venue {i}", 'url': f"https://venue{i}.com"}], 'created_at': f"{day}T09:00:00+00:00"}
+
+
+def test_reexport_after_a_lost_watermark_counts_every_run_once(tmp_path):
+    supabase = FakeSupabase({'recommendations': [run(i) for i in range(1, 4)]})
+    exporter = HistoryExporter(supabase, out_dir=str(tmp_path))
+    exporter.export()
+
+    # crash between writing the files and saving the watermark, while more rows arrive
+    os.remove(exporter.state_path)
+    supabase.tables['recommendations'] += [run(4), run(5, day='2025-10-13')]
+    assert exporter.export()['rows'] == 5
+
+    rows = volume('category', out_dir=str(tmp_path))
+    assert [(r['category'], r['run_id_count_distinct'], r['count_all']) for r in rows] == [('dining', 5, 5)]
+
+
+def test_export_resumes_past_the_watermark(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_export, 'PAGE_SIZE', 2)
+    supabase = FakeSupabase({'recommendations': [run(i) for i in range(1, 6)]})
+    exporter = HistoryExporter(supabase, out_dir=str(tmp_path))
+    assert exporter.export(max_pages=1)['last_id'] == 2
+    assert exporter.export()['last_id'] == 5
+    assert sum(r['count_all'] for r in volume('day', out_dir=str(tmp_path))) == 5
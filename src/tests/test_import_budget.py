@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+# importing the agent path must stay cheap and credential-free: the sdks are only imported and the
+# clients only built on first use (clients.py)
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '1500'))
+CHECKED_MODULES = ('dining_agent', 'attractions_agent', 'nightlife_agent', 'surprise_me_agent', 'combined_agent',
+                   'serving', 'jobqueue', 'cohorts', 'json_supabase')
+HEAVY_SDKS = ('google.generativeai', 'exa_py', 'supabase', 'httpx')
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+AGENTS = (('dining_agent', 'DiningAgent'), ('attractions_agent', 'AttractionsAgent'), ('nightlife_agent', 'NightlifeAgent'),
+          ('surprise_me_agent', 'SurpriseMeAgent'), ('combined_agent', 'CombinedAgent'))
+
+
+def import_agent_path(cwd, setup=''):
+    """Import every agent-path module (then run setup) in a clean interpreter with no credentials -> (ms, eager sdks)."""
+    probe = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        f"for name in {CHECKED_MODULES!r}: __import__(name)\n"
+        f"{setup}"
+        "print((time.perf_counter() - t) * 1000)\n"
+        f"print(','.join(m for m in {HEAVY_SDKS!r} if m in sys.modules))\n"
+    )
+    env = {k: v for k, v in os.environ.items()
+           if k not in ('GEMINI_KEY', 'BEN_EXA_KEY', 'SUPABASE_URL', 'SUPABASE_SERVICE_ROLE_KEY')}
+    env['PYTHONPATH'] = SRC
+    result = subprocess.run([sys.executable, '-c', probe], cwd=cwd, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, f"importing agent modules failed without credentials:\n{result.stderr}"
+    # last two lines are the probe's (a module may print on import)
+    elapsed_ms, loaded = result.stdout.split('\n')[-3:-1]
+    return float(elapsed_ms), loaded
+
+
+def test_agent_modules_import_without_credentials_within_budget(tmp_path):
+    elapsed_ms, loaded = import_agent_path(tmp_path)
+    assert not loaded, f"heavy sdks imported eagerly: {loaded}"
+    assert elapsed_ms <= IMPORT_BUDGET_MS, f"agent modules took {elapsed_ms:.0f}ms to import (budget {IMPORT_BUDGET_MS:.0f}ms)"
+
+
+def test_agents_construct_without_credentials_or_sdks(tmp_path):
+    # a worker spawn or serving cold start builds every agent - that mustn't build a client either
+    setup = ''.join(f"getattr(sys.modules[{module!r}], {cls!r})()\n" for module, cls in AGENTS)
+    elapsed_ms, loaded = import_agent_path(tmp_path, setup)
+    assert not loaded, f"constructing the agents imported: {loaded}"
+    assert elapsed_ms <= IMPORT_BUDGET_MS, f"importing and building the agents took {elapsed_ms:.0f}ms (budget {IMPORT_BUDGET_MS:.0f}ms)"
@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+
+import cohorts
+import jobqueue
+from jobqueue import Job, JobQueue, handle
+from rate_limiter import PRIORITIES, BACKGROUND
+
+
+class FakeAgent:
+    category = 'dining'
+
+    def get_recommendations(self, member_id, priority=None, max_age=None, location=None):
+        return [{'name': "Zeppoli's"}]
+
+
+def job(kind, payload):
+    return Job({'id': 1, 'kind': kind, 'payload': json.dumps(payload), 'priority': PRIORITIES[BACKGROUND],
+                'attempts': 1, 'max_attempts': 3, 'lease_owner': 'test'})
+
+
+def test_recommendations_job_runs_without_where(monkeypatch):
+    monkeypatch.setattr(jobqueue, '_agent_for', lambda category: FakeAgent())
+    handle(job('recommendations', {'member_id': 'm1', 'category': 'dining', 'location': 'Blacksburg, VA'}))
+
+
+def test_cohorts_job_passes_where_through(monkeypatch):
+    seen = {}
+    monkeypatch.setattr(jobqueue, '_agent_for', lambda category: FakeAgent())
+    monkeypatch.setattr(cohorts, 'run_cohorts', lambda agent, member_ids, **kwargs: seen.update(kwargs))
+    handle(job('cohorts', {'category': 'dining', 'where': 'arriving <= 7', 'location': 'Blacksburg, VA'}))
+    assert seen['where'] == 'arriving <= 7' and seen['location'] == 'Blacksburg, VA'
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite'))
+
+
+def row(queue, job_id):
+    return dict(queue._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_lease_hides_the_job_until_its_visibility_timeout(queue):
+    job_id = queue.enqueue('recommendations', {'member_id': 'm1'})
+    first = queue.lease('w1', visibility_s=0.05)
+    assert (first.id, first.attempts, first.payload) == (job_id, 1, {'member_id': 'm1'})
+    assert queue.lease('w2') is None
+    time.sleep(0.1)
+    # w1 died without acking: the job goes to the next worker, and w1's late ack doesn't count
+    second = queue.lease('w2')
+    assert (second.id, second.attempts) == (job_id, 2)
+    assert not queue.ack(first)
+    assert queue.ack(second) and queue.stats() == {jobqueue.DONE: 1}
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.enqueue('recommendations', {})
+    job = queue.lease('w1', visibility_s=0.05)
+    assert queue.extend(job, visibility_s=60)
+    time.sleep(0.1)
+    assert queue.lease('w2') is None
+    assert not queue.extend(Job({**row(queue, job.id), 'lease_owner': 'w2'}))  # only the holder can extend
+
+
+def test_failed_jobs_back_off_exponentially(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue.random, 'uniform', lambda low, high: 1.0)
+    job_id = queue.enqueue('recommendations', {}, max_attempts=5)
+    for attempt in (1, 2, 3):
+        job = queue.lease('w1')
+        started = time.time()
+        assert queue.fail(job, 'bad json') == jobqueue.QUEUED
+        waited = row(queue, job_id)['available_at'] - started
+        assert abs(waited - jobqueue.RETRY_BASE_S * 2 ** (attempt - 1)) < 1
+        assert queue.lease('w1') is None  # not before the backoff is up
+        queue._conn().execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_jobs_are_dead_lettered_and_can_be_requeued(queue):
+    retried = queue.enqueue('recommendations', {'member_id': 'm1'}, max_attempts=2)
+    for _ in range(2):
+        job = queue.lease('w1')
+        status = queue.fail(job, 'upstream down')
+        queue._conn().execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (retried,))
+    assert status == jobqueue.DEAD
+    hopeless = queue.enqueue('recommendations', {'member_id': 'm2'})
+    assert queue.fail(queue.lease('w1'), 'unknown category', retryable=False) == jobqueue.DEAD
+    assert queue.lease('w1') is None
+    assert {job['id'] for job in queue.dead_letters()} == {retried, hopeless}
+
+    assert queue.requeue(retried) and not queue.requeue(retried)
+    job = queue.lease('w1')
+    assert (job.id, job.attempts) == (retried, 1)
+
+
+def test_crash_on_the_final_attempt_dead_letters_the_job(queue):
+    job_id = queue.enqueue('recommendations', {}, max_attempts=1)
+    queue.lease('w1', visibility_s=0.01)
+    time.sleep(0.05)
+    assert queue.lease('w2') is None
+    assert row(queue, job_id)['status'] == jobqueue.DEAD
+
+
+def test_enqueue_dedupes_while_the_job_is_waiting_or_running(queue):
+    first = jobqueue.enqueue_recommendations(queue, 'm1', 'dining')
+    assert jobqueue.enqueue_recommendations(queue, 'm1', 'dining') == first
+    assert jobqueue.enqueue_recommendations(queue, 'm1', 'nightlife') != first
+    job = queue.lease('w1')
+    assert jobqueue.enqueue_recommendations(queue, 'm1', 'dining') == first
+    queue.ack(job)
+    assert jobqueue.enqueue_recommendations(queue, 'm1', 'dining') != first  # done, so a new run is queued
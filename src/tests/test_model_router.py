@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from fingerprint import model_fingerprints, preference_fingerprint, reusable_recommendations
+from ledger import shared_ledger
+from model_router import FAST_MODEL, PRO_MODEL, ModelRouter
+from rate_limiter import Quota
+from storage import FakeSupabase
+
+GOOD = '[{"name": "Zeppoli\'s", "description": "italian", "url": "https://zeppolis.com"}]'
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter()
+    router.asked = []
+
+    def model(name):
+        def generate_content(prompt, generation_config=None):
+            router.asked.append(name)
+            return SimpleNamespace(text=router.answers[name], usage_metadata=None)
+        return SimpleNamespace(generate_content=generate_content)
+
+    monkeypatch.setattr(router, 'model', model)
+    router.answers = {FAST_MODEL: GOOD, PRO_MODEL: GOOD}
+    return router
+
+
+def test_generate_reports_and_bills_the_fast_model(router):
+    with shared_ledger().run('m1', 'dining', 'Blacksburg, VA') as run:
+        text, model = router.generate('dining', 'small prompt', {}, quota=Quota(key='k'))
+    assert (text, model) == (GOOD, FAST_MODEL)
+    assert run.models == [FAST_MODEL]
+
+
+def test_escalated_answer_reports_pro(router):
+    router.answers[FAST_MODEL] = 'not json'
+    with shared_ledger().run('m1', 'dining', 'Blacksburg, VA') as run:
+        text, model = router.generate('dining', 'small prompt', {}, quota=Quota(key='k'), validate=lambda t: t == GOOD)
+    assert (text, model) == (GOOD, PRO_MODEL)
+    assert run.models == [FAST_MODEL, PRO_MODEL]
+
+
+def test_cached_answer_keeps_the_model_that_gave_it(router):
+    first = router.cached_generate('Cache Test, VA', 'dining', 'same prompt', {}, quota=Quota(key='k'))
+    second = router.cached_generate('Cache Test, VA', 'dining', 'same prompt', {}, quota=Quota(key='k'))
+    assert first == second == (GOOD, FAST_MODEL)
+    assert router.asked == [FAST_MODEL]
+
+
+def test_row_saved_by_the_fast_model_is_reusable():
+    prefs = ({'cuisine': ['italian']},)
+    supabase = FakeSupabase({'recommendations': [{
+        'member_id': 'm1', 'category': 'dining', 'location': 'Blacksburg, VA', 'description': [{'name': "Zeppoli's"}],
+        'fingerprint': preference_fingerprint('dining', prefs, 'Blacksburg, VA', FAST_MODEL),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }]})
+    fingerprints = model_fingerprints('dining', prefs, 'Blacksburg, VA', ModelRouter().choices())
+    assert reusable_recommendations(supabase, 'm1', 'dining', 'Blacksburg, VA', fingerprints.values(), 3600) == [{'name': "Zeppoli's"}]
+    other = model_fingerprints('dining', prefs, 'Blacksburg, VA', ['gemini-some-other-model'])
+    assert reusable_recommendations(supabase, 'm1', 'dining', 'Blacksburg, VA', other.values(), 3600) is None
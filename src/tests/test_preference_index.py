@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+
+import pytest
+
+from preference_index import All, Any, Arriving, Eq, Has, In, Not, PreferenceIndex, QueryError, Range, parse
+from storage import FakeSupabase, Result
+
+
+class CappedSupabase(FakeSupabase):
+    """Like supabase: no select ever returns more than max_rows rows."""
+
+    max_rows = 5
+
+    def _run(self, query):
+        result = super()._run(query)
+        if query.op == 'select' and isinstance(result.data, list):
+            return Result(result.data[:self.max_rows])
+        return result
+
+
+def members(n):
+    return [{'member_id': f"m{i:02d}", 'dining_preferences': {'cuisinePreferences': ['italian']}} for i in range(n)]
+
+
+def reservations(n, per_member=3):
+    soon = (date.today() + timedelta(days=2)).isoformat()
+    return [{'member_id': f"m{i:02d}", 'confirmation_number': f"c{i:02d}{j}", 'property': 'Blacksburg', 'check_in': soon}
+            for i in range(n) for j in range(per_member)]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PreferenceIndex(str(tmp_path / 'preference_index.sqlite'))
+
+
+def test_rebuild_pages_reservations_past_the_row_cap(index):
+    supabase = CappedSupabase({'members': members(7), 'upcoming_reservations': reservations(7)})
+    assert index.rebuild(supabase, page=4) == 7
+    assert index.select('arriving <= 7') == {f"m{i:02d}" for i in range(7)}
+    assert index._conn().execute("SELECT COUNT(*) FROM reservations").fetchone()[0] == 21
+
+
+def test_rebuild_drops_members_that_are_gone(index):
+    index.rebuild(FakeSupabase({'members': members(3), 'upcoming_reservations': reservations(3)}), page=2)
+    index.rebuild(FakeSupabase({'members': members(3)[1:], 'upcoming_reservations': reservations(3)[3:]}), page=2)
+    assert index.universe() == {'m01', 'm02'}
+    assert index.select('dining.cuisinePreferences = italian') == {'m01', 'm02'}
+    assert 'm00' not in index.select('arriving <= 7')
+
+
+@pytest.fixture
+def guests(index):
+    soon, later = date.today() + timedelta(days=2), date.today() + timedelta(days=20)
+    for member_id, dining, wellness, check_in, place in (
+            ('ana', {'dietaryRestrictions': {'dietaryChoice': 'Pescatarian', 'allergies': ['Shellfish']},
+                     'cuisinePreferences': ['Italian', 'Thai']}, {'spaVisitsPerStay': 2}, soon, 'The Inn at Virginia Tech'),
+            ('ben', {'dietaryRestrictions': {'dietaryChoice': 'Gluten Free'}, 'cuisinePreferences': ['Thai']},
+             {'spaVisitsPerStay': 0}, later, 'The Inn at Virginia Tech'),
+            ('cy', {'cuisinePreferences': ['Mexican']}, {'spaVisitsPerStay': 5}, soon, 'Hotel Roanoke')):
+        index.index_member({'member_id': member_id, 'dining_preferences': dining, 'wellness_preferences': wellness},
+                           [{'confirmation_number': member_id, 'property': place, 'check_in': check_in.isoformat()}])
+    return index
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('dining.cuisinePreferences = thai', {'ana', 'ben'}),
+    ('dining.dietaryRestrictions.dietaryChoice = "Gluten Free"', {'ben'}),
+    ('dining.cuisinePreferences = italian|mexican', {'ana', 'cy'}),
+    ('dining.cuisinePreferences != thai', {'cy'}),
+    ('dining.dietaryRestrictions.allergies ?', {'ana'}),
+    ('NOT dining.dietaryRestrictions.allergies ?', {'ben', 'cy'}),
+    ('dining.cuisinePreferences = thai AND NOT dining.dietaryRestrictions.allergies ?', {'ben'}),
+    ('dining.cuisinePreferences = mexican OR dining.dietaryRestrictions.allergies = shellfish', {'ana', 'cy'}),
+    ('(dining.cuisinePreferences = mexican OR dining.cuisinePreferences = italian) AND arriving <= 7', {'ana', 'cy'}),
+    ('dining.cuisinePreferences = thai AND (arriving <= 7 OR wellness.spaVisitsPerStay < 1)', {'ana', 'ben'}),
+    ('wellness.spaVisitsPerStay >= 2', {'ana', 'cy'}),
+    ('wellness.spaVisitsPerStay > 2', {'cy'}),
+    ('wellness.spaVisitsPerStay <= 2', {'ana', 'ben'}),
+    ('arriving <= 7', {'ana', 'cy'}),
+    ('arriving <= 30@"Virginia Tech"', {'ana', 'ben'}),
+    ('arriving <= 7@Roanoke', {'cy'}),
+])
+def test_query_strings(guests, query, expected):
+    assert guests.select(query) == expected
+
+
+def test_predicate_objects(guests):
+    thai = Eq('dining.cuisinePreferences', 'Thai')
+    assert guests.select(All(thai, Not(Has('dining.dietaryRestrictions.allergies')))) == {'ben'}
+    assert guests.select(All()) == {'ana', 'ben', 'cy'}  # no terms: everyone
+    assert guests.select(Any(In('dining.cuisinePreferences', ['mexican']), Arriving(30, 'Virginia Tech'))) == {'ana', 'ben', 'cy'}
+    assert guests.select(Range('wellness.spaVisitsPerStay', lo=0, hi=2)) == {'ana', 'ben'}
+    assert guests.select(Range('wellness.spaVisitsPerStay', lo=0, hi=2, strict=True)) == set()
+    assert guests.select(Range('wellness.spaVisitsPerStay', lo=1)) == {'ana', 'cy'}
+    assert guests.select(Arriving(7, start=date.today() + timedelta(days=15))) == {'ben'}
+
+
+@pytest.mark.parametrize('query', [
+    'dining.cuisinePreferences =',
+    '(dining.cuisinePreferences = thai',
+    'dining.cuisinePreferences = thai)',
+    'wellness.spaVisitsPerStay < lots',
+    'arriving >= 7',
+    'arriving <= soon',
+    'dining.cuisinePreferences thai',
+])
+def test_bad_queries_raise(query):
+    with pytest.raises(QueryError):
+        parse(query)
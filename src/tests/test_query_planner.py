@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from query_planner import execute_plan, plan_queries
+
+LOCATION = 'Blacksburg, VA'
+
+# what the four agents build for the sample member in user_preferences.json
+SAMPLE_QUERIES = {
+    'dining': "top rated restaurants in Blacksburg, VA (Italian OR Asian OR Mediterranean OR American) with 'Pescatarian menu'",
+    'attractions': "attractions things to do in Blacksburg, VA museums landmarks parks outdoor activities entertainment venues "
+                   "fitness outdoor activities wellness attractions corporate attractions business venues current events today",
+    'nightlife': "nightlife bars clubs in Blacksburg, VA live music venues cocktail bars lounges dance clubs entertainment upscale "
+                 "bars fine dining wine bars sake bars jazz clubs classical music venues late night entertainment early evening venues",
+    'surprise': "unique experiences activities in Blacksburg, VA hidden gems local secrets unusual activities off the beaten path "
+                "exclusive dining experiences unique wellness experiences surprise activities today",
+}
+
+
+def test_sample_member_queries_merge():
+    plan = plan_queries(SAMPLE_QUERIES, LOCATION)
+    assert len(plan) < len(SAMPLE_QUERIES)
+    assert ['dining'] in [planned.categories for planned in plan]
+    merged = next(planned for planned in plan if len(planned.categories) > 1)
+    assert merged.num_results > 10
+    # the merged search still carries each category's own vocabulary
+    assert 'museums' in merged.text and 'bars' in merged.text
+
+
+def test_unrelated_queries_stay_separate():
+    plan = plan_queries({'dining': 'sushi restaurants', 'attractions': 'hiking trails waterfalls'}, LOCATION)
+    assert [planned.categories for planned in plan] == [['dining'], ['attractions']]
+
+
+class FakeExa:
+    def __init__(self, hits, pages):
+        self.hits, self.pages = hits, pages
+
+    def search(self, query, **kwargs):
+        return SimpleNamespace(results=[SimpleNamespace(id=i) for i in self.hits[query]])
+
+    def get_contents(self, ids, **kwargs):
+        return SimpleNamespace(results=[self.pages[i] for i in ids])
+
+
+def test_duplicate_page_keeps_every_categorys_origin():
+    page = lambda id: SimpleNamespace(id=id, url='https://example.com/list', title='list', text='')
+    exa = FakeExa({'a': ['id-1'], 'b': ['id-2']}, {'id-1': page('id-1'), 'id-2': page('id-2')})
+    plan = plan_queries({'dining': 'a', 'surprise': 'b'}, LOCATION)
+    contents, routes, stats = execute_plan(exa, plan)
+    assert [content.id for content in contents] == ['id-1']
+    assert sorted(routes['id-1']) == ['dining', 'surprise']
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import BACKGROUND, INTERACTIVE, Limit, MemoryBuckets, Quota, RateScheduler
+
+
+@pytest.fixture
+def scheduler():
+    return RateScheduler(MemoryBuckets())
+
+
+def in_thread(fn, *args, **kwargs):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['value'] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_zero_rate_bucket_waits_instead_of_overflowing(scheduler, monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'MAX_WAIT_S', 0.05)
+    limit = Limit(0, 1)
+    monkeypatch.setitem(rate_limiter.PROVIDER_LIMITS, 'exa', limit)
+    scheduler.acquire('exa', Quota())  # the only token
+
+    thread, outcome = in_thread(scheduler.acquire, 'exa', Quota())
+    time.sleep(0.2)
+    assert thread.is_alive() and not outcome
+    limit.rate = 100.0  # quota raised while it waits
+    thread.join(2)
+    assert not thread.is_alive() and 'error' not in outcome
+
+
+def test_waiter_on_an_empty_model_bucket_does_not_block_other_models(scheduler, monkeypatch):
+    monkeypatch.setitem(rate_limiter.MODEL_LIMITS, 'pro', Limit(0, 1))
+    monkeypatch.setitem(rate_limiter.MODEL_LIMITS, 'fast', Limit(100, 10))
+    scheduler.acquire('gemini', Quota(model='pro'))
+
+    stuck, outcome = in_thread(scheduler.acquire, 'gemini', Quota(model='pro'), timeout=1.0)
+    time.sleep(0.05)
+    started = time.monotonic()
+    scheduler.acquire('gemini', Quota(model='fast'), timeout=0.5)
+    assert time.monotonic() - started < 0.2
+    stuck.join(2)
+    assert isinstance(outcome.get('error'), rate_limiter.RateLimitTimeout)
+
+
+def test_interactive_goes_before_background(scheduler, monkeypatch):
+    monkeypatch.setitem(rate_limiter.PROVIDER_LIMITS, 'exa', Limit(10, 1))
+    scheduler.acquire('exa', Quota())
+    order = []
+    background, _ = in_thread(lambda: scheduler.acquire('exa', Quota(priority=BACKGROUND), timeout=2) or order.append('background'))
+    time.sleep(0.01)
+    interactive, _ = in_thread(lambda: scheduler.acquire('exa', Quota(priority=INTERACTIVE), timeout=2) or order.append('interactive'))
+    background.join(3)
+    interactive.join(3)
+    assert order == ['interactive', 'background']
+
+
+def test_background_leaves_a_reserve_for_interactive(scheduler, monkeypatch):
+    monkeypatch.setitem(rate_limiter.PROVIDER_LIMITS, 'exa', Limit(0, 5))
+    taken = 0
+    while scheduler.try_acquire('exa', Quota(priority=BACKGROUND)):
+        taken += 1
+    assert taken == 4  # the last token (20% of the burst) is kept back
+    assert scheduler.try_acquire('exa', Quota(priority=INTERACTIVE))
+    assert not scheduler.try_acquire('exa', Quota(priority=INTERACTIVE))
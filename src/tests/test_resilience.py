@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from ledger import shared_ledger
+from rate_limiter import Quota, RateLimitTimeout, SCHEDULER
+from resilience import (CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, LatencyTracker, resilient_call,
+                        BREAKERS, POLICIES)
+
+
+@pytest.fixture
+def half_open(monkeypatch):
+    breaker = CircuitBreaker('exa', reset_timeout=0)
+    breaker.state, breaker.opened_at = 'open', 0.0
+    monkeypatch.setitem(BREAKERS, 'exa', breaker)
+    return breaker
+
+
+def test_expired_deadline_hands_back_the_half_open_trial(half_open):
+    deadline = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        resilient_call('exa.search', lambda q: ['hit'], 'q', deadline=deadline)
+    # the trial never reached exa, so the next call still gets to probe it
+    assert resilient_call('exa.search', lambda q: ['hit'], 'q', deadline=Deadline(5)) == ['hit']
+    assert half_open.state == 'closed'
+
+
+def test_rate_limit_timeout_hands_back_the_half_open_trial(half_open, monkeypatch):
+    def no_tokens(*args, **kwargs):
+        raise RateLimitTimeout('no exa quota')
+
+    monkeypatch.setattr(SCHEDULER, 'acquire', no_tokens)
+    with pytest.raises(RateLimitTimeout):
+        resilient_call('exa.search', lambda q: ['hit'], 'q', quota=Quota())
+    assert half_open.allow()
+
+
+def test_failed_trial_reopens_the_breaker(half_open):
+    def down(q):
+        raise ConnectionError('exa is down')
+
+    with pytest.raises(ConnectionError):
+        resilient_call('exa.search', down, 'q', deadline=Deadline(5))
+    assert half_open.state == 'open'
+    half_open.reset_timeout = 60
+    with pytest.raises(CircuitOpenError):
+        resilient_call('exa.search', down, 'q', deadline=Deadline(5))
+
+
+@pytest.fixture
+def closed_exa(monkeypatch):
+    monkeypatch.setitem(BREAKERS, 'exa', CircuitBreaker('exa'))
+
+
+def test_failed_attempts_are_charged(closed_exa, monkeypatch):
+    monkeypatch.setattr(POLICIES['exa.search'], 'base_backoff', 0.01)
+    calls = []
+
+    def flaky(q):
+        calls.append(q)
+        if len(calls) == 1:
+            raise ConnectionError('reset by peer')
+        return ['hit']
+
+    with shared_ledger().run('m1', 'dining', 'Blacksburg, VA') as run:
+        assert resilient_call('exa.search', flaky, 'q', deadline=Deadline(5)) == ['hit']
+    assert run.exa_searches == 2
+
+
+def test_hedge_that_loses_is_charged_when_it_finishes(closed_exa, monkeypatch):
+    tracker = LatencyTracker()
+    for _ in range(tracker.min_samples):
+        tracker.record(0.01)
+    monkeypatch.setattr(POLICIES['exa.search'], 'latency', tracker)
+    first_finished = threading.Event()
+    calls = []
+
+    def slow_then_fast(q):
+        calls.append(q)
+        if len(calls) == 1:
+            time.sleep(0.6)
+            first_finished.set()
+        return ['hit']
+
+    ledger = shared_ledger()
+    with ledger.run('m1', 'dining', 'Blacksburg, VA') as run:
+        assert resilient_call('exa.search', slow_then_fast, 'q', deadline=Deadline(5)) == ['hit']
+    assert run.exa_searches == 1 and len(calls) == 2
+
+    # the original call finishes after the run was written, and its row is updated
+    assert first_finished.wait(5)
+    deadline = time.monotonic() + 5
+    while run.exa_searches < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with run.lock:  # the row update happens under the same lock as the charge
+        _, row_id = run.written
+    row = ledger._conn().execute("SELECT exa_searches FROM runs WHERE id = ?", (row_id,)).fetchone()
+    assert run.exa_searches == 2 and row['exa_searches'] == 2
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+import time
+
+import singleflight
+from singleflight import SingleFlight, SqliteLocks
+
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    release, calls = threading.Event(), []
+
+    def generate():
+        calls.append(1)
+        release.wait(2)
+        return ['Zeppoli\'s']
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do(('m1', 'dining', 'Blacksburg, VA'), generate)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flights.stats['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert results == [['Zeppoli\'s']] * 4
+    assert len(calls) == 1
+
+
+def test_other_process_reads_the_leaders_saved_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, 'POLL_S', 0.01)
+    path = str(tmp_path / 'inflight.sqlite')
+    # two SingleFlights on one lock file behave like two kiosk server processes
+    leader, other = SingleFlight(SqliteLocks(path)), SingleFlight(SqliteLocks(path))
+    saved, started, release = {}, threading.Event(), threading.Event()
+
+    def generate():
+        started.set()
+        release.wait(2)
+        saved['m1'] = ['Zeppoli\'s']
+        return saved['m1']
+
+    thread = threading.Thread(target=leader.do, args=('m1', generate))
+    thread.start()
+    started.wait(2)
+    threading.Timer(0.05, release.set).start()
+    result = other.do('m1', lambda: ['generated again'], follower=lambda: saved.get('m1'))
+    thread.join(2)
+    assert result == ['Zeppoli\'s']
+    assert other.stats['cross_process'] == 1
+
+
+class BrokenLocks:
+    """Takes the key once, then every lock call fails like a locked or vanished sqlite file."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def acquire(self, key):
+        self.calls += 1
+        if self.calls == 1:
+            return False
+        raise sqlite3.OperationalError('database is locked')
+
+    def held(self, key):
+        raise sqlite3.OperationalError('database is locked')
+
+    def release(self, key):
+        raise sqlite3.OperationalError('database is locked')
+
+
+def test_lock_errors_while_following_fall_back_to_running_here():
+    flights = SingleFlight(BrokenLocks(), wait_s=1)
+    assert flights.do('m1', lambda: ['Zeppoli\'s'], follower=lambda: None) == ['Zeppoli\'s']
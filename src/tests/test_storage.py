@@ -0,0 +1,62 @@
+import pytest
+
+import storage
+from storage import FakeSupabase, LocalMirror, MirroredClient, keyset_pages
+
+SAME_INSTANT = '2025-10-12T09:00:00+00:00'
+
+
+def recommendation(i, created_at=SAME_INSTANT):
+    return {'id': i, 'member_id': f"M{i % 3}", 'category': 'dining', 'location': 'Blacksburg, VA',
+            'description': [], 'created_at': created_at}
+
+
+@pytest.fixture
+def remote():
+    return FakeSupabase({
+        'members': [{'member_id': f"M{i:03d}", 'created_at': SAME_INSTANT} for i in range(7)],
+        'recommendations': [recommendation(i) for i in range(1, 8)],
+    })
+
+
+@pytest.fixture
+def client(remote, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'SYNC_PAGE', 3)
+    return MirroredClient(remote, LocalMirror(str(tmp_path / 'mirror.sqlite')))
+
+
+def test_keyset_pages_drain_rows_sharing_a_timestamp(remote):
+    pages = list(keyset_pages(remote, 'recommendations', 'created_at', 'id', page=3))
+    assert [len(rows) for rows in pages] == [3, 3, 1]
+    assert [row['id'] for rows in pages for row in rows] == list(range(1, 8))
+
+
+def test_sync_pages_everything_and_then_only_new_recommendations(client, remote):
+    assert client.sync() == {'recommendations': 7, 'members': 7}
+    assert len(client.table('members').select('*').execute().data) == 7
+
+    # written elsewhere in the same instant as the watermark row, and later
+    remote.table('recommendations').insert([recommendation(8), recommendation(9, '2025-10-12T10:00:00+00:00')]).execute()
+    remote.table('members').insert({'member_id': 'M100', 'created_at': SAME_INSTANT}).execute()
+    assert client.sync() == {'recommendations': 2, 'members': 8}
+    assert client.sync() == {'recommendations': 0, 'members': 8}
+    assert len(client.table('recommendations').select('id').eq('member_id', 'M0').execute().data) == 3
+
+
+def test_sync_never_pulls_a_whole_table_in_one_request(client, remote):
+    calls = []
+    original = remote._run
+    remote._run = lambda query: calls.append(query.limit_n) or original(query)
+    client.sync()
+    assert calls and all(limit is not None and limit <= 3 for limit in calls)
+
+
+def test_sync_pulls_edits_to_members_already_mirrored(client, remote):
+    client.sync()
+    assert client.table('members').select('*').eq('member_id', 'M001').execute().data[0].get('dining_preferences') is None
+
+    # edited elsewhere (the app, seed_db, another kiosk) - upserts don't touch created_at
+    remote.table('members').upsert({'member_id': 'M001', 'dining_preferences': {'cuisine': ['thai']}}).execute()
+    client.sync()
+    member = client.table('members').select('*').eq('member_id', 'M001').execute().data[0]
+    assert member['dining_preferences'] == {'cuisine': ['thai']}
@@ -0,0 +1,45 @@
+import json
+
+from structured_output import parse_combined_recommendations, parse_recommendations, salvage_array
+
+
+def venue(name):
+    return {'name': name, 'description': f"{name} is nice", 'url': f"https://{name.lower()}.com"}
+
+
+def test_truncated_array_keeps_complete_items():
+    text = json.dumps([venue('A'), venue('B')])[:-20]
+    assert [item['name'] for item in parse_recommendations(text, 'dining')] == ['A']
+
+
+def test_broken_element_is_skipped():
+    text = '[' + json.dumps(venue('A')) + ', {"name": oops}, ' + json.dumps(venue('B')) + ']'
+    assert [item['name'] for item in salvage_array(text)] == ['A', 'B']
+
+
+def test_truncated_category_does_not_take_the_next_categorys_items():
+    # dining's array is cut off mid-item, nightlife's is intact
+    dining = json.dumps([venue('D1'), venue('D2')])[:-30]
+    nightlife = json.dumps([venue('N')])
+    text = '{"dining": ' + dining + ', "nightlife": ' + nightlife + '}'
+    parsed = parse_combined_recommendations(text, ['dining', 'nightlife'])
+    assert [item['name'] for item in parsed['dining']] == ['D1']
+    assert [item['name'] for item in parsed['nightlife']] == ['N']
+
+
+def test_combined_keys_in_any_order():
+    text = '{"nightlife": ' + json.dumps([venue('N')]) + ', "dining": ' + json.dumps([venue('D')]) + ',  "oops'
+    parsed = parse_combined_recommendations(text, ['dining', 'nightlife'])
+    assert [item['name'] for item in parsed['dining']] == ['D']
+    assert [item['name'] for item in parsed['nightlife']] == ['N']
+
+
+def test_category_names_in_values_and_item_fields_are_not_sections():
+    attraction = dict(venue('Lyric Theatre'), category='nightlife')
+    late = dict(venue('Rivermill'), venue_type='nightlife bar', best_time='dining hours')
+    text = ('{"attractions": ' + json.dumps([attraction]) + ', "nightlife": ' + json.dumps([late])
+            + ', "dining": ' + json.dumps([venue('D1'), venue('D2')])[:-30])
+    parsed = parse_combined_recommendations(text, ['attractions', 'nightlife', 'dining'])
+    assert [item['name'] for item in parsed['attractions']] == ['Lyric Theatre']
+    assert [item['name'] for item in parsed['nightlife']] == ['Rivermill']
+    assert [item['name'] for item in parsed['dining']] == ['D1']
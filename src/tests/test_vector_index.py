@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vector_index import VectorIndex
+
+LOCATION = 'Blacksburg, VA'
+DINING_QUERY = ("top rated restaurants in Blacksburg, VA (Italian OR Asian OR Mediterranean OR American) "
+                "with 'Pescatarian menu'")
+
+
+def page(n, text):
+    return SimpleNamespace(id=f"id-{n}", url=f"https://example.com/{n}", title=f"page {n}", text=text)
+
+
+def trail(n):
+    return page(n, f"Trail {n} near Blacksburg, VA. A Blacksburg favourite: the hike from Blacksburg VA climbs to a "
+                   f"waterfall and ridge views over Blacksburg. Parking at the Blacksburg, VA trailhead, best in spring.")
+
+
+def restaurant(n):
+    return page(100 + n, f"Restaurant {n} in Blacksburg, VA has an Italian and Mediterranean menu with pescatarian "
+                         f"dishes, grilled fish, pasta and American classics. Open for dinner in Blacksburg.")
+
+
+@pytest.fixture
+def index(tmp_path):
+    return VectorIndex(str(tmp_path / 'index'))
+
+
+def test_other_categorys_pages_never_cover_a_query(index):
+    index.add_pages(LOCATION, [trail(n) for n in range(8)], categories=['attractions'])
+    assert index.retrieve(DINING_QUERY, LOCATION, category='dining') == []
+    # even without the category filter, town names alone don't make a hiking page relevant
+    assert index.retrieve(DINING_QUERY, LOCATION) == []
+
+
+def test_relevant_pages_cover_their_category(index):
+    index.add_pages(LOCATION, [restaurant(n) for n in range(8)], categories=['dining'])
+    index.add_pages(LOCATION, [trail(n) for n in range(8)], categories=['attractions'])
+    pages = index.retrieve(DINING_QUERY, LOCATION, category='dining')
+    assert len(pages) == 8
+    assert all('Restaurant' in p.text for p in pages)
+
+
+def test_unchanged_page_found_again_is_retagged(index, tmp_path):
+    pages = [restaurant(n) for n in range(8)]
+    index.add_pages(LOCATION, pages, categories={p.id: ['nightlife'] for p in pages})
+    assert index.add_pages(LOCATION, pages, categories=['dining']) == 0
+    assert len(index.retrieve(DINING_QUERY, LOCATION, category='dining')) == 8
+    # and the tag survives a reload from disk
+    assert len(VectorIndex(str(tmp_path / 'index')).retrieve(DINING_QUERY, LOCATION, category='dining')) == 8
+
+
+def test_add_pages_appends_without_rereading(index, tmp_path):
+    other = VectorIndex(str(tmp_path / 'index'))
+    index.add_pages(LOCATION, [restaurant(n) for n in range(4)], categories=['dining'])
+    # another process appended meanwhile; our next add picks up just its lines and keeps rows aligned
+    other.add_pages(LOCATION, [restaurant(n) for n in range(4, 8)], categories=['dining'])
+    index.add_pages(LOCATION, [trail(0)], categories=['attractions'])
+    assert len(index) == len(VectorIndex(str(tmp_path / 'index')))
+    assert len(index.retrieve(DINING_QUERY, LOCATION, category='dining')) == 8
+
+
+def test_search_sees_pages_another_process_added(index, tmp_path):
+    index.add_pages(LOCATION, [trail(n) for n in range(8)], categories=['attractions'])
+    VectorIndex(str(tmp_path / 'index')).add_pages(LOCATION, [restaurant(n) for n in range(8)], categories=['dining'])
+    assert len(index.retrieve(DINING_QUERY, LOCATION, category='dining')) == 8
+
+
+def test_vectors_orphaned_by_a_failed_add_are_dropped(index, tmp_path):
+    index.add_pages(LOCATION, [trail(n) for n in range(8)], categories=['attractions'])
+    # an add that wrote its vectors and died before writing their records
+    with open(index.vectors_path, 'ab') as f:
+        f.write(np.ones((3, index.dim), dtype=np.float32).tobytes())
+    index.add_pages(LOCATION, [restaurant(n) for n in range(8)], categories=['dining'])
+    reloaded = VectorIndex(str(tmp_path / 'index'))
+    assert reloaded._stored_rows() == len(reloaded._meta)
+    pages = reloaded.retrieve(DINING_QUERY, LOCATION, category='dining')
+    assert len(pages) == 8 and all('Restaurant' in p.text for p in pages)
+
+
+def test_records_without_vectors_are_skipped(index, tmp_path):
+    index.add_pages(LOCATION, [restaurant(n) for n in range(8)], categories=['dining'])
+    with open(index.vectors_path, 'r+b') as f:
+        f.truncate(4 * index.dim * 4)  # e.g. a disk-full write
+    reloaded = VectorIndex(str(tmp_path / 'index'))
+    assert len(reloaded) == 4
+    assert all(record['url'] for _, record in reloaded.search('italian pescatarian', location=LOCATION))
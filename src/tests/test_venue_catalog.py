@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limiter import SCHEDULER
+from venue_catalog import MAX_MISSES, VenueCatalog, name_key, own_domain, refresh_stale, same_venue
+
+LOCATION = 'Blacksburg, VA'
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return VenueCatalog(str(tmp_path / 'catalog.sqlite'))
+
+
+def test_venues_cited_from_one_article_stay_separate(catalog):
+    article = 'https://roanoke.com/food/best-restaurants-in-blacksburg/article_123.html'
+    items = [{'name': name, 'description': '...', 'url': article} for name in ("Zeppoli's", 'Ocean Samurai', 'The Cellar')]
+    assert [item['name'] for item in catalog.ingest(LOCATION, 'dining', items)] == ["Zeppoli's", 'Ocean Samurai', 'The Cellar']
+
+
+def test_listing_and_own_site_collapse_to_the_own_site(catalog):
+    items = [
+        {'name': "Zeppoli's Italian Restaurant", 'description': '...', 'url': 'https://www.restaurantji.com/va/blacksburg/zeppolis/'},
+        {'name': "Zeppoli's", 'description': '...', 'url': 'https://zeppolis.com/'},
+    ]
+    deduped = catalog.ingest(LOCATION, 'dining', items)
+    assert len(deduped) == 1
+    assert deduped[0]['url'] == 'https://zeppolis.com/'
+
+
+def test_own_domain():
+    assert own_domain("Zeppoli's", 'https://zeppolis.com/menu') == 'zeppolis.com'
+    assert own_domain('The Cellar', 'https://www.thecellar.com') == 'thecellar.com'
+    assert own_domain("Zeppoli's", 'https://roanoke.com/food/article.html') is None
+    assert own_domain("Zeppoli's", 'https://www.yelp.com/biz/zeppolis') is None
+
+
+@pytest.mark.parametrize('a, b, same', [
+    ("Zeppoli's", "Zeppoli's Italian Restaurant and Wine Shop", True),
+    ('Ocean Samurai', 'Ocean Samurai Sushi Bar', True),
+    ('Blacksburg', 'Blacksburg Brewing', False),
+    ('Blacksburg Brewing', 'Blacksburg Brewing Company', True),
+    ('Spokes', 'Spokes Bar', True),
+])
+def test_same_venue(a, b, same):
+    assert same_venue(name_key(a), name_key(b), LOCATION) is same
+
+
+def test_location_name_never_absorbs_a_venue():
+    assert not same_venue(name_key('Blacksburg'), name_key('Blacksburg Tavern'), LOCATION)
+
+
+class FakeExa:
+    def search(self, query, **kwargs):
+        return SimpleNamespace(results=[SimpleNamespace(id='p1')])
+
+    def get_contents(self, ids, **kwargs):
+        return SimpleNamespace(results=[SimpleNamespace(id='p1', url='https://visitblacksburg.com', text='page text')])
+
+
+class Blocked:
+    @property
+    def text(self):
+        raise ValueError('response was blocked')  # what the sdk does for a safety-blocked answer
+
+
+@pytest.mark.parametrize('response', [Blocked(), SimpleNamespace(text=''), SimpleNamespace(text='not json'),
+                                      SimpleNamespace(text='[]')])
+def test_failed_extraction_leaves_the_segment_stale(catalog, response, monkeypatch):
+    monkeypatch.setattr(SCHEDULER, 'acquire', lambda *args, **kwargs: None)  # background quota isn't under test
+    catalog.ingest(LOCATION, 'dining', [{'name': "Zeppoli's", 'description': '...', 'url': 'https://zeppolis.com/'}])
+    llm = SimpleNamespace(generate_content=lambda prompt, **kwargs: response)
+    for _ in range(MAX_MISSES + 1):
+        refresh_stale(catalog, LOCATION, FakeExa(), llm, categories=['dining'])
+    assert 'dining' in catalog.stale_segments(LOCATION, ['dining'])
+    misses = catalog._conn().execute("SELECT MAX(misses) FROM venues").fetchone()[0]
+    assert not misses
@@ -0,0 +1,299 @@
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # index is optional - agents fall back to live exa search without it
+    np = None
+
+# Local retrieval over website text we've already fetched. A property's pool of venues changes
+# slowly, so instead of starting every recommendation with a live exa search, agents first ask
+# this index for pages relevant to their query in the same location. Only when coverage is thin
+# (too few fresh, relevant pages) do they go back to exa.search, and whatever exa returns gets
+# indexed for next time.
+#
+# Layout on disk (VECTOR_INDEX_DIR, default .vector_index/):
+#   vectors.f32  - float32 rows, one per chunk, read through np.memmap
+#   chunks.jsonl - one json record per row (url, title, location, categories, text, indexed_at), plus
+#                  tombstones for re-indexed pages and category tags for pages another category found
+
+DIM = int(os.getenv('VECTOR_INDEX_DIM', '1024'))
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 40
+MAX_CHUNKS_PER_PAGE = 40
+
+# scores are against the query without its location words - every page in a location mentions
+# the town, so with them in a hiking page scored 0.2+ against a dining query
+MIN_SCORE = float(os.getenv('VECTOR_INDEX_MIN_SCORE', '0.09'))
+MIN_TERM_HITS = int(os.getenv('VECTOR_INDEX_MIN_TERM_HITS', '2'))  # distinct query terms a page has to contain
+MIN_PAGES = int(os.getenv('VECTOR_INDEX_MIN_PAGES', '6'))
+MAX_AGE_S = float(os.getenv('VECTOR_INDEX_MAX_AGE_DAYS', '14')) * 86400
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {'in', 'the', 'and', 'or', 'of', 'a', 'to', 'with', 'for', 'today', 'top', 'rated', 'near', 'best'}
+
+
+def query_terms(query: str, location: str | None = None) -> list:
+    """The words that say what the query is about: no stopwords, no location."""
+    skip = _STOPWORDS | set(_WORD.findall((location or '').lower()))
+    return list(dict.fromkeys(w.strip("'") for w in _WORD.findall(query.lower()) if w.strip("'") not in skip))
+
+
+def embed(texts, dim: int = DIM):
+    """
+    Hashing-vectorizer embedding: unigrams + bigrams hashed into dim signed buckets,
+    sublinear tf, L2 normalized. No model download, a few ms per page on CPU.
+    """
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode('utf8')) for f in features), dtype=np.uint32, count=len(features))
+        cols = (hashes % dim).astype(np.intp)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(out[row], cols, signs)
+        out[row] = np.sign(out[row]) * np.log1p(np.abs(out[row]))
+        norm = np.linalg.norm(out[row])
+        if norm:
+            out[row] /= norm
+    return out
+
+
+def chunk_text(text: str, words_per_chunk: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> list:
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, words_per_chunk - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + words_per_chunk]))
+        if start + words_per_chunk >= len(words) or len(chunks) >= MAX_CHUNKS_PER_PAGE:
+            break
+    return chunks
+
+
+class RetrievedPage:
+    """Looks enough like an exa contents result (id/url/title/text) for the prompt builders."""
+
+    def __init__(self, url, title, text, score):
+        self.id = url
+        self.url = url
+        self.title = title
+        self.text = text
+        self.score = score
+
+
+class VectorIndex:
+    """Append-only memmapped chunk index with exact or LSH-approximate top-k search."""
+
+    def __init__(self, path: str, dim: int = DIM):
+        self.path = path
+        self.dim = dim
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.meta_path = os.path.join(path, 'chunks.jsonl')
+        self._lock = threading.Lock()
+        self._meta = []         # row -> chunk record
+        self._alive = []        # row -> bool (False once the page was re-indexed)
+        self._pages = {}        # (location, url) -> (content hash, [rows], {categories})
+        self._offset = 0        # bytes of chunks.jsonl already applied
+        self._vectors = None
+        self._planes = None
+        self._codes = None
+        os.makedirs(path, exist_ok=True)
+        self._catch_up()
+
+    def _apply(self, record):
+        key = (record['location'], record.get('drop') or record.get('tag') or record['url'])
+        if 'drop' in record:
+            for row in self._pages.pop(key, (None, [], None))[1]:
+                self._alive[row] = False
+        elif 'tag' in record:
+            if key in self._pages:
+                self._pages[key][2].update(record['categories'])
+        else:
+            row = len(self._meta)
+            self._meta.append(record)
+            self._alive.append(True)
+            page = self._pages.setdefault(key, (record['hash'], [], set()))
+            page[1].append(row)
+            page[2].update(record.get('categories') or ())
+
+    def _catch_up(self, meta_file=None):
+        # apply whatever was appended since we last looked (by us or another process)
+        if meta_file is None:
+            try:
+                if os.path.getsize(self.meta_path) == self._offset:
+                    return
+            except OSError:
+                return
+            with open(self.meta_path, encoding='utf8') as f:
+                return self._catch_up(f)
+        meta_file.seek(self._offset)
+        rows = len(self._meta)
+        while True:
+            line = meta_file.readline()
+            if not line.endswith('\n'):
+                break  # nothing more, or a line another process is still writing
+            self._apply(json.loads(line))
+            self._offset = meta_file.tell()
+        if len(self._meta) != rows:
+            # vectors are written before their records, so there should be a row for every record.
+            # if there isn't (a truncated file), those records can't be searched
+            for row in range(self._stored_rows(), len(self._meta)):
+                self._alive[row] = False
+            self._vectors = None
+            self._codes = None
+
+    def _stored_rows(self) -> int:
+        try:
+            return os.path.getsize(self.vectors_path) // (self.dim * 4)
+        except OSError:
+            return 0
+
+    def _matrix(self):
+        if self._vectors is None and self._meta:
+            rows = min(len(self._meta), self._stored_rows())
+            if rows:
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        return self._vectors
+
+    def __len__(self):
+        return sum(self._alive)
+
+    def add_pages(self, location: str, contents, categories=None) -> int:
+        """
+        Chunk, embed and append pages (anything with url/text/title), tagged with the categories
+        they were fetched for: a list for every page, or {page id: [categories]}. Unchanged pages
+        are only re-tagged.
+        """
+        now = time.time()
+        with self._lock, open(self.meta_path, 'a+', encoding='utf8') as meta_file:
+            # appends from several processes must not interleave, so hold an exclusive file lock
+            fcntl.flock(meta_file, fcntl.LOCK_EX)
+            try:
+                self._catch_up(meta_file)
+                records, texts, log = [], [], []
+                for content in contents:
+                    text = getattr(content, 'text', None) or ''
+                    url = getattr(content, 'url', None)
+                    if not url or not text:
+                        continue
+                    tags = categories.get(getattr(content, 'id', None), []) if isinstance(categories, dict) else categories or []
+                    digest = format(zlib.crc32(text.encode('utf8')), '08x')
+                    existing = self._pages.get((location, url))
+                    if existing and existing[0] == digest:
+                        if not set(tags) <= existing[2]:
+                            log.append({'tag': url, 'location': location, 'categories': sorted(set(tags))})
+                        continue
+                    if existing:
+                        log.append({'drop': url, 'location': location})
+                    for chunk in chunk_text(text):
+                        records.append({'url': url, 'title': getattr(content, 'title', None), 'location': location,
+                                        'categories': sorted(set(tags)), 'hash': digest, 'text': chunk, 'indexed_at': now})
+                        texts.append(chunk)
+                if not records and not log:
+                    return 0
+                if records:
+                    with open(self.vectors_path, 'ab') as vec_file:
+                        # rows past the last record belong to an add that died before writing its
+                        # records - drop them, or every row from here on would sit under the wrong record
+                        vec_file.truncate(len(self._meta) * self.dim * 4)
+                        vec_file.write(embed(texts, self.dim).tobytes())
+                        vec_file.flush()
+                for record in log + records:
+                    meta_file.write(json.dumps(record) + '\n')
+                meta_file.flush()
+                self._catch_up(meta_file)
+            finally:
+                fcntl.flock(meta_file, fcntl.LOCK_UN)
+            return len(records)
+
+    def _lsh_candidates(self, query_vec, matrix, rows, max_distance: int = 2):
+        # random-hyperplane LSH: 16-bit sign codes, keep rows within a small hamming distance
+        if self._planes is None:
+            self._planes = np.random.default_rng(7).standard_normal((self.dim, 16)).astype(np.float32)
+        if self._codes is None:
+            bits = (np.asarray(matrix) @ self._planes) > 0
+            self._codes = np.packbits(bits, axis=1, bitorder='little').view(np.uint16).ravel()
+        query_code = np.packbits((query_vec @ self._planes) > 0, bitorder='little').view(np.uint16)[0]
+        xor = (self._codes[rows] ^ query_code).astype(np.uint16)
+        distance = np.unpackbits(xor.view(np.uint8).reshape(-1, 2), axis=1).sum(axis=1)
+        return rows[distance <= max_distance]
+
+    def search(self, query: str, k: int = 20, location: str | None = None, max_age_s: float | None = None,
+               approximate: bool = False, category: str | None = None):
+        """Top-k (score, chunk record) for query, optionally restricted to one location, category and freshness."""
+        with self._lock:
+            self._catch_up()  # pages another process added since we last looked
+            matrix = self._matrix()
+            if matrix is None:
+                return []
+            cutoff = time.time() - max_age_s if max_age_s else 0
+            rows = np.array([i for i, record in enumerate(self._meta)
+                             if self._alive[i] and i < len(matrix)
+                             and (location is None or record['location'] == location)
+                             and (category is None or category in self._pages[(record['location'], record['url'])][2])
+                             and record['indexed_at'] >= cutoff], dtype=np.intp)
+            if rows.size == 0:
+                return []
+            query_vec = embed([query], self.dim)[0]
+            if approximate and rows.size > 4 * k:
+                candidates = self._lsh_candidates(query_vec, matrix, rows)
+                if candidates.size >= k:
+                    rows = candidates
+            scores = np.asarray(matrix[rows]) @ query_vec
+            top = np.argpartition(-scores, min(k, scores.size) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self._meta[rows[i]]) for i in top]
+
+    def retrieve(self, query: str, location: str, category: str | None = None, min_pages: int = MIN_PAGES,
+                 max_pages: int = 10, chunks_per_page: int = 4, min_score: float = MIN_SCORE,
+                 min_term_hits: int = MIN_TERM_HITS, approximate: bool = False) -> list:
+        """
+        Pages for the prompt, best first, each made of its top matching chunks. Only pages indexed
+        for `category` count, scored without the location's own words, and each has to contain
+        min_term_hits of the query's terms. Returns [] when coverage is thin so the caller knows
+        to fall back to a live exa search.
+        """
+        terms = query_terms(query, location)
+        if not terms:
+            return []
+        hits = self.search(' '.join(terms), k=max_pages * chunks_per_page * 2, location=location,
+                           max_age_s=MAX_AGE_S, approximate=approximate, category=category)
+        pages = {}
+        for score, record in hits:
+            if score < min_score:
+                break
+            page = pages.setdefault(record['url'], {'title': record.get('title'), 'score': score, 'chunks': []})
+            if len(page['chunks']) < chunks_per_page:
+                page['chunks'].append(record['text'])
+        for url, page in list(pages.items()):
+            words = set(_WORD.findall(' '.join(page['chunks']).lower()))
+            if sum(1 for term in terms if term in words) < min(min_term_hits, len(terms)):
+                del pages[url]
+        if len(pages) < min_pages:
+            return []
+        best = sorted(pages.items(), key=lambda item: -item[1]['score'])[:max_pages]
+        return [RetrievedPage(url, page['title'], '\n...\n'.join(page['chunks']), page['score']) for url, page in best]
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_index():
+    """Process-wide index, or None if numpy isn't installed or VECTOR_INDEX=off."""
+    global _shared
+    if np is None or os.getenv('VECTOR_INDEX', 'on').lower() == 'off':
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = VectorIndex(os.getenv('VECTOR_INDEX_DIR', '.vector_index'))
+        return _shared
@@ -0,0 +1,371 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from difflib import SequenceMatcher
+from urllib.parse import urlparse
+
+# Per-location catalog of canonical venues. The same place keeps coming back from exa under
+# different urls (Zeppoli's from zeppolis.com *and* from restaurantji), and every member's run
+# rediscovers the same venues from scratch. The catalog stores one entity per real venue with
+# fuzzy name/url dedup, category tags and the source pages it was seen on. A background refresh
+# (python venue_catalog.py) re-extracts only stale (location, category) segments; agents then
+# rank and personalize from the catalog so gemini only has to write the personalized descriptions.
+
+CATALOG_DB = os.getenv('VENUE_CATALOG_DB', 'venue_catalog.sqlite')
+MAX_AGE_S = float(os.getenv('VENUE_CATALOG_MAX_AGE_DAYS', '7')) * 86400
+MIN_VENUES = int(os.getenv('VENUE_CATALOG_MIN_VENUES', '8'))
+MAX_MISSES = 3  # refreshes in a row a venue can go unseen before we stop recommending it
+
+# listing/review sites - a url on one of these never identifies a venue on its own
+AGGREGATOR_DOMAINS = {
+    'tripadvisor.com', 'yelp.com', 'restaurantji.com', 'menupix.com', 'nextdoor.com', 'facebook.com',
+    'opentable.com', 'google.com', 'instagram.com', 'doordash.com', 'ubereats.com', 'grubhub.com',
+    'foursquare.com', 'zomato.com', 'visitblacksburg.com', 'eventbrite.com', 'wikipedia.org',
+}
+# words that don't help tell venues apart ("Zeppoli's Italian Restaurant and Wine Shop" ~ "Zeppoli's")
+_GENERIC_WORDS = {'the', 'and', 'restaurant', 'restaurants', 'shop', 'inc', 'llc', 'co', 'company', 'of', 'at', 'a'}
+_WORD = re.compile(r"[a-z0-9]+")
+
+# neutral (not personalized) queries the refresh job uses to rebuild each segment
+CATALOG_QUERIES = {
+    'dining': "best restaurants in {location}",
+    'attractions': "top attractions and things to do in {location}",
+    'nightlife': "bars nightlife and live music venues in {location}",
+    'surprise': "hidden gems and unique local experiences in {location}",
+}
+
+# fields from agent output worth keeping as venue facts (descriptions are personalized, so not those)
+FACT_FIELDS = ('venue_type', 'category', 'best_time', 'dress_code')
+
+
+def name_key(name: str) -> str:
+    words = _WORD.findall(name.lower().replace("'", ''))
+    return ' '.join(w for w in words if w not in _GENERIC_WORDS)
+
+
+def domain_of(url: str | None) -> str | None:
+    if not url:
+        return None
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host or None
+
+
+def is_official(url: str | None) -> bool:
+    domain = domain_of(url)
+    return bool(domain) and not any(domain == d or domain.endswith('.' + d) for d in AGGREGATOR_DOMAINS)
+
+
+def own_domain(name: str, url: str | None) -> str | None:
+    """
+    The url's domain if it's the venue's own site (zeppolis.com for Zeppoli's), else None. An
+    article on a news or blog site isn't an aggregator, but it cites many venues, so its domain
+    can't identify any one of them.
+    """
+    domain = domain_of(url) if is_official(url) else None
+    if not domain:
+        return None
+    labels = domain.split('.')
+    label = re.sub(r'[^a-z0-9]', '', labels[-2] if len(labels) > 1 else labels[0])
+    compact = name_key(name).replace(' ', '')
+    spelled = ''.join(_WORD.findall(name.lower().replace("'", '')))  # generic words kept: thecellar.com
+    if len(label) < 4 or not compact:
+        return None
+    if label in spelled or compact in label or SequenceMatcher(None, label, compact).ratio() >= 0.8:
+        return domain
+    return None
+
+
+# words that only describe what kind of place a venue is, so "Zeppoli's Italian Wine" is still Zeppoli's
+_DESCRIPTOR_WORDS = {
+    'italian', 'mexican', 'thai', 'chinese', 'japanese', 'indian', 'greek', 'mediterranean', 'american', 'asian',
+    'french', 'korean', 'vietnamese', 'seafood', 'sushi', 'pizza', 'pizzeria', 'bbq', 'steakhouse', 'wine', 'bar',
+    'grill', 'grille', 'cafe', 'kitchen', 'bistro', 'tavern', 'pub', 'eatery', 'deli', 'diner', 'bakery', 'cantina',
+    'trattoria', 'lounge', 'coffee', 'house',
+}
+
+
+def same_venue(key_a: str, key_b: str, location: str | None = None) -> bool:
+    """
+    Fuzzy match on normalized names: exact, one the leading words of the other, or very similar.
+    A one-word name only absorbs descriptive extras ("Zeppoli's" ~ "Zeppoli's Italian Wine", not
+    "Blacksburg" ~ "Blacksburg Brewing"), and a name made of the location's own words never does.
+    """
+    if not key_a or not key_b:
+        return False
+    if key_a == key_b:
+        return True
+    shorter, longer = sorted((key_a.split(), key_b.split()), key=len)
+    if longer[:len(shorter)] == shorter:
+        place_words = set(_WORD.findall((location or '').lower()))
+        distinctive = [w for w in shorter if w not in place_words]
+        extra = longer[len(shorter):]
+        if not distinctive or len(distinctive[0]) < 4:
+            return False
+        return len(shorter) > 1 or all(w in _DESCRIPTOR_WORDS for w in extra)
+    return SequenceMatcher(None, key_a, key_b).ratio() >= 0.88
+
+
+def names_agree(key_a: str, key_b: str, location: str | None = None) -> bool:
+    place_words = set(_WORD.findall((location or '').lower()))
+    return bool((set(key_a.split()) & set(key_b.split())) - place_words)
+
+
+class CatalogVenue:
+    """Looks enough like an exa contents result (id/url/title/text) for the agents' prompt builders."""
+
+    def __init__(self, row):
+        self.venue_id = row['id']
+        self.id = row['url']
+        self.url = row['url']
+        self.title = row['name']
+        facts = json.loads(row['facts'] or '{}')
+        lines = [f"Venue: {row['name']}"]
+        lines += [f"{k.replace('_', ' ').title()}: {v}" for k, v in facts.items()]
+        lines.append(row['summary'] or '')
+        self.text = '\n'.join(lines)
+
+
+class VenueCatalog:
+    """sqlite-backed canonical venue store, one connection per thread."""
+
+    def __init__(self, path: str = CATALOG_DB):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS venues (
+                id INTEGER PRIMARY KEY,
+                location TEXT NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                url TEXT,
+                domain TEXT,
+                categories TEXT NOT NULL DEFAULT '[]',
+                source_urls TEXT NOT NULL DEFAULT '[]',
+                facts TEXT NOT NULL DEFAULT '{}',
+                summary TEXT,
+                misses INTEGER NOT NULL DEFAULT 0,
+                first_seen REAL NOT NULL,
+                refreshed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS venues_location ON venues (location);
+            CREATE TABLE IF NOT EXISTS catalog_segments (
+                location TEXT NOT NULL,
+                category TEXT NOT NULL,
+                refreshed_at REAL NOT NULL,
+                PRIMARY KEY (location, category)
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _find(self, conn, location: str, name: str, url: str | None):
+        key = name_key(name)
+        # a shared domain only identifies the venue when it's the venue's own site and the names agree
+        domain = own_domain(name, url)
+        for row in conn.execute("SELECT * FROM venues WHERE location = ?", (location,)):
+            if domain and row['domain'] == domain and names_agree(key, row['name_key'], location):
+                return row
+            if same_venue(key, row['name_key'], location):
+                return row
+        return None
+
+    def upsert(self, location: str, category: str, item: dict, summary: str | None = None) -> int:
+        """Merge one venue into the catalog and return its id."""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                return self._upsert(conn, location, category, item, summary)
+
+    def _upsert(self, conn, location, category, item, summary=None):
+        name, url = item['name'], item.get('url')
+        now = time.time()
+        facts = {k: item[k] for k in FACT_FIELDS if item.get(k)}
+        row = self._find(conn, location, name, url)
+        if row is None:
+            cur = conn.execute(
+                "INSERT INTO venues (location, name, name_key, url, domain, categories, source_urls, facts, summary, first_seen, refreshed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (location, name, name_key(name), url, own_domain(name, url),
+                 json.dumps([category]), json.dumps([url] if url else []), json.dumps(facts), summary, now, now),
+            )
+            return cur.lastrowid
+
+        categories = json.loads(row['categories'])
+        if category not in categories:
+            categories.append(category)
+        sources = json.loads(row['source_urls'])
+        if url and url not in sources:
+            sources.append(url)
+        merged_facts = {**json.loads(row['facts']), **facts}
+        # the venue's own site beats a listing page or an article as the canonical url
+        canonical_url = url if own_domain(row['name'], url) and not own_domain(row['name'], row['url']) else row['url'] or url
+        conn.execute(
+            "UPDATE venues SET url = ?, domain = ?, categories = ?, source_urls = ?, facts = ?, "
+            "summary = COALESCE(?, summary), misses = 0, refreshed_at = ? WHERE id = ?",
+            (canonical_url, own_domain(row['name'], canonical_url),
+             json.dumps(categories), json.dumps(sources), json.dumps(merged_facts), summary,
+             now if summary else row['refreshed_at'], row['id']),
+        )
+        return row['id']
+
+    def ingest(self, location: str, category: str, items: list) -> list:
+        """
+        Record venues from an agent's output and return the items deduplicated against the
+        catalog (two entries for the same venue collapse into one, official url preferred).
+        """
+        deduped = {}
+        try:
+            with self._write_lock:
+                conn = self._conn()
+                with conn:
+                    for item in items:
+                        venue_id = self._upsert(conn, location, category, item)
+                        deduped.setdefault(venue_id, item)
+                    # read canonical urls after all merges, so a later official url wins over an earlier listing
+                    for venue_id, item in deduped.items():
+                        canonical = conn.execute("SELECT url FROM venues WHERE id = ?", (venue_id,)).fetchone()['url']
+                        deduped[venue_id] = {**item, 'url': canonical or item.get('url')}
+        except sqlite3.Error as e:
+            # the catalog is an optimization - never lose a finished run over it
+            print(f"couldn't update venue catalog: {e}")
+            return items
+        return list(deduped.values())
+
+    def venue_pages(self, location: str, category: str, query: str, limit: int = 15, min_venues: int = MIN_VENUES) -> list:
+        """
+        Top catalog venues for this category ranked against the (preference-built) search query,
+        or [] if the segment is too thin or stale to answer from.
+        """
+        cutoff = time.time() - MAX_AGE_S
+        rows = [row for row in self._conn().execute(
+                    "SELECT * FROM venues WHERE location = ? AND summary IS NOT NULL AND misses < ? AND refreshed_at >= ?",
+                    (location, MAX_MISSES, cutoff))
+                if category in json.loads(row['categories'])]
+        if len(rows) < min_venues:
+            return []
+        query_terms = set(_WORD.findall(query.lower())) - set(_WORD.findall(location.lower())) - _GENERIC_WORDS
+
+        def score(row):
+            text = f"{row['name']} {row['facts']} {row['summary']}".lower()
+            return sum(1 for term in query_terms if term in text)
+
+        rows.sort(key=score, reverse=True)
+        return [CatalogVenue(row) for row in rows[:limit]]
+
+    def stale_segments(self, location: str, categories=None, max_age_s: float = MAX_AGE_S) -> list:
+        """Categories for this location whose last refresh is older than max_age_s (or never happened)."""
+        categories = categories or list(CATALOG_QUERIES)
+        cutoff = time.time() - max_age_s
+        fresh = {row['category'] for row in self._conn().execute(
+            "SELECT category FROM catalog_segments WHERE location = ? AND refreshed_at >= ?", (location, cutoff))}
+        return [c for c in categories if c not in fresh]
+
+    def record_refresh(self, location: str, category: str, seen_ids: set):
+        """Mark a segment refreshed; venues in it that weren't seen this time pick up a miss."""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for row in conn.execute("SELECT id, categories FROM venues WHERE location = ?", (location,)).fetchall():
+                    if row['id'] not in seen_ids and category in json.loads(row['categories']):
+                        conn.execute("UPDATE venues SET misses = misses + 1 WHERE id = ?", (row['id'],))
+                conn.execute("INSERT OR REPLACE INTO catalog_segments (location, category, refreshed_at) VALUES (?, ?, ?)",
+                             (location, category, time.time()))
+
+
+def refresh_stale(catalog: VenueCatalog, location: str, exa, llm, model_name='gemini-pro-latest', categories=None, debug=False):
+    """
+    Background job: for every stale segment, run one neutral exa search + one gemini extraction
+    and merge the venues it finds. Fresh segments are left alone.
+    """
+    from resilience import Deadline, resilient_call
+    from rate_limiter import Quota, BACKGROUND
+    from structured_output import generation_config, parse_recommendations
+    from ledger import shared_ledger
+
+    quota = Quota(key=os.getenv('BEN_EXA_KEY'), priority=BACKGROUND)
+    llm_quota = Quota(key=os.getenv('GEMINI_KEY'), model=model_name, priority=BACKGROUND)
+    for category in catalog.stale_segments(location, categories):
+        deadline = Deadline(float(os.getenv('CATALOG_REFRESH_BUDGET_S', '180')))
+        query = CATALOG_QUERIES[category].format(location=location)
+        print(f"refreshing {category} catalog for {location}: {query}")
+        try:
+            with shared_ledger().run('catalog', category, location):
+                results = resilient_call('exa.search', exa.search, query, num_results=20, use_autoprompt=True, deadline=deadline, quota=quota).results
+                contents = resilient_call('exa.get_contents', exa.get_contents, [r.id for r in results], deadline=deadline, quota=quota).results
+                response = resilient_call('gemini.generate', llm.generate_content, _extraction_prompt(location, category, contents),
+                                          generation_config=generation_config('catalog'), deadline=deadline, quota=llm_quota)
+            # .text raises for a blocked response
+            venues = parse_recommendations(response.text, 'catalog', debug=debug)
+        except Exception as e:
+            print(f"catalog refresh failed for {category}: {e}")
+            continue
+        if not venues:
+            # empty or unparseable extraction: leave the segment stale rather than count a miss for every venue
+            print(f"catalog refresh for {category} extracted no venues, leaving the segment stale")
+            continue
+
+        seen = set()
+        with catalog._write_lock:
+            conn = catalog._conn()
+            with conn:
+                for venue in venues:
+                    seen.add(catalog._upsert(conn, location, category, venue, summary=venue['summary']))
+        catalog.record_refresh(location, category, seen)
+        print(f"    {len(venues)} venues extracted, {len(seen)} distinct")
+
+
+def _extraction_prompt(location, category, contents):
+    prompt = f"""
+    You are building a factual directory of {category} venues in {location} for a hotel concierge.
+
+    From the website content below, list every distinct real venue. Merge mentions of the same venue
+    across sites. Your response MUST be a JSON array of objects with keys "name", "url", "summary" and,
+    where the text supports it, "venue_type", "best_time", "dress_code".
+    - 'url': the venue's own website if it appears in the content, otherwise the page it was found on.
+    - 'summary': 2-3 neutral, factual sentences (cuisine/offerings, atmosphere, notable menu items or reviews). Do not address any particular guest.
+
+    Here is the content from the websites:
+    """
+    for content in contents:
+        prompt += f"\n\n--- Website Content from {content.url} ---\n"
+        prompt += content.text or ''
+    prompt += "\n\n--- End of Website Content ---"
+    return prompt
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_catalog():
+    """Process-wide catalog, or None with VENUE_CATALOG=off."""
+    global _shared
+    if os.getenv('VENUE_CATALOG', 'on').lower() == 'off':
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = VenueCatalog()
+        return _shared
+
+
+if __name__ == "__main__":
+    # refresh whatever is stale for this property, e.g. from cron: python venue_catalog.py
+    import google.generativeai as genai
+    from exa_py import Exa
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv('GEMINI_KEY'))
+    refresh_stale(shared_catalog(), os.getenv('LOCATION', 'Blacksburg, VA'),
+                  Exa(api_key=os.getenv('BEN_EXA_KEY')), genai.GenerativeModel('gemini-pro-latest'))